@@ -1,8 +1,12 @@
+import os
 import gpiod
 from time import sleep
 import signal
 import sys
-import json
+
+# Send presses over the app's command bus
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'web_app'))
+from command_bus import CommandBusClient
 
 # Pin assignments
 PIN_ASSIGNMENTS = {
@@ -12,8 +16,8 @@ PIN_ASSIGNMENTS = {
     'BTN_LIGHT_PIN': 19
 }
 
-# File to communicate with the Flask app
-COMMAND_FILE = '/tmp/button_commands.json'
+# Connection to the Flask app
+bus = CommandBusClient()
 
 # Initialize the chip and lines
 chip = gpiod.Chip('gpiochip4')
@@ -29,6 +33,7 @@ def cleanup():
     btn_stop_line.release()
     btn_light_line.release()
     chip.close()
+    bus.close()
     print("GPIO lines released and chip closed. Cleanup complete.")
 
 def signal_handler(sig, frame):
@@ -38,8 +43,11 @@ def signal_handler(sig, frame):
 signal.signal(signal.SIGINT, signal_handler)
 
 def write_command(action):
-    with open(COMMAND_FILE, 'w') as f:
-        json.dump({'action': action}, f)
+    try:
+        reply = bus.send(action)
+        print(f"App replied: {reply['message']}")
+    except OSError as e:
+        print(f"Command {action} not delivered: {e}")
 
 try:
     # Request lines
@@ -1,7 +1,13 @@
+import os
+import sys
 from flask import Flask, Response, request
 import cv2
 import logging
 
+# Cameras come from the app's discovery cache instead of opening every index
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'web_app'))
+from camera_discovery import discovery
+
 app = Flask(__name__)
 
 # Configure logging
@@ -22,6 +28,7 @@ def index():
 
     camera_list = get_camera_list()
     camera_info = get_camera_info(camera_device)
+    devices = [info['index'] for info in discovery.cameras() if info['kind'] == 'usb'] or [camera_device]
 
     return f'''
     <!DOCTYPE html>
@@ -36,7 +43,7 @@ def index():
         <form method="post">
             <label for="device">Select Camera Device:</label>
             <select name="device" id="device">
-                {' '.join(f'<option value="{i}"{" selected" if i == camera_device else ""}>{i}</option>' for i in range(10))}
+                {' '.join(f'<option value="{i}"{" selected" if i == camera_device else ""}>{i}</option>' for i in devices)}
             </select>
             <input type="submit" value="Set Camera">
         </form>
@@ -68,39 +75,25 @@ def index():
     '''
 
 def get_camera_list():
-    cameras = []
-    for i in range(10):  # Check first 10 indexes
-        cap = cv2.VideoCapture(i)
-        if cap.isOpened():
-            cameras.append(str(i))
-            cap.release()
-    return "Available cameras: " + ", ".join(cameras)
+    cameras = [f"{info['libcamera_index']}: {info['name']} ({info['kind']}, {info['path']})" for info in discovery.cameras()]
+    return "Available cameras:\n" + "\n".join(cameras)
 
 def get_camera_info(device):
-    cap = cv2.VideoCapture(device)
-    if not cap.isOpened():
-        return f"Failed to open camera device {device}"
-    
-    info = f"Camera device: {device}\n"
-    props = [
-        ('CV_CAP_PROP_FRAME_WIDTH', cv2.CAP_PROP_FRAME_WIDTH),
-        ('CV_CAP_PROP_FRAME_HEIGHT', cv2.CAP_PROP_FRAME_HEIGHT),
-        ('CV_CAP_PROP_FPS', cv2.CAP_PROP_FPS),
-        ('CV_CAP_PROP_FOURCC', cv2.CAP_PROP_FOURCC),
-        ('CV_CAP_PROP_BRIGHTNESS', cv2.CAP_PROP_BRIGHTNESS),
-        ('CV_CAP_PROP_CONTRAST', cv2.CAP_PROP_CONTRAST),
-        ('CV_CAP_PROP_SATURATION', cv2.CAP_PROP_SATURATION),
-        ('CV_CAP_PROP_HUE', cv2.CAP_PROP_HUE),
-        ('CV_CAP_PROP_GAIN', cv2.CAP_PROP_GAIN),
-        ('CV_CAP_PROP_EXPOSURE', cv2.CAP_PROP_EXPOSURE),
-    ]
-    
-    for prop_name, prop_id in props:
-        value = cap.get(prop_id)
-        info += f"{prop_name}: {value}\n"
-    
-    cap.release()
-    return info
+    # Discovery metadata, plus what the live feed negotiated if it has the device open; nothing is opened here
+    info = next((info for info in discovery.cameras() if info['kind'] == 'usb' and info['index'] == device), None)
+    if info is None:
+        return f"Camera device {device} not among discovered cameras"
+    text = f"Camera device: {device}\n" + "".join(f"{key}: {value}\n" for key, value in info.items())
+    if camera is not None and camera.isOpened():
+        props = [
+            ('CV_CAP_PROP_FRAME_WIDTH', cv2.CAP_PROP_FRAME_WIDTH),
+            ('CV_CAP_PROP_FRAME_HEIGHT', cv2.CAP_PROP_FRAME_HEIGHT),
+            ('CV_CAP_PROP_FPS', cv2.CAP_PROP_FPS),
+            ('CV_CAP_PROP_FOURCC', cv2.CAP_PROP_FOURCC),
+        ]
+        for prop_name, prop_id in props:
+            text += f"{prop_name}: {camera.get(prop_id)}\n"
+    return text
 
 def gen_frames():
     global camera, camera_device
@@ -0,0 +1,98 @@
+import os
+import sys
+import time
+import logging
+import tempfile
+import threading
+import subprocess
+
+# Time to first frame and reader CPU of the camera capture, the old named FIFO read byte by byte against
+# the stdout pipe read into a preallocated buffer. A small script stands in for libcamera-vid and writes
+# synthetic JPEG frames at the camera's pace.
+# Run from the repository root: python tests/camera_pipe_bench.py [seconds] [framerate] [frame_kib]
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'web_app'))
+
+from camera import CameraStream
+from profiler import thread_cpu
+
+SECONDS = float(sys.argv[1]) if len(sys.argv) > 1 else 5
+FRAMERATE = float(sys.argv[2]) if len(sys.argv) > 2 else 10
+FRAME_KIB = int(sys.argv[3]) if len(sys.argv) > 3 else 50
+
+WRITER = r'''
+import os, sys, time
+output, framerate, size = sys.argv[1], float(sys.argv[2]), int(sys.argv[3])
+body = bytes(i % 255 for i in range(size))  # No 0xff, so no marker inside a frame
+out = open(sys.stdout.fileno() if output == '-' else output, 'wb', buffering=0)
+next_frame = time.monotonic()
+while True:
+    out.write(b'\xff\xd8' + body + b'\xff\xd9')
+    next_frame += 1 / framerate
+    time.sleep(max(0, next_frame - time.monotonic()))
+'''
+
+
+def writer_command(output):
+    return [sys.executable, '-c', WRITER, output, str(FRAMERATE), str(FRAME_KIB * 1024)]
+
+
+def fifo_capture():
+    # The capture as it was: mkfifo, start the camera, wait a second, then read the FIFO a byte at a time
+    path = os.path.join(tempfile.mkdtemp(prefix='camera_fifo_'), 'stream')
+    os.mkfifo(path)
+    result = {'frames': 0, 'first_frame': None}
+    started = time.monotonic()
+    process = subprocess.Popen(writer_command(path))
+    time.sleep(1)
+
+    def read():
+        with open(path, 'rb') as fifo:
+            while time.monotonic() - started < SECONDS:
+                while fifo.read(2) != b'\xff\xd8':
+                    pass
+                jpeg = b'\xff\xd8'
+                while True:
+                    jpeg += fifo.read(1)
+                    if jpeg[-2:] == b'\xff\xd9':
+                        break
+                if result['first_frame'] is None:
+                    result['first_frame'] = time.monotonic() - started
+                result['frames'] += 1
+        result['cpu'] = time.thread_time()
+
+    reader = threading.Thread(target=read)
+    reader.start()
+    reader.join()
+    process.kill()
+    process.wait()
+    os.remove(path)
+    return result
+
+
+def pipe_capture():
+    camera = CameraStream('bench', framerate=FRAMERATE)
+    camera.command = lambda: writer_command('-')
+    frames = []
+    camera.subscribers.append(lambda jpeg, timestamp: frames.append(len(jpeg)))
+    camera.start()
+    time.sleep(SECONDS)
+    cpu = thread_cpu().get('read_frames_bench', 0)
+    result = {'frames': len(frames), 'first_frame': camera.first_frame_seconds, 'cpu': cpu,
+              'pipe_size': camera.pipe_size, 'sizes_ok': set(frames) == {FRAME_KIB * 1024 + 4}}
+    camera.stop()
+    return result
+
+
+def main():
+    logging.basicConfig(level=logging.WARNING)
+    print(f"{SECONDS:g} s at {FRAMERATE:g} fps, {FRAME_KIB} KiB frames")
+    for name, capture in (('named FIFO, byte reads', fifo_capture), ('stdout pipe, readinto', pipe_capture)):
+        result = capture()
+        frames = max(result['frames'], 1)
+        print(f"  {name:24} first frame {result['first_frame']:.3f} s, {result['frames']} frames, "
+              f"reader CPU {result['cpu']:.3f} s ({result['cpu'] / frames * 1000:.2f} ms per frame)"
+              + (f", pipe {result['pipe_size'] // 1024} KiB, frames intact: {result['sizes_ok']}" if 'pipe_size' in result else ""))
+
+
+if __name__ == '__main__':
+    main()
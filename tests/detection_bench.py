@@ -0,0 +1,72 @@
+import os
+import sys
+import time
+import logging
+
+# Sampling, batching and dropping of the detection stage against a real model: frames arrive faster than
+# the workers keep up with, and the bench reports per-frame inference latency, end-to-end delay, queue
+# depth and drops. Frames are synthetic (half bright, half dark) unless JPEG files are given.
+# Run from the repository root:
+#     python tests/detection_bench.py <model.onnx> [labels.txt|-] [seconds] [fps] [input_size] [frame.jpg ...]
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'web_app'))
+
+import cv2
+import numpy as np
+
+from detection import Detector, DETECTION_INPUT_SIZE
+
+if len(sys.argv) < 2:
+    print("Usage: detection_bench.py <model.onnx> [labels.txt|-] [seconds] [fps] [input_size] [frame.jpg ...]")
+    sys.exit(2)
+MODEL = sys.argv[1]
+LABELS = sys.argv[2] if len(sys.argv) > 2 and sys.argv[2] != '-' else None
+SECONDS = float(sys.argv[3]) if len(sys.argv) > 3 else 10
+FPS = float(sys.argv[4]) if len(sys.argv) > 4 else 10
+INPUT_SIZE = int(sys.argv[5]) if len(sys.argv) > 5 else DETECTION_INPUT_SIZE
+FILES = sys.argv[6:]
+
+
+def frames():
+    if FILES:
+        return [open(path, 'rb').read() for path in FILES]
+    jpegs = []
+    for level in (230, 20):
+        image = np.full((240, 320, 3), level, np.uint8)
+        cv2.rectangle(image, (100, 60), (220, 180), (255 - level,) * 3, -1)
+        jpegs.append(cv2.imencode('.jpg', image)[1].tobytes())
+    return jpegs
+
+
+def main():
+    logging.basicConfig(level=logging.WARNING)
+    jpegs = frames()
+    events = []
+    # Every frame is sampled, so the queue fills up whenever a batch takes longer than a frame interval
+    detector = Detector('bench', MODEL, LABELS, interval=0, input_size=INPUT_SIZE)
+    detector.subscribers.append(events.append)
+    if not detector.start():
+        sys.exit(1)
+    started = time.monotonic()
+    sent = 0
+    while time.monotonic() - started < SECONDS:
+        detector.on_frame(jpegs[sent % len(jpegs)], time.time())
+        sent += 1
+        time.sleep(max(0, started + sent / FPS - time.monotonic()))
+    time.sleep(2)  # Let the last batch finish
+    status = detector.status()
+    detector.stop()
+    labels = {}
+    for event in events:
+        labels[event['label']] = labels.get(event['label'], 0) + 1
+    print(f"{sent} frames at {FPS:g} fps for {SECONDS:g} s, {status['processed']} detected in {status['batches']} batches, "
+          f"dropped {status['dropped_queue_full']} (queue full) + {status['dropped_stale']} (superseded or stale), "
+          f"queue peak {status['queue_peak']}, errors {status['errors']}")
+    print(f"inference {status['inference_ms_mean']} ms per frame (p95 {status['inference_ms_p95']} ms), "
+          f"end-to-end p95 {status['end_to_end_ms_p95']} ms")
+    print(f"{len(events)} events: {labels}")
+    if events:
+        print(f"first: {events[0]}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+import os
+import sys
+import time
+import threading
+
+import cv2
+import numpy as np
+
+# Throughput of the JPEG encoder pool on synthetic XRGB8888 frames for growing worker counts.
+# Run from the repository root: python tests/encoder_bench.py [frames] [width] [height] [quality]
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'web_app'))
+
+from encoder_pool import EncoderPool
+
+FRAMES = int(sys.argv[1]) if len(sys.argv) > 1 else 300
+WIDTH = int(sys.argv[2]) if len(sys.argv) > 2 else 640
+HEIGHT = int(sys.argv[3]) if len(sys.argv) > 3 else 480
+QUALITY = int(sys.argv[4]) if len(sys.argv) > 4 else 95
+
+
+def synthetic_frames(count):
+    # Gradients plus noise, so the encoder has real work and each frame differs
+    rng = np.random.default_rng(0)
+    y, x = np.mgrid[0:HEIGHT, 0:WIDTH]
+    base = np.stack([x % 256, y % 256, (x + y) % 256, np.zeros_like(x)], axis=-1).astype(np.uint8)
+    return [np.clip(base + rng.integers(0, 32, base.shape, dtype=np.uint8), 0, 255).astype(np.uint8)
+            for _ in range(count)]
+
+
+def serial(frames):
+    started = time.perf_counter()
+    for frame in frames:
+        cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, QUALITY])
+    return len(frames) / (time.perf_counter() - started)
+
+
+def pooled(frames, workers):
+    # Submission waits for free slots instead of dropping, to measure throughput rather than a live camera
+    pool = EncoderPool(cv2, workers=workers, quality=QUALITY)
+    pool.start()
+    received = []
+
+    def read():
+        while len(received) < len(frames):
+            jpeg = pool.get(timeout=5)
+            if jpeg is None:
+                return
+            received.append(jpeg)
+
+    reader = threading.Thread(target=read)
+    started = time.perf_counter()
+    reader.start()
+    for frame in frames:
+        while pool.submit(frame) is None:
+            time.sleep(0.0005)
+    reader.join()
+    elapsed = time.perf_counter() - started
+    pool.stop()
+    # Frames differ, so in-order output means the n-th JPEG decodes close to the n-th frame
+    check = [0, len(received) // 2, len(received) - 1]
+    in_order = all(np.abs(cv2.imdecode(np.frombuffer(received[i], np.uint8), cv2.IMREAD_COLOR).astype(int)
+                          - frames[i][:, :, :3].astype(int)).mean() < 20 for i in check)
+    return len(received) / elapsed, in_order
+
+
+if __name__ == '__main__':
+    frames = synthetic_frames(FRAMES)
+    print(f"{FRAMES} frames of {WIDTH}x{HEIGHT} XRGB8888 at quality {QUALITY}, {os.cpu_count()} CPU(s)")
+    baseline = serial(frames)
+    print(f"serial      {baseline:7.1f} fps")
+    for workers in (1, 2, 4, 8):
+        fps, in_order = pooled(frames, workers)
+        print(f"{workers} worker(s) {fps:7.1f} fps  x{fps / baseline:4.2f}  {'in order' if in_order else 'OUT OF ORDER'}")
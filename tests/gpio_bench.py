@@ -0,0 +1,62 @@
+import os
+import sys
+import time
+
+# Compares the step loop with one request per line against bulk requests on the simulated backend.
+# Run from the repository root: python tests/gpio_bench.py [steps]
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'web_app'))
+
+import gpio
+from coop import DEFAULT_PIN_ASSIGNMENTS as PINS
+from motor import INPUT_PINS, MOTOR_PINS, run_steps
+
+STEPS = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+DIRECTION = 1
+
+
+def make_chip():
+    chip = gpio.SimulatedChip('sim-bench')
+    # Door long enough that the limit switch is never reached
+    chip.door = gpio.SimulatedDoor(chip, PINS, STEPS * 2, position=0)
+    for pin in ('SLP_PIN', 'DIR_PIN', 'STEP_PIN'):
+        chip.get_line(PINS[pin]).request(type=gpio.LINE_REQ_DIR_OUT)
+    chip.get_line(PINS['SLP_PIN']).set_value(1)
+    return chip
+
+
+def per_line_loop(chip):
+    # The loop as it was: separate calls for DIR, STEP, the stop button and the lever switch
+    dir_line = chip.get_line(PINS['DIR_PIN'])
+    step_line = chip.get_line(PINS['STEP_PIN'])
+    btn_stop_line = chip.get_line(PINS['BTN_STOP_PIN'])
+    lever_line = chip.get_line(PINS['LEVER_CW_PIN'])
+    dir_line.set_value(DIRECTION)
+    for step in range(STEPS):
+        if btn_stop_line.get_value() == 0 or lever_line.get_value() == 0:
+            break
+        step_line.set_value(1)
+        step_line.set_value(0)
+
+
+def bulk_loop(chip):
+    # The loop the motor runs now: one read of all inputs, one write per STEP edge
+    motor_lines = gpio.LineGroup(chip, PINS, MOTOR_PINS)
+    inputs = gpio.LineGroup(chip, PINS, INPUT_PINS)
+    run_steps(motor_lines, inputs, DIRECTION, STEPS, 0, lambda: False, lambda steps_done: None)
+
+
+def run(name, loop):
+    chip = make_chip()
+    chip.ioctls = 0
+    started = time.perf_counter()
+    loop(chip)
+    elapsed = time.perf_counter() - started
+    moved = chip.door.position
+    print(f"{name:10} {chip.ioctls / STEPS:5.2f} ioctls/step  {STEPS / elapsed:10.0f} steps/s  door moved {moved} steps")
+
+
+if __name__ == '__main__':
+    # The simulated ioctl is a Python call, so only the ioctl count carries over to real hardware
+    print(f"{STEPS} steps without step delay on the simulated backend")
+    run('per-line', per_line_loop)
+    run('bulk', bulk_loop)
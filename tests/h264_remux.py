@@ -0,0 +1,200 @@
+import os
+import sys
+import time
+import tempfile
+
+# Remuxes an H.264 elementary stream to fragmented MP4 and checks the result by decoding it with OpenCV.
+# Without a recording, a synthetic stream is generated: I_PCM keyframes (raw pixels, so the decoded picture
+# can be compared exactly) followed by all-skipped P frames.
+# Run from the repository root: python tests/h264_remux.py [recording.h264] [framerate]
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'web_app'))
+
+from fmp4 import H264Segmenter, AccessUnitSplitter, SegmentBuffer, parse_sps, NAL_SPS
+
+WIDTH, HEIGHT = 320, 240
+GOP = 20
+GOPS = 4
+
+
+class BitWriter:
+    def __init__(self):
+        self.bits = []
+
+    def u(self, count, value):
+        self.bits.extend((value >> (count - 1 - i)) & 1 for i in range(count))
+
+    def ue(self, value):
+        value += 1
+        length = value.bit_length()
+        self.u(length - 1, 0)
+        self.u(length, value)
+
+    def se(self, value):
+        self.ue(2 * value - 1 if value > 0 else -2 * value)
+
+    def align(self):
+        while len(self.bits) % 8:
+            self.bits.append(0)
+
+    def raw(self, data):
+        for byte in data:
+            self.u(8, byte)
+
+    def rbsp(self):
+        # rbsp_trailing_bits, then emulation prevention so no start code appears inside the unit
+        self.u(1, 1)
+        self.align()
+        data = bytes(int(''.join(map(str, self.bits[i:i + 8])), 2) for i in range(0, len(self.bits), 8))
+        out = bytearray()
+        zeros = 0
+        for byte in data:
+            if zeros >= 2 and byte <= 3:
+                out.append(3)
+                zeros = 0
+            out.append(byte)
+            zeros = zeros + 1 if byte == 0 else 0
+        return bytes(out)
+
+
+def nal(header, writer):
+    return b'\x00\x00\x00\x01' + bytes([header]) + writer.rbsp()
+
+
+def synthetic_stream():
+    # Baseline profile, POC type 2, deblocking off, every keyframe a different gradient
+    sps = BitWriter()
+    sps.u(8, 66)
+    sps.u(8, 0xC0)
+    sps.u(8, 30)
+    sps.ue(0)
+    sps.ue(0)  # log2_max_frame_num_minus4, so frame_num has 4 bits
+    sps.ue(2)
+    sps.ue(1)
+    sps.u(1, 0)
+    sps.ue(WIDTH // 16 - 1)
+    sps.ue(HEIGHT // 16 - 1)
+    sps.u(1, 1)
+    sps.u(1, 1)
+    sps.u(1, 0)
+    sps.u(1, 0)
+    pps = BitWriter()
+    pps.ue(0)
+    pps.ue(0)
+    pps.u(1, 0)  # CAVLC
+    pps.u(1, 0)
+    pps.ue(0)
+    pps.ue(0)
+    pps.ue(0)
+    pps.u(1, 0)
+    pps.u(2, 0)
+    pps.se(0)
+    pps.se(0)
+    pps.se(0)
+    pps.u(1, 1)  # deblocking_filter_control_present_flag
+    pps.u(1, 0)
+    pps.u(1, 0)
+    parameter_sets = nal(0x67, sps) + nal(0x68, pps)
+
+    stream = bytearray()
+    lumas = []
+    macroblocks = (WIDTH // 16) * (HEIGHT // 16)
+    for gop in range(GOPS):
+        luma = [16 + (40 * gop + 8 * (mb % (WIDTH // 16))) % 220 for mb in range(macroblocks)]  # Within video range
+        lumas.append(luma)
+        idr = BitWriter()
+        idr.ue(0)
+        idr.ue(7)  # I slice
+        idr.ue(0)
+        idr.u(4, 0)
+        idr.ue(gop)  # idr_pic_id
+        idr.u(1, 0)
+        idr.u(1, 0)
+        idr.se(0)
+        idr.ue(1)  # Deblocking off, so PCM pixels come out unchanged
+        for value in luma:
+            idr.ue(25)  # I_PCM
+            idr.align()
+            idr.raw(bytes([value]) * 256 + bytes([128]) * 128)
+        stream += parameter_sets + nal(0x65, idr)
+        for frame_num in range(1, GOP):
+            p = BitWriter()
+            p.ue(0)
+            p.ue(5)  # P slice
+            p.ue(0)
+            p.u(4, frame_num % 16)
+            p.u(1, 0)
+            p.u(1, 0)
+            p.u(1, 0)
+            p.se(0)
+            p.ue(1)
+            p.ue(macroblocks)  # mb_skip_run over the whole picture
+            stream += nal(0x41, p)
+    return bytes(stream), lumas
+
+
+def remux(stream, framerate, chunk=4096):
+    buffer = SegmentBuffer(kept=1000)
+    segmenter = H264Segmenter(framerate, buffer.reset, buffer.add)
+    started = time.perf_counter()
+    frames = 0
+    for offset in range(0, len(stream), chunk):
+        frames += segmenter.feed(stream[offset:offset + chunk])
+    segmenter.flush()
+    elapsed = time.perf_counter() - started
+    return buffer, elapsed
+
+
+def main():
+    path = sys.argv[1] if len(sys.argv) > 1 else None
+    framerate = float(sys.argv[2]) if len(sys.argv) > 2 else 10
+    if path:
+        with open(path, 'rb') as f:
+            stream = f.read()
+        lumas = None
+    else:
+        stream, lumas = synthetic_stream()
+
+    splitter = AccessUnitSplitter()
+    units = splitter.feed(stream) + splitter.flush()
+    sps = next(nal for nals in units for nal in nals if nal[0] & 0x1F == NAL_SPS)
+    info = parse_sps(sps)
+    buffer, elapsed = remux(stream, framerate)
+    fragments = [segment[1] for segment in buffer.segments]
+    mp4 = buffer.init + b''.join(fragments)
+    print(f"{len(units)} pictures, {info['width']}x{info['height']}, profile {info['profile']}, codec {buffer.codec}")
+    print(f"{len(fragments)} fragments, {len(stream)} bytes in, {len(mp4)} bytes out, "
+          f"remuxed in {elapsed * 1000:.1f} ms ({len(units) / elapsed:,.0f} pictures/s)")
+    print(f"{buffer.info()['bitrate_kbps']} kbit/s at {framerate} fps")
+
+    output = os.path.join(tempfile.mkdtemp(prefix='h264_remux_'), 'remuxed.mp4')
+    with open(output, 'wb') as f:
+        f.write(mp4)
+    try:
+        import cv2
+    except ImportError:
+        print(f"Wrote {output}; OpenCV is not installed, so it was not decoded")
+        return
+    capture = cv2.VideoCapture(output)
+    decoded = []
+    while True:
+        ok, frame = capture.read()
+        if not ok:
+            break
+        decoded.append(frame)
+    print(f"Decoded {len(decoded)} of {len(units)} pictures from {output}")
+    ok = len(decoded) == len(units) and (decoded[0].shape[1], decoded[0].shape[0]) == (info['width'], info['height'])
+    if lumas is not None and ok:
+        # Gray PCM macroblocks decode to the same value in every colour channel, expanded from video range
+        for gop, luma in enumerate(lumas):
+            luma = [round((value - 16) * 255 / 219) for value in luma]
+            for frame in (decoded[gop * GOP], decoded[gop * GOP + GOP - 1]):
+                got = [int(frame[(mb // (WIDTH // 16)) * 16 + 8, (mb % (WIDTH // 16)) * 16 + 8, 1]) for mb in range(len(luma))]
+                if max(abs(a - b) for a, b in zip(got, luma)) > 2:
+                    ok = False
+        print(f"Keyframe and last P frame of each GOP match the encoded pixels: {ok}")
+    print("OK" if ok else "FAILED")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,7 +1,12 @@
+import os
+import sys
 import cv2
 import logging
 from flask import Flask, render_template_string, Response, request, redirect, url_for
-import subprocess
+
+# Cameras come from the app's discovery cache instead of opening every index
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'web_app'))
+from camera_discovery import discovery
 
 app = Flask(__name__)
 
@@ -29,7 +34,7 @@ HTML_TEMPLATE = '''
         <select name="device">
             {% for camera in camera_info %}
                 <option value="{{ camera.id }}" {% if camera.id == current_device %}selected{% endif %}>
-                    {{ camera.name }} ({{ camera.resolution }} @ {{ camera.fps }} FPS)
+                    {{ camera.name }} ({{ camera.path }}{% if camera.usb_id %}, USB {{ camera.usb_id }}{% endif %})
                 </option>
             {% endfor %}
         </select>
@@ -43,47 +48,16 @@ HTML_TEMPLATE = '''
 '''
 
 def get_available_cameras():
-    camera_list = []
-    for i in range(10):  # Check first 10 indexes
-        logging.info(f"Checking camera index {i}")
-        cap = cv2.VideoCapture(i)
-        if cap.isOpened():
-            logging.info(f"Camera {i} opened successfully")
-            ret, frame = cap.read()
-            if ret:
-                logging.info(f"Successfully read frame from camera {i}")
-                camera_list.append(i)
-            else:
-                logging.warning(f"Opened camera {i}, but couldn't read frame")
-        else:
-            logging.info(f"Couldn't open camera {i}")
-        cap.release()
+    # Indexes for cv2.VideoCapture, i.e. the capture nodes of USB cameras
+    camera_list = [info['index'] for info in discovery.cameras() if info['kind'] == 'usb']
     logging.info(f"Available cameras: {camera_list}")
     return camera_list
 
 def get_camera_info(device):
-    cap = cv2.VideoCapture(device)
-    if not cap.isOpened():
-        return None
-    
-    width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-    height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-    fps = cap.get(cv2.CAP_PROP_FPS)
-    
-    try:
-        camera_name = subprocess.check_output(['v4l2-ctl', '--device', f'/dev/video{device}', '--all'], 
-                                              universal_newlines=True)
-        camera_name = [line for line in camera_name.split('\n') if 'Card type' in line][0].split(':')[1].strip()
-    except:
-        camera_name = f"Camera {device}"
-    
-    cap.release()
-    return {
-        'id': device,
-        'name': camera_name,
-        'resolution': f"{width}x{height}",
-        'fps': fps
-    }
+    for info in discovery.cameras():
+        if info.get('index') == device:
+            return {**info, 'id': device}
+    return None
 
 def get_camera():
     global camera, camera_device
@@ -0,0 +1,198 @@
+import os
+import json
+import time
+import logging
+import threading
+import http.client
+from urllib.parse import urlsplit
+from concurrent.futures import ThreadPoolExecutor, wait
+from flask import Flask, Response, render_template, jsonify, request
+
+# Fleet settings
+FLEET_FILE = os.environ.get('CHICKEN_DOOR_FLEET', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fleet.json'))
+POLL_INTERVAL = 2  # Seconds between polling rounds
+POLL_WORKERS = 16  # Nodes polled concurrently
+REQUEST_TIMEOUT = 3
+OFFLINE_AFTER = 3  # Failed rounds before a node is reported offline
+
+app = Flask(__name__)
+boot_id = format(int(time.time()), 'x')  # Versions start over with every start of the aggregator
+
+
+class NodeClient:
+    # Keeps one HTTP/1.1 keep-alive connection per node and revalidates with ETags
+    def __init__(self, name, url):
+        self.name = name
+        self.url = url.rstrip('/')
+        parts = urlsplit(self.url)
+        self.host = parts.hostname
+        self.port = parts.port or 80
+        self.connection = None
+        self.reused = False  # The connection has completed a request before, so the node may have closed it
+        self.lock = threading.Lock()
+        self.etag = None
+        self.state = None
+        self.online = False
+        self.failures = 0
+        self.last_seen = None
+        self.latency_ms = None
+        self.last_error = None
+
+    def request(self, method, path, headers=None):
+        # Polls share one kept-alive connection
+        with self.lock:
+            for attempt in (1, 2):
+                if self.connection is None:
+                    self.connection = http.client.HTTPConnection(self.host, self.port, timeout=REQUEST_TIMEOUT)
+                    self.reused = False
+                try:
+                    self.connection.request(method, path, headers=headers or {})
+                except (http.client.HTTPException, OSError):
+                    self.close()
+                    # Only a send that failed on a connection the node has closed is retried, on a fresh one;
+                    # nothing reached the node then
+                    if attempt == 2 or not self.reused:
+                        raise
+                    continue
+                try:
+                    response = self.connection.getresponse()
+                    result = response.status, response.getheader('ETag'), response.read()
+                except (http.client.HTTPException, OSError):
+                    self.close()
+                    raise
+                self.reused = True
+                return result
+
+    def close(self):
+        self.connection.close()
+        self.connection = None
+
+    def control(self, path):
+        # Commands get a connection of their own, so they never wait for a slow poll, and are never
+        # sent twice: a repeated toggle would undo the first one
+        connection = http.client.HTTPConnection(self.host, self.port, timeout=REQUEST_TIMEOUT)
+        try:
+            connection.request('GET', path)
+            response = connection.getresponse()
+            return response.status, response.read()
+        finally:
+            connection.close()
+
+    def poll(self):
+        started = time.perf_counter()
+        try:
+            headers = {'If-None-Match': self.etag} if self.etag else {}
+            status, etag, body = self.request('GET', '/node_state', headers)
+            if status == 200:
+                self.state = json.loads(body)
+                self.etag = etag
+            elif status != 304:
+                raise RuntimeError(f"HTTP {status}")
+            self.online = True
+            self.failures = 0
+            self.last_seen = time.time()
+            self.latency_ms = round((time.perf_counter() - started) * 1000, 1)
+            self.last_error = None
+        except Exception as e:
+            self.failures += 1
+            self.last_error = str(e)
+            if self.failures >= OFFLINE_AFTER:
+                self.online = False
+
+    def change_key(self):
+        # What the fleet body shows of this node apart from timings
+        return self.etag, self.online, self.last_error
+
+    def summary(self):
+        return {
+            'name': self.name,
+            'url': self.url,
+            'online': self.online,
+            'last_seen': self.last_seen,
+            'latency_ms': self.latency_ms,
+            'last_error': self.last_error,
+            'coops': self.state['coops'] if self.state else {},
+        }
+
+
+class Fleet:
+    def __init__(self, nodes):
+        self.nodes = {node['name']: NodeClient(node['name'], node['url']) for node in nodes}
+        self.executor = ThreadPoolExecutor(max_workers=POLL_WORKERS, thread_name_prefix='fleet-poll')
+        self.version = 0
+        self.snapshot = b'{}'
+        self.round_ms = None
+        self.keys = None
+
+    def poll_round(self):
+        started = time.perf_counter()
+        futures = [self.executor.submit(node.poll) for node in self.nodes.values()]
+        wait(futures, timeout=REQUEST_TIMEOUT * 2 + 1)
+        self.round_ms = round((time.perf_counter() - started) * 1000, 1)
+        keys = [node.change_key() for node in self.nodes.values()]
+        if keys == self.keys:
+            return
+        self.keys = keys
+        self.version += 1
+        # Serialised once per change, so dashboard requests only copy bytes and unchanged polls get a 304.
+        # Latencies and round time are those of the round that saw the change.
+        self.snapshot = json.dumps({
+            'version': self.version,
+            'updated': time.time(),
+            'round_ms': self.round_ms,
+            'nodes': [node.summary() for node in self.nodes.values()],
+        }).encode()
+
+    def run(self):
+        while True:
+            try:
+                self.poll_round()
+            except Exception as e:
+                logging.error(f"Fleet polling round failed: {str(e)}")
+            time.sleep(POLL_INTERVAL)
+
+    def start(self):
+        thread = threading.Thread(target=self.run, daemon=True)
+        thread.start()
+
+
+fleet = None
+
+@app.route('/')
+def dashboard():
+    return render_template('fleet.html', poll_interval=POLL_INTERVAL)
+
+@app.route('/fleet')
+def fleet_state():
+    etag = f'{boot_id}-{fleet.version}'
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        response = Response(fleet.snapshot, mimetype='application/json')
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+@app.route('/fleet/<node_name>/<coop_name>/control/<action>')
+def fleet_control(node_name, coop_name, action):
+    node = fleet.nodes.get(node_name)
+    if node is None:
+        return jsonify({'error': f'Unknown node {node_name}'}), 404
+    try:
+        status, body = node.control(f'/coop/{coop_name}/control/{action}')
+    except Exception as e:
+        # Not retried, the node may have carried it out; the operator decides whether to send it again
+        return jsonify({'error': f'Node {node_name} did not answer, the command may or may not have run: {str(e)}'}), 502
+    return Response(body, status=status, mimetype='application/json')
+
+def load_fleet(path):
+    with open(path) as f:
+        return Fleet(json.load(f)['nodes'])
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    fleet = load_fleet(FLEET_FILE)
+    fleet.start()
+    logging.info(f"Aggregating {len(fleet.nodes)} node(s) from {FLEET_FILE}")
+    from waitress import serve
+    serve(app, host='0.0.0.0', port=int(os.environ.get('CHICKEN_DOOR_FLEET_PORT', 5100)), threads=8)
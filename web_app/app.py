@@ -1,434 +1,166 @@
+import time
+STARTUP_BEGIN = time.perf_counter()
+
 import os
+import json
+import hashlib
 import logging
-from flask import Flask, render_template, request, Response, jsonify, redirect, url_for
-import gpiod
+from flask import Flask, Blueprint, render_template, request, Response, jsonify, redirect, url_for, g, abort, current_app
 import threading
 from time import sleep
 import atexit
-from datetime import datetime, timedelta
-from astral import LocationInfo
-from astral.sun import sun
-import schedule
-import time
-from zoneinfo import ZoneInfo
-import subprocess
-import queue
 
-app = Flask(__name__)
+from coop import Coop
+from camera import CAMERA_SUPERVISOR_INTERVAL
+from command_bus import CommandBus, BUS_SOCKET
+from camera_discovery import discovery
+from assets import assets, compress, encoded_response
+from profiler import profiler, heartbeat, heartbeats, DEFAULT_SAMPLE_RATE, MAX_PROFILE_SECONDS
+from governor import governor
+from stream_slots import stream_slots
+
+bp = Blueprint('door', __name__)
 
 # Define the log directory and file
 log_dir = os.path.expanduser("~/logs")
 log_file = os.path.join(log_dir, "motor_light_control.log")
 
-# Add these global variables
-frame_queue = queue.Queue(maxsize=30)
-frame_thread = None
-
-# Create the log directory if it doesn't exist
-os.makedirs(log_dir, exist_ok=True)
-
-# Configure logging
-logging.basicConfig(
-    filename=log_file,
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-)
-
-# Suppress Flask request logs (like GET /logs)
-logging.getLogger('werkzeug').setLevel(logging.WARNING)
-
-# Global variables
-SPR = 6000  # Steps per revolution
-delay = 0.001  # Delay between steps
-light_on = False
-stop_motor = False
-camera_on = True
-camera_process = None
-holding_torque = True
-door_open_direction = 'CCW'  # Can be 'CW' or 'CCW'
-
-# Camera settings
-camera_width = 320
-camera_height = 240
-camera_framerate = 10
-camera_quality = 30
-
-# Location settings for sunrise/sunset calculations
-latitude = 53.5396  # Example: Berlin latitude
-longitude = 10.004  # Example: Berlin longitude
-location = LocationInfo("Custom", "Region", ZoneInfo("Europe/Berlin"), latitude, longitude)
-
-# Pin assignments
-PIN_ASSIGNMENTS = {
-    'SLP_PIN': 17,
-    'DIR_PIN': 20,
-    'STEP_PIN': 21,
-    'BTN_CW_PIN': 5,
-    'BTN_CCW_PIN': 6,
-    'BTN_STOP_PIN': 13,
-    'LIGHT_PIN': 26,
-    'BTN_LIGHT_PIN': 19,
-    'LEVER_CW_PIN': 12,
-    'LEVER_CCW_PIN': 16
-}
-
-# Initialize the chip and lines
-chip = gpiod.Chip('gpiochip0')  # Changed from 'gpiochip4' to 'gpiochip0'
-dir_line = chip.get_line(PIN_ASSIGNMENTS['DIR_PIN'])
-step_line = chip.get_line(PIN_ASSIGNMENTS['STEP_PIN'])
-slp_line = chip.get_line(PIN_ASSIGNMENTS['SLP_PIN'])
-light_line = chip.get_line(PIN_ASSIGNMENTS['LIGHT_PIN'])
-btn_cw_line = chip.get_line(PIN_ASSIGNMENTS['BTN_CW_PIN'])
-btn_ccw_line = chip.get_line(PIN_ASSIGNMENTS['BTN_CCW_PIN'])
-btn_stop_line = chip.get_line(PIN_ASSIGNMENTS['BTN_STOP_PIN'])
-btn_light_line = chip.get_line(PIN_ASSIGNMENTS['BTN_LIGHT_PIN'])
-lever_cw_line = chip.get_line(PIN_ASSIGNMENTS['LEVER_CW_PIN'])
-lever_ccw_line = chip.get_line(PIN_ASSIGNMENTS['LEVER_CCW_PIN'])
-
-# FIFO for camera stream
-fifo_path = '/tmp/camera_stream'
-
-def cleanup():
-    logging.info("Cleaning up GPIO lines and resources...")
-    slp_line.set_value(0)  # Put the motor driver to sleep
-    dir_line.release()
-    step_line.release()
-    slp_line.release()
-    light_line.release()
-    btn_cw_line.release()
-    btn_ccw_line.release()
-    btn_stop_line.release()
-    btn_light_line.release()
-    lever_cw_line.release()
-    lever_ccw_line.release()
-    logging.info("GPIO lines released and chip closed. Cleanup complete.")
-
-# Request lines
-logging.info("Requesting GPIO lines...")
-dir_line.request(consumer='test', type=gpiod.LINE_REQ_DIR_OUT)
-step_line.request(consumer='test', type=gpiod.LINE_REQ_DIR_OUT)
-slp_line.request(consumer='test', type=gpiod.LINE_REQ_DIR_OUT)
-light_line.request(consumer='test', type=gpiod.LINE_REQ_DIR_OUT)
-btn_cw_line.request(consumer='test', type=gpiod.LINE_REQ_DIR_IN, flags=gpiod.LINE_REQ_FLAG_BIAS_PULL_UP)
-btn_ccw_line.request(consumer='test', type=gpiod.LINE_REQ_DIR_IN, flags=gpiod.LINE_REQ_FLAG_BIAS_PULL_UP)
-btn_stop_line.request(consumer='test', type=gpiod.LINE_REQ_DIR_IN, flags=gpiod.LINE_REQ_FLAG_BIAS_PULL_UP)
-btn_light_line.request(consumer='test', type=gpiod.LINE_REQ_DIR_IN, flags=gpiod.LINE_REQ_FLAG_BIAS_PULL_UP)
-lever_cw_line.request(consumer='test', type=gpiod.LINE_REQ_DIR_IN, flags=gpiod.LINE_REQ_FLAG_BIAS_PULL_UP)
-lever_ccw_line.request(consumer='test', type=gpiod.LINE_REQ_DIR_IN, flags=gpiod.LINE_REQ_FLAG_BIAS_PULL_UP)
-logging.info("GPIO lines successfully requested.")
-
-def read_slp_state():
-    return slp_line.get_value()
-
-def set_holding_torque(enable):
-    global holding_torque
-    current_state = read_slp_state()
-    if enable != (current_state == 1):
-        slp_line.set_value(1 if enable else 0)
-        holding_torque = enable
-        logging.info(f"Holding torque {'enabled' if enable else 'disabled'}. SLP pin changed from {current_state} to {1 if enable else 0}.")
-    else:
-        logging.info(f"Holding torque already {'enabled' if enable else 'disabled'}. SLP pin remains at {current_state}.")
-
-def rotate_motor(direction, steps, delay):
-    global stop_motor
-    stop_motor = False
-    logging.info(f"Starting motor rotation: {'Clockwise' if direction == 1 else 'Counterclockwise'} for {steps} steps with {delay}s delay.")
-    logging.info(f"Before rotation: Holding torque is {'enabled' if holding_torque else 'disabled'}, SLP pin state is {read_slp_state()}")
-    
-    # Ensure motor driver is awake
-    set_holding_torque(True)
-    
-    dir_line.set_value(direction)
-    for step in range(steps):
-        if stop_motor or btn_stop_line.get_value() == 0 or \
-           (direction == 1 and lever_cw_line.get_value() == 0) or \
-           (direction == 0 and lever_ccw_line.get_value() == 0):
-            logging.info("Motor rotation stopped.")
-            break
-        step_line.set_value(1)
-        sleep(delay)
-        step_line.set_value(0)
-        sleep(delay)
-    
-    logging.info("Rotation completed or stopped. Maintaining holding torque.")
-    set_holding_torque(True)
-    logging.info(f"After rotation: Holding torque is {'enabled' if holding_torque else 'disabled'}, SLP pin state is {read_slp_state()}")
-
-def set_light(state):
-    global light_on
-    if state != light_on:
-        light_on = state
-        light_line.set_value(1 if light_on else 0)
-        logging.info(f"Light turned {'on' if light_on else 'off'}")
-    else:
-        logging.info(f"Light is already {'on' if light_on else 'off'}")
-
-def toggle_light():
-    set_light(not light_on)
-
-def handle_button_presses():
-    global stop_motor
-    while True:
-        if btn_cw_line.get_value() == 0 and lever_cw_line.get_value() == 1:
-            logging.info("Clockwise rotation button pressed.")
-            rotate_motor(1, SPR, delay)
-            sleep(0.5)  # Debounce delay
-        if btn_ccw_line.get_value() == 0 and lever_ccw_line.get_value() == 1:
-            logging.info("Counterclockwise rotation button pressed.")
-            rotate_motor(0, SPR, delay)
-            sleep(0.5)  # Debounce delay
-        if btn_stop_line.get_value() == 0:
-            logging.info("Stop button pressed.")
-            stop_motor = True
-            set_holding_torque(True)
-            sleep(0.5)  # Debounce delay
-        if btn_light_line.get_value() == 0:
-            logging.info("Light toggle button pressed.")
-            toggle_light()
-            sleep(0.5)  # Debounce delay
-        sleep(0.1)  # Small delay to prevent excessive CPU usage
-
-def get_sun_times():
-    s = sun(location.observer, date=datetime.now(), tzinfo=location.timezone)
-    return s['sunrise'], s['sunset']
-
-def open_door():
-    logging.info("Automatic door opening triggered")
-    if door_open_direction == 'CW':
-        rotate_motor(1, SPR, delay)
+# Coops are read from this file; without it a single coop with the defaults from coop.py is used
+CONFIG_FILE = os.environ.get('CHICKEN_DOOR_CONFIG', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'coops.json'))
+INPUT_POLL_INTERVAL = 0.1  # Seconds between button polls across all coops
+SCHEDULER_INTERVAL = 60  # Check every minute
+
+# Distinguishes ETags across restarts of the app, when the sequence starts over
+boot_id = format(int(time.time()), 'x')
+
+# Time-lapse playback settings
+TIMELAPSE_DEFAULT_SPEED = 600  # Archive seconds per playback second
+TIMELAPSE_MAX_FPS = 25
+
+# Startup milestones in milliseconds since the module started loading
+startup_timings = {}
+
+# Rendered dashboard shells by (blueprint, coop name), with their compressed variants and ETag
+index_pages = {}
+
+# Coops by name, in config file order; the first one is served at the root URLs
+coops = {}
+
+def configure_logging():
+    # Create the log directory if it doesn't exist
+    os.makedirs(log_dir, exist_ok=True)
+
+    # Configure logging
+    logging.basicConfig(
+        filename=log_file,
+        level=logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(message)s',
+    )
+
+    # Suppress Flask request logs (like GET /logs)
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+
+def mark_startup(milestone):
+    startup_timings[milestone] = round((time.perf_counter() - STARTUP_BEGIN) * 1000, 1)
+    logging.info(f"Startup: {milestone} after {startup_timings[milestone]} ms")
+    for coop in coops.values():
+        coop.startup_ms = dict(startup_timings)
+        coop.mark_changed()
+
+def load_coops():
+    if os.path.exists(CONFIG_FILE):
+        with open(CONFIG_FILE) as f:
+            configs = json.load(f)['coops']
+        logging.info(f"Loaded {len(configs)} coop(s) from {CONFIG_FILE}")
     else:
-        rotate_motor(0, SPR, delay)
-
-def close_door():
-    logging.info("Automatic door closing triggered")
-    if door_open_direction == 'CW':
-        rotate_motor(0, SPR, delay)
+        configs = [{}]
+    coops.clear()
+    for config in configs:
+        coop = Coop(config)
+        if coop.name in coops:
+            raise ValueError(f"Duplicate coop name: {coop.name}")
+        coops[coop.name] = coop
+
+def default_coop():
+    return next(iter(coops.values()))
+
+@bp.url_value_preprocessor
+def select_coop(endpoint, values):
+    name = values.pop('coop_name', None) if values else None
+    if name is None:
+        g.coop = default_coop()
+    elif name in coops:
+        g.coop = coops[name]
     else:
-        rotate_motor(1, SPR, delay)
-
-def get_adjusted_sun_times():
-    sunrise, sunset = get_sun_times()
-    adjusted_sunrise = sunrise - timedelta(minutes=20)
-    adjusted_sunset = sunset + timedelta(minutes=30)
-    return adjusted_sunrise, adjusted_sunset
-
-def schedule_door_events():
-    # Clear all existing schedules
-    schedule.clear()
-
-    sunrise, sunset = get_adjusted_sun_times()
-    
-    schedule.every().day.at(sunrise.strftime("%H:%M")).do(open_door)
-    schedule.every().day.at((sunset - timedelta(minutes=15)).strftime("%H:%M")).do(lambda: set_light(True))
-    schedule.every().day.at(sunset.strftime("%H:%M")).do(close_door)
-    schedule.every().day.at((sunset + timedelta(minutes=15)).strftime("%H:%M")).do(lambda: set_light(False))
-
-    # Schedule this function to run again at midnight
-    schedule.every().day.at("00:01").do(schedule_door_events)
-
-    logging.info(f"Scheduled events: Open at {sunrise.strftime('%H:%M')}, Close at {sunset.strftime('%H:%M')}")
-
-def get_next_scheduled_times():
-    jobs = schedule.get_jobs()
-    times = {
-        'next_open': None,
-        'next_close': None,
-        'next_light_on': None,
-        'next_light_off': None
-    }
-    
-    for job in jobs:
-        if job.job_func.__name__ == 'open_door':
-            times['next_open'] = job.next_run.strftime("%H:%M")
-        elif job.job_func.__name__ == 'close_door':
-            times['next_close'] = job.next_run.strftime("%H:%M")
-        elif job.job_func.__name__ == '<lambda>' and 'set_light(True)' in str(job.job_func):
-            times['next_light_on'] = job.next_run.strftime("%H:%M")
-        elif job.job_func.__name__ == '<lambda>' and 'set_light(False)' in str(job.job_func):
-            times['next_light_off'] = job.next_run.strftime("%H:%M")
-    
-    return times
+        abort(404)
 
-def run_scheduler():
-    while True:
-        schedule.run_pending()
-        time.sleep(60)  # Check every minute
-
-def start_camera_stream():
-    global camera_process, frame_thread, camera_on
-    if not os.path.exists(fifo_path):
-        os.mkfifo(fifo_path)
-    
-    try:
-        cmd = [
-            'libcamera-vid',
-            '-t', '0',
-            '-o', fifo_path,
-            '--inline',
-            '--width', str(camera_width),
-            '--height', str(camera_height),
-            '--framerate', str(camera_framerate),
-            '--codec', 'mjpeg',
-            '--quality', str(camera_quality)
-        ]
-        camera_process = subprocess.Popen(cmd, stderr=subprocess.PIPE)
-        
-        # Wait a short time to check if the process fails immediately
-        time.sleep(1)
-        if camera_process.poll() is not None:
-            error_output = camera_process.stderr.read().decode()
-            if "no cameras available" in error_output:
-                logging.error("No camera hardware detected")
-                camera_on = False
-                return False
-        
-        frame_thread = threading.Thread(target=read_frames)
-        frame_thread.daemon = True
-        frame_thread.start()
-        
-        logging.info("Camera stream started successfully.")
-        return True
-        
-    except Exception as e:
-        logging.error(f"Failed to start camera stream: {str(e)}")
-        camera_on = False
-        return False
-
-def stop_camera_stream():
-    global camera_process, frame_thread, camera_on
-    camera_on = False
-    if frame_thread:
-        frame_thread.join()
-    if camera_process:
-        camera_process.terminate()
-        camera_process.wait()
-        camera_process = None
-    logging.info("Camera stream stopped.")
-
-def read_frames():
-    global camera_on
-    with open(fifo_path, 'rb') as fifo:
-        while camera_on:
-            try:
-                # Read JPEG start marker
-                while fifo.read(2) != b'\xff\xd8':
-                    if not camera_on:
-                        return
-                    pass
-                
-                # Read until JPEG end marker
-                jpeg = b'\xff\xd8'
-                while True:
-                    byte = fifo.read(1)
-                    if not byte:
-                        break
-                    jpeg += byte
-                    if jpeg[-2:] == b'\xff\xd9':
-                        break
-                    if not camera_on:
-                        return
-                
-                # Put frame in queue, remove oldest if full
-                if frame_queue.full():
-                    try:
-                        frame_queue.get_nowait()
-                    except queue.Empty:
-                        pass
-                frame_queue.put(jpeg)
-            except Exception as e:
-                logging.error(f"Error reading frame: {str(e)}")
-                if not camera_on:
-                    return
-                sleep(0.1)
+@bp.url_defaults
+def add_coop_name(endpoint, values):
+    if 'coop_name' not in values and 'coop' in g and current_app.url_map.is_endpoint_expecting(endpoint, 'coop_name'):
+        values['coop_name'] = g.coop.name
 
-def gen_frames():
-    while True:
-        if not camera_on:
-            sleep(0.1)
-            continue
-        try:
-            frame = frame_queue.get(timeout=1)
-            yield (b'--frame\r\n'
-                   b'Content-Type: image/jpeg\r\n\r\n' + frame + b'\r\n')
-        except queue.Empty:
-            continue
-        except Exception as e:
-            logging.error(f"Error in gen_frames: {str(e)}")
-            sleep(0.1)
-
-@app.route('/')
+@bp.route('/')
 def index():
-    logging.info("Accessed index page.")
-    return render_template('index.html', spr=SPR, delay=delay, pin_assignments=PIN_ASSIGNMENTS, 
-                           door_open_direction=door_open_direction, camera_width=camera_width, 
-                           camera_height=camera_height, camera_framerate=camera_framerate, 
-                           camera_quality=camera_quality)
-
-@app.route('/control/<action>')
+    # The shell only holds names and links, the page fills in every value from /get_status
+    coop = g.coop
+    coop.log.info("Accessed index page.")
+    key = (request.blueprint, coop.name)
+    if key not in index_pages:
+        body = render_template('index.html', pin_names=list(coop.pin_assignments),
+                               api_base=url_for('.index').rstrip('/'), coop_name=coop.name,
+                               coop_names=list(coops)).encode()
+        index_pages[key] = (compress(body, 'text/html'), hashlib.sha256(body).hexdigest()[:16])
+    variants, etag = index_pages[key]
+    return encoded_response(variants, 'text/html', etag, 'no-cache')
+
+@bp.route('/control/<action>')
 def control(action):
-    global stop_motor
-    if action == 'cw':
-        if lever_cw_line.get_value() == 1:
-            logging.info("Received web command: Rotate clockwise.")
-            rotate_motor(1, SPR, delay)
-            return jsonify({'message': 'Rotating clockwise'})
-        else:
-            logging.info("Clockwise rotation blocked by lever switch.")
-            return jsonify({'message': 'Clockwise rotation blocked'})
-    elif action == 'ccw':
-        if lever_ccw_line.get_value() == 1:
-            logging.info("Received web command: Rotate counterclockwise.")
-            rotate_motor(0, SPR, delay)
-            return jsonify({'message': 'Rotating counterclockwise'})
-        else:
-            logging.info("Counterclockwise rotation blocked by lever switch.")
-            return jsonify({'message': 'Counterclockwise rotation blocked'})
-    elif action == 'stop':
-        logging.info("Received web command: Stop motor.")
-        stop_motor = True
-        set_holding_torque(True)
-        return jsonify({'message': 'Motor stopped'})
-    elif action == 'toggle_light':
-        logging.info("Received web command: Toggle light.")
-        toggle_light()
-        return jsonify({'message': f'Light toggled {"on" if light_on else "off"}'})
-    logging.warning(f"Received invalid web command: {action}.")
-    return jsonify({'error': 'Invalid action'}), 400
-
-@app.route('/update_variables', methods=['POST'])
+    message, ok = g.coop.command(action, 'web')
+    g.coop.publish_status()
+    if not ok:
+        return jsonify({'error': message}), 400
+    return jsonify({'message': message})
+
+@bp.route('/update_variables', methods=['POST'])
 def update_variables():
-    global SPR, delay
+    coop = g.coop
     data = request.json
-    SPR = int(data['spr'])
-    delay = float(data['delay'])
-    logging.info(f"Updated variables: SPR={SPR}, Delay={delay}.")
-    return jsonify({'message': f'Variables updated - SPR: {SPR}, Delay: {delay}'})
+    coop.spr = int(data['spr'])
+    coop.delay = float(data['delay'])
+    coop.publish_status()
+    coop.log.info(f"Updated variables: SPR={coop.spr}, Delay={coop.delay}.")
+    return jsonify({'message': f'Variables updated - SPR: {coop.spr}, Delay: {coop.delay}'})
 
-@app.route('/update_pins', methods=['POST'])
+@bp.route('/update_pins', methods=['POST'])
 def update_pins():
-    global PIN_ASSIGNMENTS
+    coop = g.coop
     new_assignments = request.json
-    
+
     for key, value in new_assignments.items():
         if not isinstance(value, int) or value < 0 or value > 27:
-            logging.warning(f"Invalid pin assignment attempted: {key}={value}.")
+            coop.log.warning(f"Invalid pin assignment attempted: {key}={value}.")
             return jsonify({'error': f'Invalid value for {key}'}), 400
-    
-    PIN_ASSIGNMENTS = new_assignments
-    logging.info(f"Updated pin assignments: {PIN_ASSIGNMENTS}. Restart required for changes to take effect.")
+
+    coop.pin_assignments = new_assignments
+    coop.publish_status()
+    coop.log.info(f"Updated pin assignments: {coop.pin_assignments}. Restart required for changes to take effect.")
     return jsonify({'message': 'Pin assignments updated. Restart required for changes to take effect.'})
 
-@app.route('/toggle_holding_torque')
+@bp.route('/toggle_holding_torque')
 def toggle_holding_torque():
-    global holding_torque
-    current_state = holding_torque
-    set_holding_torque(not current_state)
-    return jsonify({'message': f'Holding torque {"enabled" if holding_torque else "disabled"}'})
+    coop = g.coop
+    coop.set_holding_torque(not coop.holding_torque())
+    coop.publish_status()
+    return jsonify({'message': f'Holding torque {"enabled" if coop.holding_torque() else "disabled"}'})
 
-@app.route('/logs')
+@bp.route('/logs')
 def view_logs():
     logging.debug("Accessed logs page.")
+    if governor.background_paused:
+        # Reading the whole log competes with the step loop; the dashboard keeps what it shows
+        response = Response('Log paused while a door moves', status=503, mimetype='text/plain')
+        response.headers['Retry-After'] = '2'
+        return response
     if os.path.exists(log_file):
         with open(log_file, 'r') as f:
             log_content = f.read()
@@ -436,96 +168,333 @@ def view_logs():
     else:
         return "Log file not found", 404
 
-@app.route('/video_feed')
+@bp.route('/video_feed')
 def video_feed():
-    logging.info("Accessed video feed.")
-    return Response(gen_frames(),
-                    mimetype='multipart/x-mixed-replace; boundary=frame')
-
-@app.route('/toggle_camera')
+    camera = g.coop.camera
+    if not camera.enabled:
+        return Response('Camera is off', status=503, mimetype='text/plain')
+    if camera.codec != 'mjpeg':
+        return Response('Camera streams fragmented MP4, see /h264/segments', status=409, mimetype='text/plain')
+    if not camera.acquire_stream_slot():
+        g.coop.log.warning("Video feed refused, too many open streams.")
+        return Response('Too many open video streams', status=503, mimetype='text/plain')
+    response = Response(camera.gen_frames(),
+                        mimetype='multipart/x-mixed-replace; boundary=frame')
+    response.call_on_close(camera.release_stream_slot)
+    return response
+
+@bp.route('/snapshot.jpg')
+def snapshot():
+    camera = g.coop.camera
+    frame, seq, frame_time = camera.snapshot()
+    if not camera.enabled or frame is None:
+        response = Response('No frame available', status=503, mimetype='text/plain')
+        response.headers['Retry-After'] = '1'
+        return response
+
+    etag = f'{boot_id}-{seq}'
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        response = Response(frame, mimetype='image/jpeg')
+    response.set_etag(etag)
+    response.last_modified = frame_time
+    # Clients may keep the frame but must revalidate, which is a cheap 304 when nothing changed
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+@bp.route('/h264/segments')
+def h264_segments():
+    camera = g.coop.camera
+    return jsonify({'enabled': camera.enabled and camera.codec == 'h264', **camera.segments.info()})
+
+@bp.route('/h264/init.mp4')
+def h264_init():
+    segments = g.coop.camera.segments
+    with segments.condition:
+        init, generation = segments.init, segments.generation
+    if init is None:
+        response = Response('No H.264 stream yet', status=503, mimetype='text/plain')
+        response.headers['Retry-After'] = '1'
+        return response
+    # The init segment only changes with a new generation, i.e. new parameter sets
+    etag = f'{boot_id}-{generation}'
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        response = Response(init, mimetype='video/mp4')
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Generation'] = str(generation)
+    return response
+
+@bp.route('/h264/<int:generation>/<int:number>.m4s')
+def h264_segment(generation, number):
+    camera = g.coop.camera
+    # Waits for a fragment not produced yet, so a viewer following the stream holds one worker thread
+    if not camera.acquire_stream_slot(quiet=True):
+        return Response('Too many open video streams', status=503, mimetype='text/plain')
+    try:
+        fragment = camera.segments.get(generation, number)
+    finally:
+        camera.release_stream_slot(quiet=True)
+    if fragment is None:
+        return Response('Segment not available', status=404, mimetype='text/plain')
+    response = Response(fragment, mimetype='video/iso.segment')
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
+@bp.route('/detections')
+def detections():
+    # Poll with ?since=<last id seen> to get only new events
+    detector = g.coop.detector
+    if detector is None:
+        return jsonify({'enabled': False, 'events': []})
+    return jsonify({'enabled': detector.running, **detector.status(),
+                    'events': detector.recent_events(request.args.get('since', 0, type=int))})
+
+@bp.route('/timelapse')
+def timelapse_days():
+    timelapse = g.coop.timelapse
+    return jsonify({'enabled': g.coop.timelapse_enabled, 'interval': timelapse.interval,
+                    'dropped': timelapse.dropped, 'days': timelapse.list_days()})
+
+@bp.route('/timelapse/<day>')
+def timelapse_feed(day):
+    timelapse = g.coop.timelapse
+    archive = timelapse.get_archive(day)
+    if archive is None or len(archive) == 0:
+        return jsonify({'error': f'No time-lapse for {day}'}), 404
+    try:
+        speed = float(request.args.get('speed', TIMELAPSE_DEFAULT_SPEED))
+        fps = float(request.args.get('fps', 10))
+    except ValueError:
+        return jsonify({'error': 'Invalid speed or fps'}), 400
+    if speed <= 0 or fps <= 0:
+        return jsonify({'error': 'Speed and fps must be positive'}), 400
+    fps = min(fps, TIMELAPSE_MAX_FPS)
+    # Holds a worker thread for the whole playback, like a live feed
+    camera = g.coop.camera
+    if not camera.acquire_stream_slot():
+        g.coop.log.warning("Time-lapse playback refused, too many open streams.")
+        return Response('Too many open video streams', status=503, mimetype='text/plain')
+    g.coop.log.info(f"Playing time-lapse for {day} at {speed}x, {fps}fps.")
+    response = Response(timelapse.playback(day, speed, fps),
+                        mimetype='multipart/x-mixed-replace; boundary=frame')
+    response.call_on_close(camera.release_stream_slot)
+    return response
+
+@bp.route('/toggle_camera')
 def toggle_camera():
-    global camera_on
-    if camera_on:
-        stop_camera_stream()
+    camera = g.coop.camera
+    if camera.enabled:
+        camera.stop()
     else:
-        camera_on = True
-        start_camera_stream()
-    logging.info(f"Camera turned {'on' if camera_on else 'off'}")
-    return redirect(url_for('index'))
+        camera.turn_on()
+    g.coop.publish_status()
+    g.coop.log.info(f"Camera turned {'on' if camera.enabled else 'off'}")
+    return redirect(url_for('.index'))
 
-@app.route('/update_camera_settings', methods=['POST'])
+@bp.route('/update_camera_settings', methods=['POST'])
 def update_camera_settings():
-    global camera_width, camera_height, camera_framerate, camera_quality, camera_on
+    camera = g.coop.camera
     data = request.json
-    camera_width = int(data.get('width', camera_width))
-    camera_height = int(data.get('height', camera_height))
-    camera_framerate = int(data.get('framerate', camera_framerate))
-    camera_quality = int(data.get('quality', camera_quality))
-    logging.info(f"Updated camera settings: {camera_width}x{camera_height}, {camera_framerate}fps, quality {camera_quality}")
-    
-    was_camera_on = camera_on
-    if camera_on:
-        stop_camera_stream()
-    
-    if was_camera_on:
-        camera_on = True
-        start_camera_stream()
-    
-    return jsonify({'message': 'Camera settings updated', 'camera_on': camera_on})
-
-
-@app.route('/get_status')
+    camera.width = int(data.get('width', camera.width))
+    camera.height = int(data.get('height', camera.height))
+    camera.framerate = int(data.get('framerate', camera.framerate))
+    camera.quality = int(data.get('quality', camera.quality))
+    g.coop.log.info(f"Updated camera settings: {camera.width}x{camera.height}, {camera.framerate}fps, quality {camera.quality}")
+
+    if camera.enabled:
+        camera.stop()
+        camera.turn_on()
+    g.coop.publish_status()
+
+    return jsonify({'message': 'Camera settings updated', 'camera_on': camera.enabled})
+
+
+@bp.route('/get_status')
 def get_status():
-    logging.debug("Status request received.")
-    return jsonify({
-        'spr': SPR,
-        'delay': delay,
-        'light_on': light_on,
-        'camera_on': camera_on,
-        'camera_width': camera_width,
-        'camera_height': camera_height,
-        'camera_framerate': camera_framerate,
-        'camera_quality': camera_quality,
-        'pin_assignments': PIN_ASSIGNMENTS,
-        'holding_torque': holding_torque,
-        'lever_cw_pressed': lever_cw_line.get_value() == 0,
-        'lever_ccw_pressed': lever_ccw_line.get_value() == 0,
-        'door_open_direction': door_open_direction
-    })
-
-@app.route('/scheduled_events')
+    # Prebuilt by the input thread; unchanged status is a 304
+    body, etag = g.coop.snapshot.get()
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        response = Response(body, mimetype='application/json')
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+@bp.route('/telemetry')
+def telemetry():
+    # Changes every second, so it is neither cached nor part of the status ETag
+    response = jsonify(g.coop.telemetry())
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
+@bp.route('/scheduled_events')
 def scheduled_events():
-    return jsonify(get_next_scheduled_times())
+    return jsonify(g.coop.get_next_scheduled_times())
+
+def list_coops():
+    return jsonify({'coops': [{'name': coop.name, 'url': url_for('coop.index', coop_name=coop.name),
+                               'light_on': coop.light_on, 'motor_busy': coop.motor_busy(),
+                               'camera_on': coop.camera.enabled}
+                              for coop in coops.values()]})
+
+def list_cameras():
+    # From the discovery cache, nothing is probed per request
+    used = {coop.camera.index: coop.name for coop in coops.values()}
+    return jsonify({'hotplug_events': discovery.watching, 'scans': discovery.scans,
+                    'cameras': [{**info, 'coop': used.get(info['libcamera_index'])} for info in discovery.cameras()]})
+
+def node_state():
+    # Everything an aggregator needs from this node in one round trip
+    body = json.dumps({
+        'boot_id': boot_id,
+        'coops': {name: {'status': coop.snapshot.state, 'schedule': coop.get_next_scheduled_times()}
+                  for name, coop in coops.items()},
+    }, sort_keys=True).encode()
+    etag = hashlib.sha1(body).hexdigest()[:16]
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        response = Response(body, mimetype='application/json')
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+def poll_inputs():
+    # One thread serves the buttons of every coop
+    beat = heartbeat('poll_inputs', INPUT_POLL_INTERVAL)
+    while True:
+        beat.beat()
+        for coop in coops.values():
+            try:
+                if coop.power.tick():
+                    coop.mark_changed()
+                coop.poll_buttons()
+                coop.refresh_status()
+                coop.state_store.write_due()  # Position of a running move, kept out of the step loop
+            except Exception as e:
+                coop.log.error(f"Error polling buttons: {str(e)}")
+        sleep(INPUT_POLL_INTERVAL)  # Small delay to prevent excessive CPU usage
 
-@atexit.register
-def cleanup_resources():
-    logging.info("Cleaning up resources at exit.")
-    cleanup()
-    stop_camera_stream()
-    if os.path.exists(fifo_path):
-        os.remove(fifo_path)
+def run_scheduler():
+    beat = heartbeat('run_scheduler', SCHEDULER_INTERVAL)
+    while True:
+        beat.beat()
+        for coop in coops.values():
+            coop.scheduler.run_pending()
+        time.sleep(SCHEDULER_INTERVAL)
 
-if __name__ == '__main__':
-    logging.info(f"Starting application with door open direction: {door_open_direction}")
-    
-    initial_slp_state = read_slp_state()
-    logging.info(f"Initial SLP pin state: {initial_slp_state}")
+def supervise_cameras():
+    beat = heartbeat('supervise_cameras', CAMERA_SUPERVISOR_INTERVAL)
+    while True:
+        sleep(CAMERA_SUPERVISOR_INTERVAL)
+        beat.beat()
+        for coop in coops.values():
+            coop.camera.supervise()
+
+def bus_command(coop_name, action):
+    # Commands from local processes such as the button handler, cron jobs or home automation
+    if coop_name is None:
+        coop = default_coop()
+    elif coop_name in coops:
+        coop = coops[coop_name]
+    else:
+        return f'Unknown coop {coop_name}', False
+    result = coop.command(action, 'bus')
+    coop.publish_status()
+    return result
+
+def run_command_bus():
+    try:
+        CommandBus(BUS_SOCKET, bus_command).serve()
+    except Exception as e:
+        logging.error(f"Command bus stopped: {str(e)}")
+
+def profiler_control(action):
+    # POST /admin/profiler/start?rate=100&duration=60, then /admin/profiler/stop
+    if action == 'start':
+        started = profiler.start(request.args.get('rate', DEFAULT_SAMPLE_RATE, type=int),
+                                 request.args.get('duration', MAX_PROFILE_SECONDS, type=float))
+        message = 'Profiler started' if started else 'Profiler already running'
+    elif action == 'stop':
+        message = 'Profiler stopped' if profiler.stop() else 'Profiler was not running'
+    else:
+        abort(404)
+    return jsonify({'message': message, **profiler.summary()})
+
+def profile_stacks():
+    # Folded stacks for flamegraph.pl or speedscope; ?thread=poll_inputs limits them to one thread
+    if request.args.get('format') == 'json':
+        return jsonify(profiler.summary())
+    return Response(profiler.folded(request.args.get('thread')), mimetype='text/plain')
 
-    set_holding_torque(True)
-    
-    logging.info(f"After initialization: Holding torque is {'enabled' if holding_torque else 'disabled'}, SLP pin state is {read_slp_state()}")
+def thread_health():
+    return jsonify({'loops': {name: beat.status() for name, beat in sorted(heartbeats.items())},
+                    'streams': stream_slots.status(),
+                    'threads': sorted(thread.name for thread in threading.enumerate())})
 
-    button_thread = threading.Thread(target=handle_button_presses, daemon=True)
-    button_thread.start()
+def governor_status():
+    return jsonify(governor.status())
 
-    schedule_door_events()
-    scheduler_thread = threading.Thread(target=run_scheduler, daemon=True)
+def cleanup_resources():
+    logging.info("Cleaning up resources at exit.")
+    for coop in coops.values():
+        coop.cleanup()
+
+def create_app():
+    configure_logging()
+    load_coops()
+    app = Flask(__name__)
+    app.register_blueprint(bp)
+    app.register_blueprint(bp, url_prefix='/coop/<coop_name>', name='coop')
+    app.add_url_rule('/coops', 'coops', list_coops)
+    app.add_url_rule('/node_state', 'node_state', node_state)
+    app.add_url_rule('/cameras', 'cameras', list_cameras)
+    app.add_url_rule('/admin/profiler/<action>', 'profiler_control', profiler_control, methods=['POST'])
+    app.add_url_rule('/admin/profiler', 'profile_stacks', profile_stacks)
+    app.add_url_rule('/admin/threads', 'thread_health', thread_health)
+    app.add_url_rule('/admin/governor', 'governor_status', governor_status)
+    assets.init_app(app)
+    return app
+
+def start_camera_services():
+    discovery.start()
+    for coop in coops.values():
+        coop.start_camera()
+
+    supervisor_thread = threading.Thread(target=supervise_cameras, name='supervise_cameras', daemon=True)
+    supervisor_thread.start()
+    mark_startup('camera_ready')
+
+def start_services():
+    logging.info(f"Starting application with {len(coops)} coop(s): {', '.join(coops)}")
+    for coop in coops.values():
+        coop.start()
+    atexit.register(cleanup_resources)
+    mark_startup('gpio_ready')
+
+    input_thread = threading.Thread(target=poll_inputs, name='poll_inputs', daemon=True)
+    input_thread.start()
+
+    scheduler_thread = threading.Thread(target=run_scheduler, name='run_scheduler', daemon=True)
     scheduler_thread.start()
 
-    if camera_on:
-        if not start_camera_stream():
-            camera_on = False
-            logging.warning("Camera initialization failed, continuing without camera support")
-    
-    logging.info("Starting Flask app.")
-    app.run(host='0.0.0.0', port=5000, threaded=True)
+    bus_thread = threading.Thread(target=run_command_bus, name='command_bus', daemon=True)
+    bus_thread.start()
+
+    governor.start()
+
+    # The camera takes a few seconds to come up, so the control API does not wait for it
+    camera_thread = threading.Thread(target=start_camera_services, name='start_camera_services', daemon=True)
+    camera_thread.start()
+    mark_startup('control_ready')
+
+if __name__ == '__main__':
+    app = create_app()
+    start_services()
+    logging.info("Starting Flask development server. Use server.py in production.")
+    app.run(host='0.0.0.0', port=int(os.environ.get('CHICKEN_DOOR_PORT', 5000)), threaded=True)
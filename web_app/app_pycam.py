@@ -1,7 +1,9 @@
+import time
+STARTUP_BEGIN = time.perf_counter()
+
 import os
 import logging
-from flask import Flask, render_template, request, Response, jsonify, redirect, url_for
-import gpiod
+from flask import Flask, Blueprint, render_template, request, Response, jsonify, redirect, url_for
 import threading
 from time import sleep
 import atexit
@@ -9,30 +11,18 @@ from datetime import datetime, timedelta
 from astral import LocationInfo
 from astral.sun import sun
 import schedule
-import time
 from zoneinfo import ZoneInfo
-from picamera2 import Picamera2
-import numpy as np
-import cv2
 
-app = Flask(__name__)
+from assets import assets
+
+bp = Blueprint('door', __name__)
 
 # Define the log directory and file
 log_dir = os.path.expanduser("~/logs")
 log_file = os.path.join(log_dir, "motor_light_control.log")
 
-# Create the log directory if it doesn't exist
-os.makedirs(log_dir, exist_ok=True)
-
-# Configure logging
-logging.basicConfig(
-    filename=log_file,
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-)
-
-# Suppress Flask request logs (like GET /logs)
-logging.getLogger('werkzeug').setLevel(logging.WARNING)
+# Startup milestones in milliseconds since the module started loading
+startup_timings = {}
 
 # Global variables
 SPR = 6000  # Steps per revolution
@@ -62,20 +52,96 @@ PIN_ASSIGNMENTS = {
     'LEVER_CCW_PIN': 16
 }
 
-# Initialize the chip and lines
-chip = gpiod.Chip('gpiochip4')
-dir_line = chip.get_line(PIN_ASSIGNMENTS['DIR_PIN'])
-step_line = chip.get_line(PIN_ASSIGNMENTS['STEP_PIN'])
-slp_line = chip.get_line(PIN_ASSIGNMENTS['SLP_PIN'])
-light_line = chip.get_line(PIN_ASSIGNMENTS['LIGHT_PIN'])
-btn_cw_line = chip.get_line(PIN_ASSIGNMENTS['BTN_CW_PIN'])
-btn_ccw_line = chip.get_line(PIN_ASSIGNMENTS['BTN_CCW_PIN'])
-btn_stop_line = chip.get_line(PIN_ASSIGNMENTS['BTN_STOP_PIN'])
-btn_light_line = chip.get_line(PIN_ASSIGNMENTS['BTN_LIGHT_PIN'])
-lever_cw_line = chip.get_line(PIN_ASSIGNMENTS['LEVER_CW_PIN'])
-lever_ccw_line = chip.get_line(PIN_ASSIGNMENTS['LEVER_CCW_PIN'])
+# GPIO chip and lines, requested by init_gpio()
+GPIO_CHIP = 'gpiochip4'
+chip = None
+dir_line = None
+step_line = None
+slp_line = None
+light_line = None
+btn_cw_line = None
+btn_ccw_line = None
+btn_stop_line = None
+btn_light_line = None
+lever_cw_line = None
+lever_ccw_line = None
+
+# Picamera2 and OpenCV are imported by load_camera_stack(), off the startup path
+Picamera2 = None
+cv2 = None
+EncoderPool = None
+
+# Camera pipeline settings
+CAMERA_SIZE = (640, 480)
+ENCODER_WORKERS = os.cpu_count() or 1  # JPEG encoder threads
+JPEG_QUALITY = 95  # cv2.imencode's default, what the stream always used
+
+def configure_logging():
+    # Create the log directory if it doesn't exist
+    os.makedirs(log_dir, exist_ok=True)
+
+    # Configure logging
+    logging.basicConfig(
+        filename=log_file,
+        level=logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(message)s',
+    )
+
+    # Suppress Flask request logs (like GET /logs)
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+
+def mark_startup(milestone):
+    startup_timings[milestone] = round((time.perf_counter() - STARTUP_BEGIN) * 1000, 1)
+    logging.info(f"Startup: {milestone} after {startup_timings[milestone]} ms")
+
+camera_stack_lock = threading.Lock()
+
+def load_camera_stack():
+    global Picamera2, cv2, EncoderPool
+    with camera_stack_lock:
+        if cv2 is None:
+            from picamera2 import Picamera2 as picamera2_class
+            import cv2 as cv2_module
+            from encoder_pool import EncoderPool as encoder_pool_class
+            Picamera2 = picamera2_class
+            EncoderPool = encoder_pool_class
+            cv2 = cv2_module
+            mark_startup('camera_ready')
+
+def init_gpio():
+    global chip, dir_line, step_line, slp_line, light_line, btn_cw_line, btn_ccw_line
+    global btn_stop_line, btn_light_line, lever_cw_line, lever_ccw_line
+    import gpiod
+
+    chip = gpiod.Chip(GPIO_CHIP)
+    dir_line = chip.get_line(PIN_ASSIGNMENTS['DIR_PIN'])
+    step_line = chip.get_line(PIN_ASSIGNMENTS['STEP_PIN'])
+    slp_line = chip.get_line(PIN_ASSIGNMENTS['SLP_PIN'])
+    light_line = chip.get_line(PIN_ASSIGNMENTS['LIGHT_PIN'])
+    btn_cw_line = chip.get_line(PIN_ASSIGNMENTS['BTN_CW_PIN'])
+    btn_ccw_line = chip.get_line(PIN_ASSIGNMENTS['BTN_CCW_PIN'])
+    btn_stop_line = chip.get_line(PIN_ASSIGNMENTS['BTN_STOP_PIN'])
+    btn_light_line = chip.get_line(PIN_ASSIGNMENTS['BTN_LIGHT_PIN'])
+    lever_cw_line = chip.get_line(PIN_ASSIGNMENTS['LEVER_CW_PIN'])
+    lever_ccw_line = chip.get_line(PIN_ASSIGNMENTS['LEVER_CCW_PIN'])
+
+    # Request lines
+    logging.info("Requesting GPIO lines...")
+    dir_line.request(consumer='test', type=gpiod.LINE_REQ_DIR_OUT)
+    step_line.request(consumer='test', type=gpiod.LINE_REQ_DIR_OUT)
+    slp_line.request(consumer='test', type=gpiod.LINE_REQ_DIR_OUT)
+    light_line.request(consumer='test', type=gpiod.LINE_REQ_DIR_OUT)
+    btn_cw_line.request(consumer='test', type=gpiod.LINE_REQ_DIR_IN, flags=gpiod.LINE_REQ_FLAG_BIAS_PULL_UP)
+    btn_ccw_line.request(consumer='test', type=gpiod.LINE_REQ_DIR_IN, flags=gpiod.LINE_REQ_FLAG_BIAS_PULL_UP)
+    btn_stop_line.request(consumer='test', type=gpiod.LINE_REQ_DIR_IN, flags=gpiod.LINE_REQ_FLAG_BIAS_PULL_UP)
+    btn_light_line.request(consumer='test', type=gpiod.LINE_REQ_DIR_IN, flags=gpiod.LINE_REQ_FLAG_BIAS_PULL_UP)
+    lever_cw_line.request(consumer='test', type=gpiod.LINE_REQ_DIR_IN, flags=gpiod.LINE_REQ_FLAG_BIAS_PULL_UP)
+    lever_ccw_line.request(consumer='test', type=gpiod.LINE_REQ_DIR_IN, flags=gpiod.LINE_REQ_FLAG_BIAS_PULL_UP)
+    logging.info("GPIO lines successfully requested.")
 
 def cleanup():
+    if chip is None:
+        return
     logging.info("Cleaning up GPIO lines and resources...")
     slp_line.set_value(0)  # Put the motor driver to sleep
     dir_line.release()
@@ -90,20 +156,6 @@ def cleanup():
     lever_ccw_line.release()
     logging.info("GPIO lines released and chip closed. Cleanup complete.")
 
-# Request lines
-logging.info("Requesting GPIO lines...")
-dir_line.request(consumer='test', type=gpiod.LINE_REQ_DIR_OUT)
-step_line.request(consumer='test', type=gpiod.LINE_REQ_DIR_OUT)
-slp_line.request(consumer='test', type=gpiod.LINE_REQ_DIR_OUT)
-light_line.request(consumer='test', type=gpiod.LINE_REQ_DIR_OUT)
-btn_cw_line.request(consumer='test', type=gpiod.LINE_REQ_DIR_IN, flags=gpiod.LINE_REQ_FLAG_BIAS_PULL_UP)
-btn_ccw_line.request(consumer='test', type=gpiod.LINE_REQ_DIR_IN, flags=gpiod.LINE_REQ_FLAG_BIAS_PULL_UP)
-btn_stop_line.request(consumer='test', type=gpiod.LINE_REQ_DIR_IN, flags=gpiod.LINE_REQ_FLAG_BIAS_PULL_UP)
-btn_light_line.request(consumer='test', type=gpiod.LINE_REQ_DIR_IN, flags=gpiod.LINE_REQ_FLAG_BIAS_PULL_UP)
-lever_cw_line.request(consumer='test', type=gpiod.LINE_REQ_DIR_IN, flags=gpiod.LINE_REQ_FLAG_BIAS_PULL_UP)
-lever_ccw_line.request(consumer='test', type=gpiod.LINE_REQ_DIR_IN, flags=gpiod.LINE_REQ_FLAG_BIAS_PULL_UP)
-logging.info("GPIO lines successfully requested.")
-
 def read_slp_state():
     return slp_line.get_value()
 
@@ -242,12 +294,12 @@ def run_scheduler():
         schedule.run_pending()
         time.sleep(60)  # Check every minute
 
-@app.route('/')
+@bp.route('/')
 def index():
     logging.info("Accessed index page.")
-    return render_template('index.html', spr=SPR, delay=delay, pin_assignments=PIN_ASSIGNMENTS, door_open_direction=door_open_direction)
+    return render_template('index.html', pin_names=list(PIN_ASSIGNMENTS), api_base=url_for('.index').rstrip('/'), coop_names=[])
 
-@app.route('/control/<action>')
+@bp.route('/control/<action>')
 def control(action):
     global stop_motor
     if action == 'cw':
@@ -278,7 +330,7 @@ def control(action):
     logging.warning(f"Received invalid web command: {action}.")
     return jsonify({'error': 'Invalid action'}), 400
 
-@app.route('/update_variables', methods=['POST'])
+@bp.route('/update_variables', methods=['POST'])
 def update_variables():
     global SPR, delay
     data = request.json
@@ -287,7 +339,7 @@ def update_variables():
     logging.info(f"Updated variables: SPR={SPR}, Delay={delay}.")
     return jsonify({'message': f'Variables updated - SPR: {SPR}, Delay: {delay}'})
 
-@app.route('/update_pins', methods=['POST'])
+@bp.route('/update_pins', methods=['POST'])
 def update_pins():
     global PIN_ASSIGNMENTS
     new_assignments = request.json
@@ -301,14 +353,14 @@ def update_pins():
     logging.info(f"Updated pin assignments: {PIN_ASSIGNMENTS}. Restart required for changes to take effect.")
     return jsonify({'message': 'Pin assignments updated. Restart required for changes to take effect.'})
 
-@app.route('/toggle_holding_torque')
+@bp.route('/toggle_holding_torque')
 def toggle_holding_torque():
     global holding_torque
     current_state = holding_torque
     set_holding_torque(not current_state)
     return jsonify({'message': f'Holding torque {"enabled" if holding_torque else "disabled"}'})
 
-@app.route('/logs')
+@bp.route('/logs')
 def view_logs():
     logging.debug("Accessed logs page.")
     if os.path.exists(log_file):
@@ -318,47 +370,57 @@ def view_logs():
     else:
         return "Log file not found", 404
 
+def capture_frames(camera, pool, capturing):
+    # Capture runs on its own thread, encoding is spread over the pool
+    while capturing.is_set() and camera_on:
+        pool.submit(camera.capture_array())
+
 def gen_frames():
     logging.info("Starting frame generation.")
+    load_camera_stack()
     camera = Picamera2()
-    camera.configure(camera.create_preview_configuration(main={"format": 'XRGB8888', "size": (640, 480)}))
+    camera.configure(camera.create_preview_configuration(main={"format": 'XRGB8888', "size": CAMERA_SIZE}))
     camera.start()
+    pool = EncoderPool(cv2, workers=ENCODER_WORKERS, quality=JPEG_QUALITY)
+    pool.start()
+    capturing = threading.Event()
+    capturing.set()
+    capture_thread = threading.Thread(target=capture_frames, args=(camera, pool, capturing), daemon=True)
+    capture_thread.start()
     try:
         while camera_on:
-            frame = camera.capture_array()
-            ret, buffer = cv2.imencode('.jpg', frame)
-            if ret:
-                frame_bytes = buffer.tobytes()
-                yield (b'--frame\r\n'
-                       b'Content-Type: image/jpeg\r\n\r\n' + frame_bytes + b'\r\n')
-            else:
-                logging.error("Failed to encode frame.")
-            # Optional: Add a small sleep if CPU usage is high
-            # time.sleep(0.01)
+            frame_bytes = pool.get(timeout=1)
+            if frame_bytes is None:
+                continue
+            yield (b'--frame\r\n'
+                   b'Content-Type: image/jpeg\r\n\r\n' + frame_bytes + b'\r\n')
     finally:
+        capturing.clear()
+        capture_thread.join(timeout=2)
+        pool.stop()
         camera.stop()
-        logging.info("Camera stopped.")
+        logging.info(f"Camera stopped, encoder stats: {pool.stats()}")
 
-@app.route('/video_feed')
+@bp.route('/video_feed')
 def video_feed():
     logging.info("Accessed video feed.")
     return Response(gen_frames(),
                     mimetype='multipart/x-mixed-replace; boundary=frame')
 
-@app.route('/toggle_camera')
+@bp.route('/toggle_camera')
 def toggle_camera():
     global camera_on
     camera_on = not camera_on
     logging.info(f"Camera turned {'on' if camera_on else 'off'}")
-    return redirect(url_for('index'))
+    return redirect(url_for('.index'))
 
-@app.route('/set_camera_device', methods=['POST'])
+@bp.route('/set_camera_device', methods=['POST'])
 def set_camera_device():
     # Since Picamera2 works with the Pi Camera, there's no device index to set
     logging.info("Camera device setting is not applicable for PiCamera2.")
-    return redirect(url_for('index'))
+    return redirect(url_for('.index'))
 
-@app.route('/get_status')
+@bp.route('/get_status')
 def get_status():
     logging.debug("Status request received.")
     return jsonify({
@@ -370,10 +432,11 @@ def get_status():
         'holding_torque': holding_torque,
         'lever_cw_pressed': lever_cw_line.get_value() == 0,
         'lever_ccw_pressed': lever_ccw_line.get_value() == 0,
-        'door_open_direction': door_open_direction
+        'door_open_direction': door_open_direction,
+        'startup_ms': startup_timings
     })
 
-@app.route('/scheduled_events')
+@bp.route('/scheduled_events')
 def scheduled_events():
     sunrise, sunset = get_sun_times()
     sunrise = sunrise - timedelta(minutes=20)
@@ -386,14 +449,23 @@ def scheduled_events():
         'next_light_off': (sunset + timedelta(minutes=15)).strftime("%H:%M")
     })
 
-@atexit.register
 def cleanup_resources():
     logging.info("Cleaning up resources at exit.")
     cleanup()
     # No need to stop the camera here, as it's handled in gen_frames()
 
-if __name__ == '__main__':
+def create_app():
+    configure_logging()
+    app = Flask(__name__)
+    app.register_blueprint(bp)
+    assets.init_app(app)
+    return app
+
+def start_services():
     logging.info(f"Starting application with door open direction: {door_open_direction}")
+    init_gpio()
+    atexit.register(cleanup_resources)
+    mark_startup('gpio_ready')
     
     initial_slp_state = read_slp_state()
     logging.info(f"Initial SLP pin state: {initial_slp_state}")
@@ -409,5 +481,13 @@ if __name__ == '__main__':
     scheduler_thread = threading.Thread(target=run_scheduler, daemon=True)
     scheduler_thread.start()
 
+    # Import the camera stack in the background so the first stream does not pay for it
+    camera_thread = threading.Thread(target=load_camera_stack, daemon=True)
+    camera_thread.start()
+    mark_startup('control_ready')
+
+if __name__ == '__main__':
+    app = create_app()
+    start_services()
     logging.info("Starting Flask app.")
     app.run(host='0.0.0.0', port=5000, threaded=True)
@@ -0,0 +1,93 @@
+import os
+import gzip
+import hashlib
+import logging
+import mimetypes
+from flask import Response, request, url_for, abort
+
+try:
+    import brotli  # Optional, gzip alone covers every browser
+except ImportError:
+    brotli = None
+
+# Dashboard files are served from memory under content-hashed names, compressed once at startup
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static')
+ASSET_MAX_AGE = 365 * 24 * 3600  # A changed file gets a new name, so browsers never need to revalidate
+COMPRESS_MIN_SIZE = 256  # Below this the encoding header costs about what compression saves
+COMPRESSIBLE_TYPES = ('text/', 'application/javascript', 'application/json', 'image/svg+xml')
+
+
+def compress(data, mimetype):
+    # Encoded variants of a response body, only kept when they are smaller
+    variants = {'identity': data}
+    if len(data) < COMPRESS_MIN_SIZE or not mimetype.startswith(COMPRESSIBLE_TYPES):
+        return variants
+    gzipped = gzip.compress(data, compresslevel=9, mtime=0)
+    if len(gzipped) < len(data):
+        variants['gzip'] = gzipped
+    if brotli is not None:
+        compressed = brotli.compress(data, quality=11)
+        if len(compressed) < len(data):
+            variants['br'] = compressed
+    return variants
+
+
+def encoded_response(variants, mimetype, etag, cache_control):
+    # Picks the smallest variant the client accepts; each variant has its own ETag
+    accepted = [encoding for encoding in ('br', 'gzip') if encoding in variants and request.accept_encodings[encoding]]
+    encoding = min(accepted, key=lambda encoding: len(variants[encoding])) if accepted else 'identity'
+    etag = etag if encoding == 'identity' else f'{etag}-{encoding}'
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        response = Response(variants[encoding], mimetype=mimetype)
+        if encoding != 'identity':
+            response.headers['Content-Encoding'] = encoding
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = cache_control
+    if len(variants) > 1:
+        response.headers['Vary'] = 'Accept-Encoding'
+    return response
+
+
+class AssetStore:
+    def __init__(self, root=STATIC_DIR):
+        self.root = root
+        self.names = {}  # Source name -> hashed name
+        self.assets = {}  # Hashed name -> (mimetype, variants, etag)
+
+    def build(self):
+        self.names.clear()
+        self.assets.clear()
+        for directory, _, files in os.walk(self.root):
+            for file_name in sorted(files):
+                path = os.path.join(directory, file_name)
+                name = os.path.relpath(path, self.root).replace(os.sep, '/')
+                with open(path, 'rb') as f:
+                    data = f.read()
+                digest = hashlib.sha256(data).hexdigest()[:12]
+                base, extension = os.path.splitext(name)
+                hashed = f'{base}.{digest}{extension}'
+                mimetype = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+                self.names[name] = hashed
+                self.assets[hashed] = (mimetype, compress(data, mimetype), digest)
+        total = sum(len(variants['identity']) for _, variants, _ in self.assets.values())
+        logging.info(f"Built {len(self.assets)} static asset(s), {total} bytes uncompressed, brotli={brotli is not None}")
+
+    def url(self, name):
+        # For templates: {{ asset_url('dashboard.js') }}
+        return url_for('asset', filename=self.names[name])
+
+    def serve(self, filename):
+        if filename not in self.assets:
+            abort(404)
+        mimetype, variants, etag = self.assets[filename]
+        return encoded_response(variants, mimetype, etag, f'public, max-age={ASSET_MAX_AGE}, immutable')
+
+    def init_app(self, app):
+        self.build()
+        app.add_url_rule('/assets/<path:filename>', 'asset', self.serve)
+        app.jinja_env.globals['asset_url'] = self.url
+
+
+assets = AssetStore()
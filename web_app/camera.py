@@ -0,0 +1,419 @@
+import os
+import sys
+import time
+import fcntl
+import logging
+import threading
+import subprocess
+from time import sleep
+from datetime import datetime
+from collections import deque
+
+from profiler import heartbeat
+from fmp4 import H264Segmenter, SegmentBuffer
+from stream_slots import stream_slots
+
+# Camera supervisor settings
+CAMERA_SUPERVISOR_INTERVAL = 1  # Seconds between health checks
+CAMERA_STALL_INTERVALS = 20  # Restart when no frame arrives within this many frame intervals
+CAMERA_STARTUP_GRACE = 10  # Seconds to wait for the first frame after a (re)start
+CAMERA_BACKOFF_INITIAL = 2  # First restart delay in seconds, doubled per consecutive failure
+CAMERA_BACKOFF_MAX = 300
+
+# Video stream limits, the number of open streams is limited for the whole process in stream_slots.py
+STREAM_IDLE_TIMEOUT = 10  # Seconds without a frame before a stream is closed
+
+# Capture pipe from libcamera-vid's stdout
+CAMERA_PIPE_SIZE = 1024 * 1024  # Requested pipe capacity, so the camera never blocks on a large frame; capped by pipe-max-size
+PIPE_MAX_SIZE_FILE = '/proc/sys/fs/pipe-max-size'
+F_SETPIPE_SZ = getattr(fcntl, 'F_SETPIPE_SZ', 1031)
+F_GETPIPE_SZ = getattr(fcntl, 'F_GETPIPE_SZ', 1032)
+READ_BUFFER_SIZE = 256 * 1024  # Preallocated per reader, grows when a frame does not fit
+JPEG_START = b'\xff\xd8'
+JPEG_END = b'\xff\xd9'
+
+# H.264 mode
+H264_KEYFRAME_SECONDS = 2  # GOP length, which is also the length of a fragment and the delay for a new viewer
+
+
+class CameraStream:
+    def __init__(self, name, enabled=True, index=0, width=320, height=240, framerate=10, quality=30, codec='mjpeg',
+                 source=None, log=None):
+        self.name = name
+        self.enabled = enabled
+        self.index = index
+        self.width = width
+        self.height = height
+        self.framerate = framerate
+        self.quality = quality
+        self.codec = codec  # 'mjpeg' for the JPEG stream and snapshots, 'h264' for fragmented MP4
+        self.source = source  # Recorded .h264 file played in place of the camera
+        self.log = log or logging.getLogger(__name__)
+
+        self.process = None
+        self.frame_thread = None
+        self.pipe_size = None
+
+        # Supervisor state
+        self.lock = threading.RLock()
+        self.generation = 0
+        self.started_at = None
+        self.last_frame_time = None
+        self.first_frame_seconds = None  # Time from the last (re)start to its first frame
+        self.restart_count = 0
+        self.failures = 0  # Consecutive restarts without a frame in between
+        self.next_restart = None
+        self.last_error = None
+        self.last_error_time = None
+        self.start_error = None  # Why the last start failed, until a start succeeds
+        self.stderr_tail = deque(maxlen=20)
+
+        # Latest frame kept in memory for snapshots and viewers
+        self.latest_frame = None
+        self.latest_frame_seq = 0
+        self.latest_frame_time = None
+        self.frame_condition = threading.Condition()
+        # Set by the governor to publish fewer frames while a door moves; the camera itself keeps its rate
+        self.publish_every = 1
+        self.frames_read = 0
+        self.frames_withheld = 0
+        # Callables receiving (jpeg, timestamp) for every frame; they must not block
+        self.subscribers = []
+
+        self.stream_clients = 0
+        self.stream_clients_lock = threading.Lock()
+
+        # Fragmented MP4 of the H.264 stream, remuxed once for every viewer
+        self.segments = SegmentBuffer()
+
+    def start(self):
+        try:
+            cmd = self.command()
+            self.stderr_tail.clear()
+            # Frames come through stdout, so there is no FIFO to create, open in time or leave behind
+            self.process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, bufsize=0)
+            self.pipe_size = self.set_pipe_size(self.process.stdout.fileno())
+            self.generation += 1
+            self.started_at = time.monotonic()
+            self.last_frame_time = None
+            self.first_frame_seconds = None
+
+            # Drain stderr so libcamera-vid never blocks on a full pipe
+            threading.Thread(target=self.drain_stderr, args=(self.process,), daemon=True).start()
+
+            # A process that fails right away is found by the supervisor, no need to wait for it here
+            reader = self.read_h264 if self.codec == 'h264' else self.read_frames
+            self.frame_thread = threading.Thread(target=reader, args=(self.generation, self.process.stdout),
+                                                 name=f'read_frames_{self.name}', daemon=True)
+            self.frame_thread.start()
+
+            self.start_error = None
+            self.log.info(f"Camera stream started, pipe size {self.pipe_size // 1024} KiB.")
+            return True
+
+        except Exception as e:
+            # Stays enabled, the supervisor retries with backoff, e.g. once a busy device is free again
+            self.log.error(f"Failed to start camera stream: {str(e)}")
+            self.start_error = str(e)
+            self.record_error(f"Failed to start camera stream: {str(e)}")
+            self.terminate_process()
+            return False
+
+    def set_pipe_size(self, fd):
+        size = CAMERA_PIPE_SIZE
+        try:
+            with open(PIPE_MAX_SIZE_FILE) as f:
+                size = min(size, int(f.read()))
+        except (OSError, ValueError):
+            pass
+        try:
+            return fcntl.fcntl(fd, F_SETPIPE_SZ, size)
+        except OSError as e:
+            self.log.warning(f"Could not enlarge the camera pipe to {size} bytes: {e}")
+            return fcntl.fcntl(fd, F_GETPIPE_SZ)
+
+    def command(self):
+        if self.codec == 'h264' and self.source:
+            fmp4_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fmp4.py')
+            return [sys.executable, fmp4_path, 'replay', self.source, '-', str(self.framerate)]
+        cmd = [
+            'libcamera-vid',
+            '-t', '0',
+            '-o', '-',
+            '--flush',  # Write every frame out at once instead of when the stdio buffer is full
+            '--inline',
+            '--camera', str(self.index),
+            '--width', str(self.width),
+            '--height', str(self.height),
+            '--framerate', str(self.framerate),
+        ]
+        if self.codec == 'h264':
+            # --inline repeats SPS and PPS before every keyframe, so each fragment can start a viewer
+            return cmd + ['--codec', 'h264', '--intra', str(round(self.framerate * H264_KEYFRAME_SECONDS))]
+        return cmd + ['--codec', 'mjpeg', '--quality', str(self.quality)]
+
+    def terminate_process(self):
+        # Invalidate the current reader before killing the writer side of the pipe; the reader then sees EOF
+        self.generation += 1
+        self.started_at = None
+        process = self.process
+        if process:
+            process.terminate()
+            try:
+                process.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                self.log.warning("Camera process did not terminate, killing it.")
+                process.kill()
+                process.wait()
+            self.process = None
+        if self.frame_thread:
+            self.frame_thread.join(timeout=2)
+            self.frame_thread = None
+        if process:
+            process.stdout.close()
+
+    def turn_on(self):
+        with self.lock:
+            self.enabled = True
+            return self.start()
+
+    def stop(self):
+        self.enabled = False
+        with self.lock:
+            self.terminate_process()
+        self.log.info("Camera stream stopped.")
+
+    def cleanup(self):
+        self.stop()
+
+    def drain_stderr(self, process):
+        for line in process.stderr:
+            line = line.decode(errors='replace').rstrip()
+            if line:
+                self.stderr_tail.append(line)
+                self.log.debug(f"libcamera-vid: {line}")
+
+    def record_error(self, message):
+        self.last_error = message
+        self.last_error_time = datetime.now().isoformat(timespec='seconds')
+
+    def check_health(self):
+        if self.process is None:
+            if self.start_error is not None:
+                return f"Failed to start camera stream: {self.start_error}"
+            return "Camera process is not running"
+        returncode = self.process.poll()
+        if returncode is not None:
+            tail = self.stderr_tail[-1] if self.stderr_tail else "no output"
+            return f"libcamera-vid exited with code {returncode}: {tail}"
+        if self.started_at is None:
+            return None
+        if self.last_frame_time is None:
+            waited = time.monotonic() - self.started_at
+            if waited > CAMERA_STARTUP_GRACE:
+                return f"No frame received {waited:.1f}s after start"
+        else:
+            stalled = time.monotonic() - self.last_frame_time
+            if stalled > CAMERA_STALL_INTERVALS / max(self.framerate, 1):
+                return f"No new frame for {stalled:.1f}s"
+        return None
+
+    def restart(self, reason):
+        self.log.warning(f"Restarting camera stream (attempt {self.failures + 1}): {reason}")
+        self.terminate_process()
+        self.restart_count += 1
+        self.failures += 1
+        self.next_restart = None
+        self.start()
+
+    def supervise(self):
+        # Called periodically by the shared supervisor thread
+        if not self.enabled:
+            self.next_restart = None
+            return
+        with self.lock:
+            if not self.enabled:
+                return
+            problem = self.check_health()
+            if problem is None:
+                self.next_restart = None
+                return
+            if self.process is not None and self.process.poll() is not None and \
+                    any("no cameras available" in line for line in self.stderr_tail):
+                # Restarting does not help without camera hardware
+                self.log.error("No camera hardware detected")
+                self.record_error("No camera hardware detected")
+                self.enabled = False
+                self.next_restart = None
+                self.terminate_process()
+                return
+            now = time.monotonic()
+            if self.next_restart is None:
+                backoff = min(CAMERA_BACKOFF_INITIAL * 2 ** self.failures, CAMERA_BACKOFF_MAX)
+                self.next_restart = now + backoff
+                self.record_error(problem)
+                self.log.error(f"Camera problem detected: {problem}. Restarting in {backoff}s.")
+            elif now >= self.next_restart:
+                self.restart(problem)
+
+    def health(self):
+        running = self.process is not None and self.process.poll() is None
+        return {
+            'camera_running': running,
+            'camera_restart_count': self.restart_count,
+            'camera_last_error': self.last_error,
+            'camera_last_error_time': self.last_error_time,
+            'camera_restart_pending': self.next_restart is not None,
+            'camera_codec': self.codec,
+            'camera_first_frame_seconds': self.first_frame_seconds,
+            'camera_pipe_size': self.pipe_size,
+        }
+
+    def telemetry(self):
+        now = time.monotonic()
+        running = self.process is not None and self.process.poll() is None
+        return {
+            'camera_uptime': round(now - self.started_at, 1) if running and self.started_at is not None else 0,
+            'camera_last_frame_age': round(now - self.last_frame_time, 1) if self.last_frame_time is not None else None,
+        }
+
+    def frame_received(self, beat):
+        now = time.monotonic()
+        if self.last_frame_time is None and self.started_at is not None:
+            self.first_frame_seconds = round(now - self.started_at, 3)
+            self.log.info(f"First camera frame {self.first_frame_seconds}s after start.")
+        self.last_frame_time = now
+        self.failures = 0
+        beat.beat()
+
+    def stream_ended(self, generation):
+        if generation == self.generation:
+            self.log.error("Camera stream ended unexpectedly.")
+            self.record_error("Camera stream ended unexpectedly")
+
+    def read_frames(self, generation, pipe):
+        # The frame rate is the loop interval, so lag shows frames arriving late from the camera
+        beat = heartbeat(f'read_frames_{self.name}', 1 / self.framerate)
+        # Frames are read straight into one buffer and only copied out once complete
+        buffer = bytearray(READ_BUFFER_SIZE)
+        view = memoryview(buffer)
+        filled = 0
+        scanned = 0  # Where the search for the end marker of the current frame continues
+        try:
+            while self.enabled and generation == self.generation:
+                try:
+                    if filled == len(buffer):
+                        view.release()
+                        buffer.extend(bytes(len(buffer)))
+                        view = memoryview(buffer)
+                        self.log.info(f"Camera read buffer grown to {len(buffer) // 1024} KiB.")
+                    count = pipe.readinto(view[filled:])
+                    if not count:
+                        self.stream_ended(generation)
+                        return
+                    filled += count
+
+                    consumed = 0
+                    while True:
+                        start = buffer.find(JPEG_START, consumed, filled)
+                        if start < 0:
+                            consumed = max(consumed, filled - 1)  # The last byte may begin a marker
+                            break
+                        end = buffer.find(JPEG_END, max(start + 2, scanned), filled)
+                        if end < 0:
+                            consumed = start
+                            scanned = max(start + 2, filled - 1)
+                            break
+                        self.frame_received(beat)
+                        self.publish_frame(bytes(view[start:end + 2]))
+                        consumed = end + 2
+                        scanned = 0
+                    if consumed:
+                        view[:filled - consumed] = view[consumed:filled]
+                        filled -= consumed
+                        scanned = max(scanned - consumed, 0)
+                except Exception as e:
+                    self.log.error(f"Error reading frame: {str(e)}")
+                    if not self.enabled:
+                        return
+                    sleep(0.1)
+        finally:
+            view.release()
+            beat.done()
+
+    def read_h264(self, generation, pipe):
+        # Pictures are counted by the segmenter, so the health checks work the same as for JPEG frames
+        beat = heartbeat(f'read_frames_{self.name}', 1 / self.framerate)
+        segmenter = H264Segmenter(self.framerate, self.segments.reset, self.segments.add)
+        buffer = bytearray(READ_BUFFER_SIZE)
+        view = memoryview(buffer)
+        try:
+            while self.enabled and generation == self.generation:
+                try:
+                    count = pipe.readinto(view)
+                    if not count:
+                        self.stream_ended(generation)
+                        return
+                    if segmenter.feed(view[:count]):
+                        self.frame_received(beat)
+                except Exception as e:
+                    self.log.error(f"Error remuxing H.264 stream: {str(e)}")
+                    if not self.enabled:
+                        return
+                    sleep(0.1)
+        finally:
+            view.release()
+            beat.done()
+
+    def set_publish_limit(self, framerate):
+        every = max(1, round(self.framerate / framerate)) if framerate else 1
+        if every != self.publish_every:
+            self.log.info(f"Publishing 1 of every {every} camera frames" if every > 1 else "Publishing every camera frame")
+        self.publish_every = every
+
+    def publish_frame(self, jpeg):
+        # Viewers, snapshots and subscribers only see the frames that are published
+        self.frames_read += 1
+        if self.frames_read % self.publish_every:
+            self.frames_withheld += 1
+            return
+        with self.frame_condition:
+            self.latest_frame = jpeg
+            self.latest_frame_seq += 1
+            self.latest_frame_time = time.time()
+            self.frame_condition.notify_all()
+
+        for subscriber in self.subscribers:
+            subscriber(jpeg, self.latest_frame_time)
+
+    def snapshot(self):
+        with self.frame_condition:
+            return self.latest_frame, self.latest_frame_seq, self.latest_frame_time
+
+    def gen_frames(self):
+        seen = 0
+        while self.enabled:
+            with self.frame_condition:
+                # Every viewer waits for the next published frame instead of competing for a queue
+                if not self.frame_condition.wait_for(lambda: self.latest_frame_seq != seen, timeout=STREAM_IDLE_TIMEOUT):
+                    self.log.info("No frames for a while, ending video stream.")
+                    return
+                frame, seen = self.latest_frame, self.latest_frame_seq
+            yield (b'--frame\r\n'
+                   b'Content-Type: image/jpeg\r\n\r\n' + frame + b'\r\n')
+
+    def acquire_stream_slot(self, quiet=False):
+        if not stream_slots.acquire():
+            return False
+        with self.stream_clients_lock:
+            self.stream_clients += 1
+        if not quiet:
+            self.log.info(f"Accessed video feed, {self.stream_clients} active, {stream_slots.active} in all.")
+        return True
+
+    def release_stream_slot(self, quiet=False):
+        with self.stream_clients_lock:
+            self.stream_clients -= 1
+        stream_slots.release()
+        if not quiet:
+            self.log.info(f"Video stream closed, {self.stream_clients} active, {stream_slots.active} in all.")
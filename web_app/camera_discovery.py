@@ -0,0 +1,131 @@
+import os
+import re
+import socket
+import logging
+import threading
+
+# Cameras are listed from sysfs metadata, no device is opened
+SYSFS_VIDEO = '/sys/class/video4linux'
+NETLINK_KOBJECT_UEVENT = 15  # Not exported by the socket module
+SENSOR_NAME = re.compile(r'^(imx|ov|ar|gc)\d', re.IGNORECASE)  # Subdevices that are CSI image sensors
+
+
+def read_attribute(path, default=None):
+    try:
+        with open(path) as f:
+            return f.read().strip()
+    except OSError:
+        return default
+
+
+class CameraDiscovery:
+    # Caches the camera list until a video4linux hotplug event, or a change of the sysfs listing
+    # when uevents cannot be received (e.g. in a container)
+    def __init__(self, root=SYSFS_VIDEO):
+        self.root = root
+        self.lock = threading.Lock()
+        self.cache = None
+        self.signature = None
+        self.watching = False
+        self.scans = 0
+
+    def listing(self):
+        try:
+            return tuple(sorted(os.listdir(self.root)))
+        except OSError:
+            return ()
+
+    def invalidate(self):
+        with self.lock:
+            self.cache = None
+
+    def cameras(self):
+        with self.lock:
+            if self.cache is not None and self.watching:
+                return self.cache
+            signature = self.listing()
+            if self.cache is None or signature != self.signature:
+                self.cache = self.scan(signature)
+                self.signature = signature
+            return self.cache
+
+    def scan(self, entries):
+        self.scans += 1
+        sensors = []
+        capture = []
+        for entry in entries:
+            path = os.path.join(self.root, entry)
+            name = read_attribute(os.path.join(path, 'name'), entry)
+            device_path = os.path.realpath(os.path.join(path, 'device'))
+            driver = os.path.realpath(os.path.join(path, 'device', 'driver'))
+            info = {
+                'node': entry,
+                'name': name,
+                'path': f'/dev/{entry}',
+                'bus': device_path,
+                'driver': os.path.basename(driver) if os.path.exists(driver) else None,
+            }
+            if entry.startswith('v4l-subdev') and SENSOR_NAME.match(name):
+                info['kind'] = 'csi'
+                sensors.append(info)
+            elif entry.startswith('video') and read_attribute(os.path.join(path, 'index'), '0') == '0':
+                # Index 0 is the capture node of a device, higher indexes are its metadata nodes
+                usb = self.usb_info(device_path)
+                if usb is None and info['driver'] not in ('uvcvideo',):
+                    continue  # ISP, codec and CSI receiver nodes of the SoC
+                info['kind'] = 'usb'
+                info['index'] = int(entry[len('video'):])  # What cv2.VideoCapture takes
+                info.update(usb or {})
+                capture.append(info)
+
+        # libcamera lists CSI sensors first, then USB cameras
+        cameras = sorted(sensors, key=lambda info: info['bus']) + sorted(capture, key=lambda info: info['index'])
+        for libcamera_index, info in enumerate(cameras):
+            info['libcamera_index'] = libcamera_index
+        logging.info(f"Discovered {len(cameras)} camera(s): {', '.join(info['name'] for info in cameras)}")
+        return cameras
+
+    def usb_info(self, device_path):
+        # The video node hangs off a USB interface, the ids live on its parent device
+        parent = os.path.dirname(device_path)
+        vendor = read_attribute(os.path.join(parent, 'idVendor'))
+        if vendor is None:
+            return None
+        return {
+            'usb_id': f"{vendor}:{read_attribute(os.path.join(parent, 'idProduct'), '')}",
+            'product': read_attribute(os.path.join(parent, 'product')),
+            'serial': read_attribute(os.path.join(parent, 'serial')),
+        }
+
+    def find(self, libcamera_index):
+        for info in self.cameras():
+            if info['libcamera_index'] == libcamera_index:
+                return info
+        return None
+
+    def watch(self):
+        # Invalidates the cache on video4linux uevents; falls back to listing checks when not permitted
+        try:
+            uevents = socket.socket(socket.AF_NETLINK, socket.SOCK_DGRAM, NETLINK_KOBJECT_UEVENT)
+            uevents.bind((0, 1))
+        except (OSError, AttributeError) as e:
+            logging.info(f"No hotplug events for camera discovery ({str(e)}), checking sysfs instead.")
+            return
+        self.watching = True
+        self.invalidate()
+        try:
+            while True:
+                message = uevents.recv(65536)
+                if b'SUBSYSTEM=video4linux' in message:
+                    logging.info("Camera hotplug event, rescanning on next request.")
+                    self.invalidate()
+        finally:
+            self.watching = False
+            uevents.close()
+
+    def start(self):
+        thread = threading.Thread(target=self.watch, daemon=True)
+        thread.start()
+
+
+discovery = CameraDiscovery()
@@ -0,0 +1,44 @@
+import time
+import threading
+from datetime import datetime
+
+
+class SystemClock:
+    # The real time; the methods are the time module's own functions, so the step loop pays no wrapper call
+    monotonic = staticmethod(time.monotonic)
+    sleep = staticmethod(time.sleep)
+    time = staticmethod(time.time)  # Last, from here on time is this attribute rather than the module
+
+    def now(self, tz=None):
+        return datetime.now(tz)
+
+
+class VirtualClock:
+    # Time that only moves when someone sleeps or advances it, for simulations that run days in seconds.
+    # Every thread shares the same time; a sleep returns at once after moving it forward.
+    def __init__(self, start):
+        self.lock = threading.Lock()
+        self.current = start.timestamp() if isinstance(start, datetime) else float(start)
+        self.origin = self.current
+        self.slept = 0.0
+
+    def time(self):
+        return self.current
+
+    def monotonic(self):
+        return self.current - self.origin
+
+    def now(self, tz=None):
+        return datetime.fromtimestamp(self.current, tz)
+
+    def sleep(self, seconds):
+        with self.lock:
+            self.current += max(seconds, 0)
+            self.slept += max(seconds, 0)
+
+    def advance_to(self, timestamp):
+        with self.lock:
+            self.current = max(self.current, timestamp)
+
+
+system_clock = SystemClock()
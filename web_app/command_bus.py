@@ -0,0 +1,144 @@
+import os
+import sys
+import json
+import socket
+import logging
+import selectors
+
+from profiler import heartbeat
+
+# Local command bus: one JSON message per line on a Unix socket, answered in order with an ack.
+# Request {"id": 1, "action": "cw", "coop": "main"} -> reply {"id": 1, "ok": true, "message": "..."}
+BUS_SOCKET = os.environ.get('CHICKEN_DOOR_BUS', '/tmp/chicken_door_bus.sock')
+MAX_MESSAGE = 4096  # Longer lines are a protocol error and close the connection
+CLIENT_TIMEOUT = 5
+HEARTBEAT_INTERVAL = 1  # Longest wait in select, so an idle bus still shows it is alive
+
+
+class CommandBus:
+    # A single thread serves every client with a selector, handler(coop_name, action) returns (message, ok)
+    def __init__(self, path, handler):
+        self.path = path
+        self.handler = handler
+        self.selector = selectors.DefaultSelector()
+        self.commands = 0
+
+    def serve(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        server.bind(self.path)
+        os.chmod(self.path, 0o660)
+        server.listen()
+        server.setblocking(False)
+        self.selector.register(server, selectors.EVENT_READ)
+        logging.info(f"Command bus listening on {self.path}")
+
+        beat = heartbeat('command_bus', HEARTBEAT_INTERVAL)
+        while True:
+            beat.beat()
+            for key, _ in self.selector.select(HEARTBEAT_INTERVAL):
+                if key.data is None:
+                    self.accept(key.fileobj)
+                else:
+                    self.receive(key.fileobj, key.data)
+
+    def accept(self, server):
+        connection, _ = server.accept()
+        # Sends may wait briefly for a slow reader, receives only happen once data is there
+        connection.settimeout(1)
+        self.selector.register(connection, selectors.EVENT_READ, data=bytearray())
+
+    def close(self, connection):
+        self.selector.unregister(connection)
+        connection.close()
+
+    def receive(self, connection, buffer):
+        try:
+            data = connection.recv(MAX_MESSAGE)
+        except OSError:
+            data = b''
+        if not data:
+            self.close(connection)
+            return
+        buffer += data
+        replies = []
+        while b'\n' in buffer:
+            line, _, rest = buffer.partition(b'\n')
+            buffer[:] = rest
+            replies.append(self.process(line))
+        if len(buffer) > MAX_MESSAGE:
+            logging.warning("Command bus message too long, closing the connection.")
+            self.close(connection)
+            return
+        if replies:
+            try:
+                connection.sendall(b''.join(json.dumps(reply).encode() + b'\n' for reply in replies))
+            except OSError:
+                self.close(connection)
+
+    def process(self, line):
+        try:
+            message = json.loads(line)
+            message_id = message.get('id')
+            action = message['action']
+        except (ValueError, KeyError, AttributeError):
+            return {'id': None, 'ok': False, 'message': 'Malformed message'}
+        try:
+            text, ok = self.handler(message.get('coop'), action)
+        except Exception as e:
+            logging.error(f"Command bus action {action} failed: {str(e)}")
+            text, ok = str(e), False
+        self.commands += 1
+        return {'id': message_id, 'ok': ok, 'message': text}
+
+
+class CommandBusClient:
+    # Keeps one connection open, so each command costs a write and a read
+    def __init__(self, path=BUS_SOCKET):
+        self.path = path
+        self.connection = None
+        self.reader = None
+        self.next_id = 0
+
+    def connect(self):
+        self.connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.connection.settimeout(CLIENT_TIMEOUT)
+        self.connection.connect(self.path)
+        self.reader = self.connection.makefile('rb')
+
+    def send(self, action, coop=None):
+        if self.connection is None:
+            self.connect()
+        self.next_id += 1
+        message = {'id': self.next_id, 'action': action}
+        if coop is not None:
+            message['coop'] = coop
+        try:
+            self.connection.sendall(json.dumps(message).encode() + b'\n')
+            reply = self.reader.readline()
+        except OSError:
+            self.close()
+            raise
+        if not reply:
+            self.close()
+            raise ConnectionError("Command bus closed the connection")
+        return json.loads(reply)
+
+    def close(self):
+        if self.connection is not None:
+            self.reader.close()
+            self.connection.close()
+            self.connection = None
+
+
+if __name__ == '__main__':
+    # For cron jobs and home automation: python command_bus.py <action> [coop]
+    if len(sys.argv) < 2:
+        print("Usage: command_bus.py <cw|ccw|open|close|stop|toggle_light> [coop]")
+        sys.exit(2)
+    client = CommandBusClient()
+    reply = client.send(sys.argv[1], sys.argv[2] if len(sys.argv) > 2 else None)
+    client.close()
+    print(reply['message'])
+    sys.exit(0 if reply['ok'] else 1)
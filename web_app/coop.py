@@ -0,0 +1,645 @@
+import os
+import copy
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from zoneinfo import ZoneInfo
+from astral import LocationInfo
+from astral.sun import sun
+
+import gpio
+from camera import CameraStream
+from timelapse import Timelapse
+from governor import governor
+from frame_ring import FrameRingWriter, RING_SLOTS, RING_SLOT_SIZE
+from detection import Detector, DETECTION_INTERVAL, DETECTION_WORKERS, DETECTION_BATCH, DETECTION_QUEUE, \
+    DETECTION_INPUT_SIZE, DETECTION_CONFIDENCE
+from camera_discovery import discovery
+from status_snapshot import StatusSnapshot
+from state_store import StateStore
+from motion_stats import MotionModel
+from power import DriverPower
+from motor import LocalMotor, RemoteMotor, INPUT_PINS, daemon_settings
+from scheduler import DailyScheduler
+from clock import system_clock
+
+# Pin assignments
+DEFAULT_PIN_ASSIGNMENTS = {
+    'SLP_PIN': 17,
+    'DIR_PIN': 20,
+    'STEP_PIN': 21,
+    'BTN_CW_PIN': 5,
+    'BTN_CCW_PIN': 6,
+    'BTN_STOP_PIN': 13,
+    'LIGHT_PIN': 26,
+    'BTN_LIGHT_PIN': 19,
+    'LEVER_CW_PIN': 12,
+    'LEVER_CCW_PIN': 16
+}
+
+# Defaults for a coop, overridden per coop by the config file
+DEFAULT_COOP = {
+    'name': 'main',
+    'gpio_chip': 'gpiochip0',  # Changed from 'gpiochip4' to 'gpiochip0'
+    'spr': 6000,  # Steps per revolution
+    'delay': 0.001,  # Delay between steps
+    'door_open_direction': 'CCW',  # Can be 'CW' or 'CCW'
+    # Location settings for sunrise/sunset calculations
+    'latitude': 53.5396,
+    'longitude': 10.004,
+    'timezone': 'Europe/Berlin',
+    'camera': {'enabled': True, 'index': 0, 'width': 320, 'height': 240, 'framerate': 10, 'quality': 30,
+               'codec': 'mjpeg', 'source': None},
+    'timelapse': {'enabled': True, 'interval': 60, 'retention_days': 30},
+    # JPEG frames in shared memory under /dev/shm for local readers, see frame_ring.py
+    'frame_ring': {'enabled': True, 'slots': RING_SLOTS, 'slot_size': RING_SLOT_SIZE},
+    # Animal detection with a YOLO style ONNX model (exported with NMS off), labels is a file with one class per line
+    'detection': {'enabled': False, 'model': None, 'labels': None, 'backend': 'opencv', 'interval': DETECTION_INTERVAL,
+                  'workers': DETECTION_WORKERS, 'batch': DETECTION_BATCH, 'queue_size': DETECTION_QUEUE,
+                  'input_size': DETECTION_INPUT_SIZE, 'confidence': DETECTION_CONFIDENCE,
+                  'alert_labels': ['fox', 'dog', 'cat', 'bear', 'bird']},
+    'sim_travel_steps': 5000,  # Door travel of the simulated backend
+    'sim_door_position': None,  # Start position of the simulated door in steps from the CCW end, None for halfway
+    # Motor driver power: seconds of holding torque after a move (null holds forever), wake settle
+    # time, and the power draw per state used for the energy estimate
+    'driver': {'hold_time': 30, 'wake_delay': 0.002, 'move_watts': 6.0, 'hold_watts': 3.0, 'sleep_watts': 0.05},
+    # Settings for motor_daemon.py ({'socket': ..., 'cpu': ..., 'priority': ...}); null steps the motor in-process
+    'motor_daemon': None,
+}
+
+TIMELAPSE_DIR = os.path.expanduser("~/timelapse")
+STATE_DIR = os.path.expanduser("~/.chicken_door")
+BUTTON_DEBOUNCE = 0.5  # Seconds a button is ignored after a press
+STATUS_REFRESH_INTERVAL = 1.0  # Seconds between status rebuilds, for changes nobody marked such as a dead camera
+
+# Door position tracking
+POSITION_SAVE_INTERVAL = 1.0  # Minimum seconds between position writes while moving
+POSITION_MARGIN = 200  # Extra steps beyond the expected limit so the lever switch is always reached
+
+# Events that may have been missed during a power cut; of each group only the latest one is caught up
+CATCH_UP_GROUPS = (('door', ('open_door', 'close_door')), ('light', ('light_on_event', 'light_off_event')))
+
+
+class CoopLogAdapter(logging.LoggerAdapter):
+    def process(self, msg, kwargs):
+        return f"[{self.extra['coop']}] {msg}", kwargs
+
+
+class Coop:
+    def __init__(self, config, clock=system_clock):
+        config = {**DEFAULT_COOP, **config}
+        self.name = config['name']
+        self.clock = clock  # Every time read of the door logic goes through this, so a simulation can replace it
+        self.log = CoopLogAdapter(logging.getLogger('coop'), {'coop': self.name})
+        self.gpio_chip = config['gpio_chip']
+        self.pin_assignments = {**DEFAULT_PIN_ASSIGNMENTS, **config.get('pins', {})}
+        self.spr = config['spr']
+        self.delay = config['delay']
+        self.door_open_direction = config['door_open_direction']
+        self.location = LocationInfo(self.name, "Region", ZoneInfo(config['timezone']),
+                                     config['latitude'], config['longitude'])
+        self.sim_travel_steps = config['sim_travel_steps']
+        self.sim_door_position = config['sim_door_position']
+        self.driver_config = {**DEFAULT_COOP['driver'], **config.get('driver', {})}
+        self.motor_daemon = config['motor_daemon']
+
+        self.light_on = False
+        self.recovery = {}  # What the last start restored from the state journal and caught up
+
+        self.chip = None
+        self.motor = None
+        self.power = None
+        self.button_ready_at = {}
+        self.inputs_state = None  # Last buttons and levers read by the input thread
+
+        # Rebuilt by the input thread when marked changed, and once per STATUS_REFRESH_INTERVAL
+        self.snapshot = StatusSnapshot()
+        self.status_dirty = True
+        self.status_refreshed = 0
+        self.startup_ms = {}
+
+        # A single worker per coop serialises door moves without blocking HTTP or input threads
+        self.motor_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f'motor-{self.name}')
+        self.motor_lock = threading.Lock()
+        self.pending_moves = 0
+
+        self.scheduler = DailyScheduler(self.location.timezone, clock)
+
+        # Position in steps from the closed limit switch, None until homed
+        self.state_store = StateStore(os.path.join(STATE_DIR, f'{self.name}.json'), POSITION_SAVE_INTERVAL, clock)
+        self.position = None
+        self.travel_steps = None
+        self.position_uncertainty = 0
+        self.motion = None
+        self.motion_model = MotionModel(clock=clock)
+
+        camera_config = {**DEFAULT_COOP['camera'], **config.get('camera', {})}
+        self.camera = CameraStream(self.name, log=self.log, **camera_config)
+        timelapse_config = {**DEFAULT_COOP['timelapse'], **config.get('timelapse', {})}
+        self.timelapse_enabled = timelapse_config['enabled']
+        self.timelapse = Timelapse(os.path.join(TIMELAPSE_DIR, self.name), timelapse_config['interval'],
+                                   timelapse_config['retention_days'])
+        self.frame_ring_config = {**DEFAULT_COOP['frame_ring'], **config.get('frame_ring', {})}
+        self.frame_ring = None
+        detection_config = {**DEFAULT_COOP['detection'], **config.get('detection', {})}
+        self.detector = None
+        if detection_config.pop('enabled') and self.camera.enabled:
+            self.detector = Detector(self.name, log=self.log, **detection_config)
+
+    def init_gpio(self):
+        gpiod = gpio.load_backend(self.gpio_chip)
+        pins = self.pin_assignments
+
+        self.chip = gpiod.Chip(self.gpio_chip)
+        self.light_line = self.chip.get_line(pins['LIGHT_PIN'])
+
+        # Request lines
+        self.log.info(f"Requesting GPIO lines on {self.gpio_chip}...")
+        consumer = f'chicken_door_{self.name}'
+        self.light_line.request(consumer=consumer, type=gpiod.LINE_REQ_DIR_OUT)
+        if self.motor_daemon is not None:
+            # The daemon owns the motor, button and lever lines
+            settings = daemon_settings(self.name, self.motor_daemon)
+            self.motor = RemoteMotor(settings['socket'], log=self.log)
+            self.log.info(f"Using motor daemon at {settings['socket']}")
+        else:
+            self.motor = LocalMotor(self.chip, pins, consumer, gpiod, self.clock)
+            if isinstance(self.chip, gpio.SimulatedChip):
+                self.chip.door = gpio.SimulatedDoor(self.chip, pins, self.sim_travel_steps, self.sim_door_position)
+        self.log.info("GPIO lines successfully requested.")
+        self.power = DriverPower(self.motor.slp_line, log=self.log, clock=self.clock, **self.driver_config)
+
+    def cleanup(self):
+        if self.motor is not None:
+            self.motor.stop()
+        self.motor_executor.shutdown(wait=True, cancel_futures=True)
+        self.camera.cleanup()
+        if self.detector is not None:
+            self.detector.stop()
+        if self.frame_ring is not None:
+            self.frame_ring.close()
+        if self.chip is None:
+            return
+        self.log.info("Cleaning up GPIO lines and resources...")
+        self.motor.slp_line.set_value(0)  # Put the motor driver to sleep
+        self.motor.release()
+        self.light_line.release()
+        self.log.info("GPIO lines released and chip closed. Cleanup complete.")
+
+    def read_slp_state(self):
+        return self.motor.slp_line.get_value()
+
+    def set_holding_torque(self, enable):
+        # Manual override, otherwise the driver sleeps once the hold time after a move has passed
+        self.power.hold(enable)
+        self.mark_changed()
+        self.log.info(f"Holding torque {'enabled' if enable else 'disabled'} manually. SLP pin is {self.read_slp_state()}.")
+
+    def holding_torque(self):
+        return self.power.awake()
+
+    def read_inputs(self):
+        return dict(zip(INPUT_PINS, self.motor.get_inputs()))
+
+    def lever_pressed(self, direction, inputs=None):
+        inputs = inputs or self.read_inputs()
+        return inputs['LEVER_CW_PIN' if direction == 1 else 'LEVER_CCW_PIN'] == 0
+
+    def open_direction(self):
+        return 1 if self.door_open_direction == 'CW' else 0
+
+    def load_position(self):
+        state = self.state_store.load()
+        self.position = state.get('position')
+        self.travel_steps = state.get('travel_steps')
+        self.motion_model = MotionModel(state.get('motion_model'), self.clock)
+        if state.get('moving') and self.position is not None:
+            # Power was lost mid-move, so up to one save interval of steps went unrecorded
+            self.position_uncertainty = int(POSITION_SAVE_INTERVAL / (2 * self.delay))
+            self.log.warning(f"Door was moving at shutdown, position {self.position} is uncertain by {self.position_uncertainty} steps.")
+        self.log.info(f"Restored door position {self.position} of {self.travel_steps} steps.")
+
+    def save_position(self, moving):
+        # The target lets a move cut short by a power loss be finished after the restart
+        fields = {'position': self.position, 'travel_steps': self.travel_steps, 'moving': moving,
+                  'door_target': self.motion['target'] if moving and self.motion else None}
+        if moving:
+            self.state_store.update(**fields)  # Written by write_due() on the input thread
+        else:
+            self.state_store.flush(motion_model=self.motion_model.to_dict(), **fields)
+
+    def plan_steps(self, direction):
+        # A full cycle may not run past what the travel model considers normal
+        target = 'open' if direction == self.open_direction() else 'close'
+        limit = self.motion_model.step_limit(target)
+        if limit is not None and self.lever_pressed(1 - direction):
+            return min(self.spr, limit)
+        # Only the remaining distance plus a margin, the lever switch still ends the move
+        if self.position is None:
+            return self.spr
+        margin = POSITION_MARGIN + self.position_uncertainty
+        if direction == self.open_direction():
+            if self.travel_steps is None:
+                return self.spr
+            remaining = self.travel_steps - self.position
+        else:
+            remaining = self.position
+        return max(0, min(self.spr, remaining + margin))
+
+    def rotate_motor(self, direction, steps, delay):
+        self.log.info(f"Starting motor rotation: {'Clockwise' if direction == 1 else 'Counterclockwise'} for {steps} steps with {delay}s delay.")
+        # Wake the driver, waiting for it to settle if it was asleep
+        self.power.wake()
+
+        opening = direction == self.open_direction()
+        sign = 1 if opening else -1
+        from_limit = self.lever_pressed(1 - direction)
+        self.motion = {'target': 'open' if opening else 'close', 'steps_planned': steps, 'steps_done': 0}
+        start = self.position
+        self.save_position(moving=True)
+        self.mark_changed()
+
+        def on_progress(steps_done):
+            # Runs inside the step loop, so the position only goes to memory; the input thread writes it
+            self.motion['steps_done'] = steps_done
+            if start is not None:
+                self.position = start + sign * steps_done
+            self.save_position(moving=True)
+            self.mark_changed()
+
+        # Streams and background work are throttled while the step loop runs
+        governor.motion_started(self.name)
+        try:
+            steps_done, reason = self.motor.run(direction, steps, delay, on_progress)
+        finally:
+            governor.motion_finished(self.name, self.motor.last_timing)
+        self.log.info(f"Motor rotation ended ({reason}) after {steps_done} steps.")
+        problem = self.check_motion(opening, from_limit, steps, steps_done, reason)
+        if problem:
+            reason = 'anomaly'
+        self.finish_motion(opening, reason)
+
+        self.power.release()
+        self.log.info(f"Rotation completed or stopped. Holding torque for {self.power.hold_time}s.")
+        return steps_done, reason
+
+    def check_motion(self, opening, from_limit, steps, steps_done, reason):
+        target = 'open' if opening else 'close'
+        if reason == 'stop':
+            return None
+        problem = None
+        if from_limit:
+            problem = self.motion_model.record(target, steps_done, reason == 'limit')
+        if problem is None and reason == 'complete' and steps < self.spr:
+            # The move was bounded by the known position and still missed the switch
+            problem = self.motion_model.flag(target, steps_done, f"limit not reached within {steps_done} planned steps")
+        if problem:
+            self.log.error(f"Door {target} anomaly: {problem}. Door may be jammed or the motor missed steps.")
+        return problem
+
+    def finish_motion(self, opening, reason):
+        if reason == 'anomaly':
+            # Either the count or the switch is wrong, the next limit switch re-homes the door
+            if self.lever_pressed(1 - self.open_direction()):
+                self.position = 0
+            elif self.lever_pressed(self.open_direction()):
+                self.position = self.travel_steps
+            else:
+                self.position = None
+            self.position_uncertainty = 0
+        elif reason == 'limit':
+            if not opening:
+                # The closed limit switch is the reference point
+                self.position = 0
+                self.position_uncertainty = 0
+            elif self.position is not None and self.position_uncertainty == 0:
+                if self.travel_steps != self.position:
+                    self.log.info(f"Learned door travel of {self.position} steps.")
+                self.travel_steps = self.position
+            elif self.travel_steps is not None:
+                self.position = self.travel_steps
+                self.position_uncertainty = 0
+        self.motion = None
+        self.save_position(moving=False)
+        self.mark_changed()
+
+    def door_state(self, inputs=None):
+        if self.motion is not None:
+            return 'opening' if self.motion['target'] == 'open' else 'closing'
+        inputs = inputs or self.read_inputs()
+        if self.lever_pressed(self.open_direction(), inputs):
+            return 'open'
+        if self.lever_pressed(1 - self.open_direction(), inputs):
+            return 'closed'
+        return 'between'
+
+    def position_status(self, inputs=None):
+        percent = None
+        if self.position is not None and self.travel_steps:
+            percent = round(100 * min(max(self.position / self.travel_steps, 0), 1), 1)
+        motion = None
+        if self.motion is not None:
+            motion = {**self.motion, 'progress': round(self.motion['steps_done'] / max(self.motion['steps_planned'], 1), 3)}
+        return {
+            'door_state': self.door_state(inputs),
+            'door_position': self.position,
+            'door_travel_steps': self.travel_steps,
+            'door_open_percent': percent,
+            'door_motion': motion,
+            'door_travel_model': self.motion_model.summary(),
+        }
+
+    def motor_busy(self):
+        return self.pending_moves > 0
+
+    def run_move(self, direction):
+        try:
+            self.rotate_motor(direction, self.plan_steps(direction), self.delay)
+        except Exception as e:
+            self.log.error(f"Motor move failed: {str(e)}")
+        finally:
+            with self.motor_lock:
+                self.pending_moves -= 1
+
+    def move(self, direction, queue_if_busy=False):
+        # Manual commands are refused while the door moves, scheduled ones queue behind the current move
+        with self.motor_lock:
+            if self.pending_moves and not queue_if_busy:
+                return False
+            self.pending_moves += 1
+        self.motor_executor.submit(self.run_move, direction)
+        return True
+
+    def stop(self):
+        self.motor.stop()
+
+    def set_light(self, state):
+        if state != self.light_on:
+            self.light_on = state
+            self.light_line.set_value(1 if self.light_on else 0)
+            self.state_store.flush(light_on=self.light_on)
+            self.mark_changed()
+            self.log.info(f"Light turned {'on' if self.light_on else 'off'}")
+        else:
+            self.log.info(f"Light is already {'on' if self.light_on else 'off'}")
+
+    def toggle_light(self):
+        self.set_light(not self.light_on)
+
+    def command(self, action, source):
+        # Shared by the web API and the physical buttons; returns (message, ok)
+        if action in ('open', 'close'):
+            opening = action == 'open'
+            action = 'cw' if (self.open_direction() == 1) == opening else 'ccw'
+        if action in ('cw', 'ccw'):
+            direction = 1 if action == 'cw' else 0
+            label = 'clockwise' if action == 'cw' else 'counterclockwise'
+            if self.lever_pressed(direction):
+                self.log.info(f"{label.capitalize()} rotation blocked by lever switch.")
+                return f'{label.capitalize()} rotation blocked', True
+            if not self.move(direction):
+                self.log.info(f"{label.capitalize()} rotation ignored, motor is busy.")
+                return 'Motor is busy', True
+            self.log.info(f"Received {source} command: Rotate {label}.")
+            return f'Rotating {label}', True
+        elif action == 'stop':
+            self.log.info(f"Received {source} command: Stop motor.")
+            self.stop()
+            return 'Motor stopped', True
+        elif action == 'toggle_light':
+            self.log.info(f"Received {source} command: Toggle light.")
+            self.toggle_light()
+            return f'Light toggled {"on" if self.light_on else "off"}', True
+        self.log.warning(f"Received invalid {source} command: {action}.")
+        return 'Invalid action', False
+
+    def poll_buttons(self):
+        # Called by the shared input thread, so it must never block
+        now = self.clock.monotonic()
+        inputs = self.read_inputs()
+        if inputs != self.inputs_state:
+            self.inputs_state = inputs
+            self.mark_changed()
+        buttons = (('cw', 'BTN_CW_PIN'), ('ccw', 'BTN_CCW_PIN'), ('stop', 'BTN_STOP_PIN'),
+                   ('toggle_light', 'BTN_LIGHT_PIN'))
+        for action, pin in buttons:
+            if now < self.button_ready_at.get(action, 0) or inputs[pin] != 0:
+                continue
+            self.button_ready_at[action] = now + BUTTON_DEBOUNCE
+            if action in ('cw', 'ccw') and self.lever_pressed(1 if action == 'cw' else 0, inputs):
+                continue
+            self.command(action, 'button')
+
+    def get_sun_times(self, day=None):
+        day = day or self.clock.now(self.location.timezone).date()
+        s = sun(self.location.observer, date=day, tzinfo=self.location.timezone)
+        return s['sunrise'], s['sunset']
+
+    def open_door(self):
+        self.log.info("Automatic door opening triggered")
+        self.record_event('door')
+        self.move(1 if self.door_open_direction == 'CW' else 0, queue_if_busy=True)
+
+    def close_door(self):
+        self.log.info("Automatic door closing triggered")
+        self.record_event('door')
+        self.move(0 if self.door_open_direction == 'CW' else 1, queue_if_busy=True)
+
+    def light_on_event(self):
+        self.record_event('light')
+        self.set_light(True)
+
+    def light_off_event(self):
+        self.record_event('light')
+        self.set_light(False)
+
+    def record_event(self, group):
+        # Journaled, so after a restart the events of the outage can be told from those that ran
+        handled = {**self.state_store.get('handled_events', {}), group: self.clock.time()}
+        self.state_store.flush(handled_events=handled)
+
+    def get_adjusted_sun_times(self, day=None):
+        sunrise, sunset = self.get_sun_times(day)
+        adjusted_sunrise = sunrise - timedelta(minutes=20)
+        adjusted_sunset = sunset + timedelta(minutes=30)
+        return adjusted_sunrise, adjusted_sunset
+
+    def event_times(self, day=None):
+        # The scheduled minute of every sun event of a day
+        sunrise, sunset = self.get_adjusted_sun_times(day)
+        times = {
+            'open_door': sunrise,
+            'light_on_event': sunset - timedelta(minutes=15),
+            'close_door': sunset,
+            'light_off_event': sunset + timedelta(minutes=15),
+        }
+        return {name: moment.replace(second=0, microsecond=0) for name, moment in times.items()}
+
+    def schedule_door_events(self):
+        # Clear all existing schedules
+        self.scheduler.clear()
+
+        times = self.event_times()
+        for name, moment in times.items():
+            self.scheduler.every_day_at(moment.strftime("%H:%M"), getattr(self, name))
+
+        # Schedule this function to run again at midnight
+        self.scheduler.every_day_at("00:01", self.schedule_door_events)
+
+        self.log.info(f"Scheduled events: Open at {times['open_door'].strftime('%H:%M')}, Close at {times['close_door'].strftime('%H:%M')}")
+
+    def restore_state(self):
+        # Runs right after the GPIO lines are requested, so the light is back before anything else starts
+        started = time.perf_counter()
+        self.load_position()
+        light_on = self.state_store.get('light_on')
+        if light_on is not None:
+            self.light_on = light_on
+            self.light_line.set_value(1 if light_on else 0)
+        self.recovery = {'restored_ms': round((time.perf_counter() - started) * 1000, 3), 'light_on': light_on,
+                         'caught_up': [], 'resumed': None}
+        self.log.info(f"Restored state in {self.recovery['restored_ms']} ms, light {'unknown' if light_on is None else 'on' if light_on else 'off'}.")
+
+    def catch_up_missed_events(self):
+        # Events that fell into an outage ran neither on time nor since; only the latest of each group matters,
+        # e.g. after a night without power the door closes once instead of opening and closing
+        handled = self.state_store.get('handled_events')
+        if handled is None:
+            self.log.info("No journaled events yet, nothing to catch up.")
+            return
+        now = self.clock.time()
+        today = self.clock.now(self.location.timezone).date()
+        due = [(moment, name) for day in (today - timedelta(days=1), today)
+               for name, moment in self.event_times(day).items() if moment.timestamp() <= now]
+        for group, names in CATCH_UP_GROUPS:
+            if group not in handled:
+                # Like a first boot for this group: without a journaled run nothing tells a missed event apart
+                self.log.info(f"No journaled {group} events yet, nothing to catch up for them.")
+                continue
+            latest = max((event for event in due if event[1] in names), key=lambda event: event[0].timestamp(), default=None)
+            if latest is None or latest[0].timestamp() <= handled[group]:
+                continue
+            self.log.warning(f"Missed {latest[1]} at {latest[0].strftime('%Y-%m-%d %H:%M')}, running it now.")
+            self.recovery['caught_up'].append({'event': latest[1], 'due': latest[0].isoformat()})
+            getattr(self, latest[1])()
+
+    def resume_interrupted_move(self):
+        # A move cut short by the outage is finished, unless a caught up door event has decided otherwise
+        target = self.state_store.get('door_target')
+        door_events = dict(CATCH_UP_GROUPS)['door']
+        if not self.state_store.get('moving') or not target or \
+                any(event['event'] in door_events for event in self.recovery['caught_up']):
+            return
+        opening = target == 'open'
+        self.log.warning(f"Door was {'opening' if opening else 'closing'} when power was lost, finishing the move.")
+        self.recovery['resumed'] = target
+        self.move(self.open_direction() if opening else 1 - self.open_direction(), queue_if_busy=True)
+
+    def get_next_scheduled_times(self):
+        names = {
+            'open_door': 'next_open',
+            'close_door': 'next_close',
+            'light_on_event': 'next_light_on',
+            'light_off_event': 'next_light_off',
+        }
+        times = dict.fromkeys(names.values())
+        for job in self.scheduler.get_jobs():
+            key = names.get(job.job_func.__name__)
+            if key:
+                times[key] = job.next_run.strftime("%H:%M")
+        return times
+
+    def mark_changed(self):
+        self.status_dirty = True
+
+    def refresh_status(self):
+        # Called by the input thread, so status requests never build a dict or touch GPIO
+        if self.status_dirty or self.clock.monotonic() - self.status_refreshed >= STATUS_REFRESH_INTERVAL:
+            self.publish_status()
+
+    def publish_status(self):
+        # Also called by control requests before they reply, so a poll right after the reply sees the change
+        self.status_dirty = False
+        self.status_refreshed = self.clock.monotonic()
+        self.snapshot.update(self.status())
+
+    def status(self):
+        inputs = self.inputs_state or self.read_inputs()
+        return {
+            'name': self.name,
+            'spr': self.spr,
+            'delay': self.delay,
+            'light_on': self.light_on,
+            'motor_busy': self.motor_busy(),
+            'camera_on': self.camera.enabled,
+            'camera_width': self.camera.width,
+            'camera_height': self.camera.height,
+            'camera_framerate': self.camera.framerate,
+            'camera_quality': self.camera.quality,
+            'pin_assignments': dict(self.pin_assignments),
+            'holding_torque': self.holding_torque(),
+            'lever_cw_pressed': inputs['LEVER_CW_PIN'] == 0,
+            'lever_ccw_pressed': inputs['LEVER_CCW_PIN'] == 0,
+            'door_open_direction': self.door_open_direction,
+            **self.position_status(inputs),
+            **self.power.status(),
+            **self.motor.status(),
+            **self.camera.health(),
+            'startup_ms': self.startup_ms,
+            'recovery': copy.deepcopy(self.recovery),  # Copied, the snapshot must not share live objects
+        }
+
+    def telemetry(self):
+        # Time based counters, served uncached by /telemetry so they do not change the status ETag every second
+        return {
+            'name': self.name,
+            **self.power.telemetry(),
+            **self.camera.telemetry(),
+            'detection': self.detector.status() if self.detector is not None else None,
+        }
+
+    def start(self):
+        self.init_gpio()
+        self.restore_state()
+        self.log.info(f"Starting coop with door open direction: {self.door_open_direction}")
+
+        initial_slp_state = self.read_slp_state()
+        self.log.info(f"Initial SLP pin state: {initial_slp_state}")
+
+        self.power.start()
+
+        self.log.info(f"After initialization: Motor driver is {self.power.state}, SLP pin state is {self.read_slp_state()}")
+
+        self.schedule_door_events()
+        self.catch_up_missed_events()
+        self.resume_interrupted_move()
+        self.inputs_state = self.read_inputs()
+        self.refresh_status()
+
+    def start_camera(self):
+        cameras = discovery.cameras()
+        if self.camera.enabled and cameras and discovery.find(self.camera.index) is None:
+            self.log.warning(f"Camera index {self.camera.index} not among discovered cameras: "
+                             f"{', '.join(info['name'] for info in cameras)}")
+        # Only for a coop with a camera, the ring takes slots * slot_size of RAM
+        if self.frame_ring_config['enabled'] and self.camera.enabled and self.camera.codec == 'mjpeg':
+            try:
+                self.frame_ring = FrameRingWriter(self.name, self.frame_ring_config['slots'],
+                                                  self.frame_ring_config['slot_size'], log=self.log)
+                self.camera.subscribers.append(self.frame_ring.on_frame)
+            except OSError as e:
+                self.log.warning(f"Frame ring not available: {e}")
+        if self.detector is not None and self.camera.codec == 'mjpeg' and self.detector.start():
+            self.camera.subscribers.append(self.detector.on_frame)
+        if self.camera.enabled:
+            with self.camera.lock:
+                if not self.camera.start():
+                    self.log.warning("Camera initialization failed, the supervisor retries it")
+
+        if self.timelapse_enabled:
+            self.camera.subscribers.append(self.timelapse.on_frame)
+            self.timelapse.start()
+        governor.register(self.camera, self.timelapse if self.timelapse_enabled else None)
+
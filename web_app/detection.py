@@ -0,0 +1,307 @@
+import os
+import time
+import logging
+import threading
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
+
+from governor import governor
+
+# Optional predator detection: frames are sampled from the camera at a low rate and run through a YOLO style
+# ONNX model on a pool of worker processes, so inference never holds the GIL of the streaming process.
+# Queues are bounded everywhere; when the workers fall behind, the oldest frames are dropped, not delayed.
+DETECTION_INTERVAL = 1.0  # Seconds between sampled frames
+DETECTION_QUEUE = 8  # Sampled frames waiting for a worker, the oldest is dropped beyond this
+DETECTION_BATCH = 4  # Newest frames handed to a worker at once, only reached when the workers are behind
+DETECTION_MAX_AGE = 5  # Seconds after which a waiting frame is too old to be worth a detection
+DETECTION_WORKERS = 1
+DETECTION_NICE = 10  # Worker processes yield to the web app and the motor
+DETECTION_INPUT_SIZE = 640  # Square input of the model
+DETECTION_CONFIDENCE = 0.5
+NMS_THRESHOLD = 0.45
+DETECTION_EVENTS_KEPT = 200
+LATENCY_WINDOW = 100  # Frames the latency statistics cover
+ALERT_COOLDOWN = 60  # Seconds before the same label is logged as an alert again
+
+# State of a worker process, loaded once by init_worker
+worker = {}
+
+
+def init_worker(model_path, backend, input_size):
+    os.nice(DETECTION_NICE)
+    import cv2
+    import numpy as np
+    worker.update(cv2=cv2, np=np, backend=backend, input_size=input_size, batched=True)
+    if backend == 'onnxruntime':
+        import onnxruntime
+        options = onnxruntime.SessionOptions()
+        options.intra_op_num_threads = 1
+        session = onnxruntime.InferenceSession(model_path, options, providers=['CPUExecutionProvider'])
+        worker['session'] = session
+        worker['input_name'] = session.get_inputs()[0].name
+    else:
+        cv2.setNumThreads(1)
+        worker['net'] = cv2.dnn.readNet(model_path)
+
+
+def infer(blob):
+    if worker['backend'] == 'onnxruntime':
+        return worker['session'].run(None, {worker['input_name']: blob})[0]
+    net = worker['net']
+    net.setInput(blob)
+    return net.forward()
+
+
+def detect_batch(jpegs, confidence):
+    # Runs in a worker process: decode, one forward pass for the whole batch, then boxes per frame
+    cv2, np = worker['cv2'], worker['np']
+    images = [cv2.imdecode(np.frombuffer(jpeg, np.uint8), cv2.IMREAD_COLOR) for jpeg in jpegs]
+    # A corrupt frame gets no detections instead of failing the batch
+    decoded = [image for image in images if image is not None]
+    if not decoded:
+        return {'latency_ms': None, 'undecodable': len(images), 'detections': [[] for _ in images]}
+    latency_ms, results = run_batch(decoded, confidence)
+    results = iter(results)
+    detections = [next(results) if image is not None else [] for image in images]
+    return {'latency_ms': latency_ms, 'undecodable': len(images) - len(decoded), 'detections': detections}
+
+
+def run_batch(images, confidence):
+    cv2, np, size = worker['cv2'], worker['np'], worker['input_size']
+    started = time.perf_counter()
+    blob = cv2.dnn.blobFromImages(images, 1 / 255, (size, size), swapRB=True, crop=False)
+    if worker['batched']:
+        try:
+            outputs = infer(blob)
+        except Exception:
+            # Models exported with a fixed batch size of one
+            worker['batched'] = False
+    if not worker['batched']:
+        outputs = np.concatenate([infer(blob[i:i + 1]) for i in range(len(images))])
+    latency_ms = (time.perf_counter() - started) * 1000 / len(images)
+    return latency_ms, [decode_output(output, image.shape, size, confidence) for output, image in zip(outputs, images)]
+
+
+def decode_output(output, shape, size, confidence):
+    # YOLOv8 style (4 + classes, anchors) or YOLOv5 style (anchors, 5 + classes with objectness)
+    cv2, np = worker['cv2'], worker['np']
+    if output.shape[0] < output.shape[1]:
+        output = output.T
+        scores = output[:, 4:]
+    else:
+        scores = output[:, 5:] * output[:, 4:5]
+    classes = scores.argmax(axis=1)
+    best = scores[np.arange(len(scores)), classes]
+    keep = best >= confidence
+    if not keep.any():
+        return []
+    height, width = shape[:2]
+    cx, cy, w, h = (output[keep, i] for i in range(4))
+    boxes = np.stack([(cx - w / 2) * width / size, (cy - h / 2) * height / size,
+                      w * width / size, h * height / size], axis=1)
+    classes, best = classes[keep], best[keep]
+    detections = []
+    for index in np.array(cv2.dnn.NMSBoxes(boxes.tolist(), best.tolist(), confidence, NMS_THRESHOLD)).flatten():
+        x, y, w, h = boxes[index]
+        detections.append({'class_id': int(classes[index]), 'confidence': round(float(best[index]), 3),
+                           'box': [int(max(x, 0)), int(max(y, 0)), int(w), int(h)]})
+    return detections
+
+
+def load_labels(path):
+    if not path:
+        return []
+    with open(path) as f:
+        return [line.strip() for line in f if line.strip()]
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return round(values[min(len(values) - 1, int(fraction * len(values)))], 1) if values else None
+
+
+class Detector:
+    def __init__(self, name, model, labels=None, backend='opencv', interval=DETECTION_INTERVAL,
+                 workers=DETECTION_WORKERS, batch=DETECTION_BATCH, queue_size=DETECTION_QUEUE,
+                 input_size=DETECTION_INPUT_SIZE, confidence=DETECTION_CONFIDENCE, alert_labels=(), log=None):
+        self.name = name
+        self.model = model
+        self.labels_path = labels
+        self.labels = []
+        self.backend = backend
+        self.interval = interval
+        self.workers = workers
+        self.batch = batch
+        self.input_size = input_size
+        self.confidence = confidence
+        self.alert_labels = set(alert_labels)
+        self.log = log or logging.getLogger(__name__)
+
+        self.pool = None
+        self.running = False
+        self.condition = threading.Condition()
+        self.pending = deque(maxlen=queue_size)  # (jpeg, capture timestamp), appending to a full one drops the oldest
+        self.in_flight = 0  # Batches handed to workers, at most one per worker
+        self.last_sample = 0
+        self.dispatch_thread = None
+
+        self.events = deque(maxlen=DETECTION_EVENTS_KEPT)
+        self.next_event_id = 1
+        self.subscribers = []  # Callables receiving every detection event; they must not block
+        self.last_alert = {}
+
+        self.sampled = 0
+        self.processed = 0
+        self.dropped_full = 0
+        self.dropped_stale = 0
+        self.batches = 0
+        self.errors = 0
+        self.undecodable = 0
+        self.queue_peak = 0
+        self.inference_ms = deque(maxlen=LATENCY_WINDOW)
+        self.end_to_end_ms = deque(maxlen=LATENCY_WINDOW)
+
+    def start(self):
+        if not self.model or not os.path.exists(self.model):
+            self.log.error(f"Detection model {self.model} not found, detection stays off.")
+            return False
+        try:
+            self.labels = load_labels(self.labels_path)
+        except OSError as e:
+            self.log.warning(f"Detection labels not readable, events carry class numbers: {e}")
+        self.pool = self.new_pool()
+        self.running = True
+        self.dispatch_thread = threading.Thread(target=self.dispatch, name=f'detection-{self.name}', daemon=True)
+        self.dispatch_thread.start()
+        self.log.info(f"Detection started with {self.model} on {self.workers} {self.backend} worker(s), "
+                      f"one frame every {self.interval}s.")
+        return True
+
+    def new_pool(self):
+        # Spawned, not forked, so workers do not inherit the threads and locks of the web app
+        return ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context('spawn'),
+                                   initializer=init_worker, initargs=(self.model, self.backend, self.input_size))
+
+    def stop(self):
+        with self.condition:
+            self.running = False
+            self.condition.notify_all()
+        if self.pool is not None:
+            self.pool.shutdown(wait=False, cancel_futures=True)
+            self.pool = None
+
+    def on_frame(self, jpeg, timestamp):
+        # Camera subscriber, so it only samples and queues
+        if not self.running or governor.background_paused or timestamp - self.last_sample < self.interval:
+            return
+        self.last_sample = timestamp
+        with self.condition:
+            if len(self.pending) == self.pending.maxlen:
+                self.dropped_full += 1
+            self.pending.append((jpeg, timestamp))
+            self.sampled += 1
+            self.queue_peak = max(self.queue_peak, len(self.pending))
+            self.condition.notify()
+
+    def dispatch(self):
+        while True:
+            with self.condition:
+                self.condition.wait_for(lambda: not self.running or (self.pending and self.in_flight < self.workers))
+                if not self.running:
+                    return
+                # The newest frames that waited while the workers were busy go as one batch, older ones and
+                # frames gone stale are skipped, so a slow worker costs detections rather than delay
+                while len(self.pending) > self.batch:
+                    self.pending.popleft()
+                    self.dropped_stale += 1
+                now = time.time()
+                frames = []
+                while self.pending:
+                    jpeg, timestamp = self.pending.popleft()
+                    if now - timestamp > DETECTION_MAX_AGE:
+                        self.dropped_stale += 1
+                    else:
+                        frames.append((jpeg, timestamp))
+                if not frames:
+                    continue
+                self.in_flight += 1
+                pool = self.pool
+            try:
+                future = pool.submit(detect_batch, [jpeg for jpeg, _ in frames], self.confidence)
+            except (BrokenProcessPool, RuntimeError) as e:
+                self.batch_failed(e)
+                continue
+            future.add_done_callback(lambda future, frames=frames: self.batch_done(future, frames))
+
+    def batch_failed(self, error):
+        self.errors += 1
+        self.log.error(f"Detection worker failed: {error}")
+        with self.condition:
+            self.in_flight -= 1
+            if isinstance(error, BrokenProcessPool) and self.running:
+                # A worker died, e.g. out of memory; a new pool starts with the next batch
+                self.pool.shutdown(wait=False, cancel_futures=True)
+                self.pool = self.new_pool()
+            self.condition.notify_all()
+
+    def batch_done(self, future, frames):
+        try:
+            result = future.result()
+        except Exception as e:
+            self.batch_failed(e)
+            return
+        with self.condition:
+            self.in_flight -= 1
+            self.condition.notify_all()
+        now = time.time()
+        self.batches += 1
+        self.processed += len(frames)
+        self.undecodable += result['undecodable']
+        for (_, timestamp), detections in zip(frames, result['detections']):
+            if result['latency_ms'] is not None:
+                self.inference_ms.append(result['latency_ms'])
+            self.end_to_end_ms.append((now - timestamp) * 1000)
+            for detection in detections:
+                self.emit(timestamp, detection)
+
+    def emit(self, timestamp, detection):
+        class_id = detection['class_id']
+        label = self.labels[class_id] if class_id < len(self.labels) else f'class_{class_id}'
+        event = {'id': self.next_event_id, 'coop': self.name,
+                 'time': datetime.fromtimestamp(timestamp).isoformat(timespec='milliseconds'),
+                 'label': label, 'confidence': detection['confidence'], 'box': detection['box'],
+                 'alert': label in self.alert_labels}
+        self.next_event_id += 1
+        self.events.append(event)
+        if event['alert'] and timestamp - self.last_alert.get(label, 0) >= ALERT_COOLDOWN:
+            self.last_alert[label] = timestamp
+            self.log.warning(f"Detected {label} ({event['confidence']:.0%}) at {event['box']}")
+        for subscriber in self.subscribers:
+            subscriber(event)
+
+    def recent_events(self, since=0):
+        return [event for event in list(self.events) if event['id'] > since]
+
+    def status(self):
+        inference = list(self.inference_ms)
+        end_to_end = list(self.end_to_end_ms)
+        return {
+            'running': self.running,
+            'queue_depth': len(self.pending),
+            'queue_peak': self.queue_peak,
+            'in_flight': self.in_flight,
+            'sampled': self.sampled,
+            'processed': self.processed,
+            'dropped_queue_full': self.dropped_full,
+            'dropped_stale': self.dropped_stale,
+            'batches': self.batches,
+            'errors': self.errors,
+            'undecodable': self.undecodable,
+            'inference_ms_mean': round(sum(inference) / len(inference), 1) if inference else None,
+            'inference_ms_p95': percentile(inference, 0.95),
+            'end_to_end_ms_p95': percentile(end_to_end, 0.95),
+            'events': self.next_event_id - 1,
+        }
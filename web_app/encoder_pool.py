@@ -0,0 +1,114 @@
+import queue
+import logging
+import threading
+
+import numpy as np
+
+# Encoder pool settings
+ENCODER_SLOTS_PER_WORKER = 2  # Ring slots per worker, so every worker has a frame queued behind the current one
+
+
+class EncoderPool:
+    # Encodes frames to JPEG on several threads and hands them out in capture order.
+    # cv2.imencode releases the GIL, so threads use all cores without pickling frames to other processes.
+    # Frames are copied into a ring of preallocated slots, allocated from the first frame's shape and again
+    # whenever the shape or dtype changes, e.g. after the camera is reconfigured.
+    def __init__(self, cv2, workers=4, quality=95, slots=None):
+        self.cv2 = cv2
+        self.workers = workers
+        self.quality = quality
+        self.slot_count = slots or workers * ENCODER_SLOTS_PER_WORKER
+        self.ring = None
+        self.free_slots = queue.Queue()
+        self.work = queue.Queue()
+
+        self.results = {}
+        self.results_condition = threading.Condition()
+        self.next_submit = 0
+        self.next_output = 0
+        self.running = False
+        self.threads = []
+
+        self.encoded = 0
+        self.dropped = 0
+        self.failed = 0
+
+    def start(self):
+        self.running = True
+        for i in range(self.workers):
+            thread = threading.Thread(target=self.encode_frames, name=f'jpeg-encoder-{i}', daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    def stop(self):
+        self.running = False
+        for _ in self.threads:
+            self.work.put(None)
+        for thread in self.threads:
+            thread.join(timeout=2)
+        self.threads = []
+        with self.results_condition:
+            self.results_condition.notify_all()
+
+    def allocate(self, frame):
+        # Jobs still queued keep the old ring and return their slots to its queue, so nothing is overwritten
+        self.ring = np.empty((self.slot_count,) + frame.shape, dtype=frame.dtype)
+        self.free_slots = queue.Queue()
+        for slot in range(self.slot_count):
+            self.free_slots.put(slot)
+        logging.info(f"Encoder ring of {self.slot_count} x {frame.shape} frames, {self.ring.nbytes // 1024} KiB")
+
+    def submit(self, frame, quality=None):
+        # Called by the capture thread; drops the frame when every slot is still being encoded
+        if self.ring is None or self.ring.shape[1:] != frame.shape or self.ring.dtype != frame.dtype:
+            self.allocate(frame)
+        # Encoded frames waiting for a slow reader count too, so memory stays bounded
+        if self.next_submit - self.next_output >= self.slot_count:
+            self.dropped += 1
+            return None
+        try:
+            slot = self.free_slots.get_nowait()
+        except queue.Empty:
+            self.dropped += 1
+            return None
+        np.copyto(self.ring[slot], frame)
+        seq = self.next_submit
+        self.next_submit += 1
+        self.work.put((seq, self.ring, self.free_slots, slot, quality or self.quality))
+        return seq
+
+    def encode_frames(self):
+        while self.running:
+            job = self.work.get()
+            if job is None:
+                return
+            seq, ring, free_slots, slot, quality = job
+            try:
+                ok, buffer = self.cv2.imencode('.jpg', ring[slot], [self.cv2.IMWRITE_JPEG_QUALITY, quality])
+                jpeg = buffer.tobytes() if ok else None
+            except Exception as e:
+                logging.error(f"Failed to encode frame {seq}: {str(e)}")
+                jpeg = None
+            free_slots.put(slot)
+            with self.results_condition:
+                self.results[seq] = jpeg
+                self.results_condition.notify_all()
+
+    def get(self, timeout=None):
+        # Next encoded frame in submission order, or None on timeout or stop
+        with self.results_condition:
+            while True:
+                if self.next_output in self.results:
+                    jpeg = self.results.pop(self.next_output)
+                    self.next_output += 1
+                    if jpeg is None:
+                        self.failed += 1
+                        continue
+                    self.encoded += 1
+                    return jpeg
+                if not self.running or not self.results_condition.wait(timeout):
+                    return None
+
+    def stats(self):
+        return {'workers': self.workers, 'quality': self.quality, 'slots': self.slot_count,
+                'encoded': self.encoded, 'dropped': self.dropped, 'failed': self.failed}
@@ -0,0 +1,371 @@
+import sys
+import time
+import struct
+import threading
+from collections import deque
+
+# Remuxes the H.264 Annex B stream of libcamera-vid --codec h264 into fragmented MP4 for Media Source Extensions.
+# Nothing is decoded: NAL units are only re-framed with length prefixes, one fragment per GOP.
+TIMESCALE = 90000  # Media time units per second, the usual one for video
+SEGMENTS_KEPT = 10  # Fragments kept for viewers, about 20 s with a 2 s GOP
+SEGMENT_WAIT = 10  # Seconds a request for the next fragment waits for it
+
+NAL_SLICE = 1
+NAL_IDR = 5
+NAL_SEI = 6
+NAL_SPS = 7
+NAL_PPS = 8
+NAL_AUD = 9
+START_CODE = b'\x00\x00\x01'
+HIGH_PROFILES = (100, 110, 122, 244, 44, 83, 86, 118, 128, 138, 139, 134, 135)  # Profiles whose SPS carries chroma format and bit depth
+
+KEYFRAME_FLAGS = 0x02000000  # sample_depends_on = 2, i.e. an I frame
+DELTA_FLAGS = 0x01010000  # sample_depends_on = 1 and sample_is_non_sync_sample
+MATRIX = struct.pack('>9I', 0x10000, 0, 0, 0, 0x10000, 0, 0, 0, 0x40000000)
+
+
+class AnnexBParser:
+    # Splits a byte stream into NAL units; a unit is complete once the start code of the next one arrives
+    def __init__(self):
+        self.buffer = bytearray()
+        self.scanned = 0
+
+    def feed(self, data):
+        self.buffer += data
+        units = []
+        start = self.buffer.find(START_CODE)
+        if start < 0:
+            del self.buffer[:-2]  # Garbage before the first start code, keep what could begin one
+            self.scanned = 0
+            return units
+        position = start + 3
+        while True:
+            end = self.buffer.find(START_CODE, max(position, self.scanned))
+            if end < 0:
+                break
+            units.append(bytes(self.buffer[position:end]))
+            position = end + 3
+            self.scanned = 0
+        del self.buffer[:position - 3]
+        self.scanned = max(len(self.buffer) - 2, 3)
+        # A four byte start code leaves its leading zero at the end of the unit before it
+        return [unit.rstrip(b'\x00') for unit in units if unit.strip(b'\x00')]
+
+    def flush(self):
+        unit = bytes(self.buffer[3:]).rstrip(b'\x00') if self.buffer.startswith(START_CODE) else b''
+        self.buffer = bytearray()
+        self.scanned = 0
+        return [unit] if unit else []
+
+
+class AccessUnitSplitter:
+    # Groups NAL units into access units, i.e. one coded picture with the parameter sets and SEI in front of it
+    def __init__(self):
+        self.parser = AnnexBParser()
+        self.pending = []
+        self.has_slice = False
+
+    def push(self, nal, units):
+        kind = nal[0] & 0x1F
+        if kind in (NAL_SLICE, NAL_IDR):
+            # first_mb_in_slice is 0, encoded as a single 1 bit, only in the first slice of a picture
+            if self.has_slice and nal[1] & 0x80:
+                units.append(self.pending)
+                self.pending = []
+            self.has_slice = True
+        elif kind in (NAL_AUD, NAL_SPS, NAL_PPS, NAL_SEI) and self.has_slice:
+            units.append(self.pending)
+            self.pending = []
+            self.has_slice = False
+        self.pending.append(nal)
+
+    def feed(self, data):
+        units = []
+        for nal in self.parser.feed(data):
+            self.push(nal, units)
+        return units
+
+    def flush(self):
+        units = []
+        for nal in self.parser.flush():
+            self.push(nal, units)
+        if self.has_slice:
+            units.append(self.pending)
+        self.pending = []
+        self.has_slice = False
+        return units
+
+
+class BitReader:
+    def __init__(self, data):
+        self.value = int.from_bytes(data, 'big')
+        self.bits = len(data) * 8
+        self.position = 0
+
+    def u(self, count):
+        self.position += count
+        if self.position > self.bits:
+            raise ValueError("Read past the end of the parameter set")
+        return (self.value >> (self.bits - self.position)) & ((1 << count) - 1)
+
+    def ue(self):
+        zeros = 0
+        while self.u(1) == 0:
+            zeros += 1
+        return (1 << zeros) - 1 + self.u(zeros)
+
+    def se(self):
+        value = self.ue()
+        return (value + 1) // 2 if value & 1 else -(value // 2)
+
+
+def skip_scaling_list(reader, size):
+    last = next_scale = 8
+    for _ in range(size):
+        if next_scale:
+            next_scale = (last + reader.se() + 256) % 256
+        last = next_scale or last
+
+
+def parse_sps(nal):
+    # Only what the MP4 sample entry needs: profile, level, picture size and chroma format
+    reader = BitReader(nal[1:].replace(b'\x00\x00\x03', b'\x00\x00'))
+    profile = reader.u(8)
+    reader.u(8)  # Constraint flags
+    level = reader.u(8)
+    reader.ue()  # seq_parameter_set_id
+    chroma_format = 1
+    bit_depth_luma = bit_depth_chroma = 8
+    if profile in HIGH_PROFILES:
+        chroma_format = reader.ue()
+        if chroma_format == 3:
+            reader.u(1)  # separate_colour_plane_flag
+        bit_depth_luma = reader.ue() + 8
+        bit_depth_chroma = reader.ue() + 8
+        reader.u(1)  # qpprime_y_zero_transform_bypass_flag
+        if reader.u(1):
+            for index in range(8 if chroma_format != 3 else 12):
+                if reader.u(1):
+                    skip_scaling_list(reader, 16 if index < 6 else 64)
+    reader.ue()  # log2_max_frame_num_minus4
+    poc_type = reader.ue()
+    if poc_type == 0:
+        reader.ue()
+    elif poc_type == 1:
+        reader.u(1)
+        reader.se()
+        reader.se()
+        for _ in range(reader.ue()):
+            reader.se()
+    reader.ue()  # max_num_ref_frames
+    reader.u(1)  # gaps_in_frame_num_value_allowed_flag
+    width = (reader.ue() + 1) * 16
+    height_units = reader.ue() + 1
+    frame_mbs_only = reader.u(1)
+    if not frame_mbs_only:
+        reader.u(1)  # mb_adaptive_frame_field_flag
+    reader.u(1)  # direct_8x8_inference_flag
+    height = (2 - frame_mbs_only) * height_units * 16
+    if reader.u(1):
+        left, right, top, bottom = reader.ue(), reader.ue(), reader.ue(), reader.ue()
+        crop_x = 2 if chroma_format in (1, 2) else 1
+        crop_y = (2 if chroma_format == 1 else 1) * (2 - frame_mbs_only)
+        width -= (left + right) * crop_x
+        height -= (top + bottom) * crop_y
+    return {'profile': profile, 'compatibility': nal[2], 'level': level, 'width': width, 'height': height,
+            'chroma_format': chroma_format, 'bit_depth_luma': bit_depth_luma, 'bit_depth_chroma': bit_depth_chroma}
+
+
+def codec_string(sps):
+    # What MediaSource.isTypeSupported and addSourceBuffer expect, e.g. avc1.640028
+    return f'avc1.{sps[1]:02x}{sps[2]:02x}{sps[3]:02x}'
+
+
+def box(kind, *parts):
+    payload = b''.join(parts)
+    return struct.pack('>I4s', 8 + len(payload), kind) + payload
+
+
+def full_box(kind, version, flags, *parts):
+    return box(kind, struct.pack('>I', version << 24 | flags), *parts)
+
+
+def init_segment(sps, pps):
+    info = parse_sps(sps)
+    width, height = info['width'], info['height']
+    avcc = bytes([1, sps[1], sps[2], sps[3], 0xFF, 0xE1]) + struct.pack('>H', len(sps)) + sps \
+        + b'\x01' + struct.pack('>H', len(pps)) + pps
+    if info['profile'] in HIGH_PROFILES:
+        avcc += bytes([0xFC | info['chroma_format'], 0xF8 | (info['bit_depth_luma'] - 8),
+                       0xF8 | (info['bit_depth_chroma'] - 8), 0])
+    avc1 = box(b'avc1', bytes(6), struct.pack('>H', 1), bytes(16),
+               struct.pack('>HHIIIH', width, height, 0x480000, 0x480000, 0, 1), bytes(32),
+               struct.pack('>Hh', 0x18, -1), box(b'avcC', avcc))
+    stbl = box(b'stbl', full_box(b'stsd', 0, 0, struct.pack('>I', 1), avc1),
+               full_box(b'stts', 0, 0, bytes(4)), full_box(b'stsc', 0, 0, bytes(4)),
+               full_box(b'stsz', 0, 0, bytes(8)), full_box(b'stco', 0, 0, bytes(4)))
+    minf = box(b'minf', full_box(b'vmhd', 0, 1, bytes(8)),
+               box(b'dinf', full_box(b'dref', 0, 0, struct.pack('>I', 1), full_box(b'url ', 0, 1))), stbl)
+    mdia = box(b'mdia', full_box(b'mdhd', 0, 0, struct.pack('>IIIIHH', 0, 0, TIMESCALE, 0, 0x55C4, 0)),
+               full_box(b'hdlr', 0, 0, bytes(4), b'vide', bytes(12), b'VideoHandler\x00'), minf)
+    tkhd = full_box(b'tkhd', 0, 3, struct.pack('>IIIII', 0, 0, 1, 0, 0), bytes(8), struct.pack('>hhhH', 0, 0, 0, 0),
+                    MATRIX, struct.pack('>II', width << 16, height << 16))
+    mvhd = full_box(b'mvhd', 0, 0, struct.pack('>IIIIiH', 0, 0, 1000, 0, 0x10000, 0x100), bytes(10), MATRIX,
+                    bytes(24), struct.pack('>I', 2))
+    mvex = box(b'mvex', full_box(b'trex', 0, 0, struct.pack('>IIIII', 1, 1, 0, 0, 0)))
+    ftyp = box(b'ftyp', b'isom', struct.pack('>I', 0x200), b'isom', b'iso6', b'avc1', b'mp41')
+    return ftyp + box(b'moov', mvhd, box(b'trak', tkhd, mdia), mvex)
+
+
+def media_fragment(sequence, decode_time, samples):
+    # samples are (data, duration, keyframe); the sample data follows the moof in one mdat
+    entries = b''.join(struct.pack('>III', duration, len(data), KEYFRAME_FLAGS if keyframe else DELTA_FLAGS)
+                       for data, duration, keyframe in samples)
+
+    def moof(data_offset):
+        trun = full_box(b'trun', 0, 0x000701, struct.pack('>Ii', len(samples), data_offset), entries)
+        traf = box(b'traf', full_box(b'tfhd', 0, 0x020000, struct.pack('>I', 1)),
+                   full_box(b'tfdt', 1, 0, struct.pack('>Q', decode_time)), trun)
+        return box(b'moof', full_box(b'mfhd', 0, 0, struct.pack('>I', sequence)), traf)
+
+    header = moof(0)
+    return moof(len(header) + 8) + box(b'mdat', *(data for data, _, _ in samples))
+
+
+class H264Segmenter:
+    # Feeds on raw stream bytes and calls on_init(init, codec) when the parameter sets change
+    # and on_fragment(fragment, seconds) for every finished GOP
+    def __init__(self, framerate, on_init, on_fragment):
+        self.splitter = AccessUnitSplitter()
+        self.frame_duration = round(TIMESCALE / max(framerate, 1))  # Encoder frames come at a fixed rate
+        self.on_init = on_init
+        self.on_fragment = on_fragment
+        self.parameter_sets = None
+        self.gop = []
+        self.sequence = 1
+        self.decode_time = 0
+        self.frames = 0
+
+    def feed(self, data):
+        # Returns the number of pictures completed by this data
+        units = self.splitter.feed(data)
+        for nals in units:
+            self.add_access_unit(nals)
+        return len(units)
+
+    def flush(self):
+        for nals in self.splitter.flush():
+            self.add_access_unit(nals)
+        self.flush_gop()
+
+    def add_access_unit(self, nals):
+        kinds = [nal[0] & 0x1F for nal in nals]
+        if NAL_IDR in kinds:
+            self.flush_gop()
+            sps = next((nal for nal, kind in zip(nals, kinds) if kind == NAL_SPS), None)
+            pps = next((nal for nal, kind in zip(nals, kinds) if kind == NAL_PPS), None)
+            if sps and pps and (sps, pps) != self.parameter_sets:
+                self.parameter_sets = (sps, pps)
+                self.sequence = 1
+                self.decode_time = 0
+                self.on_init(init_segment(sps, pps), codec_string(sps))
+        if self.parameter_sets is None:
+            return  # Nothing is decodable before the first keyframe with its parameter sets
+        # Parameter sets live in the init segment and access unit delimiters are not needed in MP4
+        sample = b''.join(struct.pack('>I', len(nal)) + nal for nal, kind in zip(nals, kinds)
+                          if kind not in (NAL_SPS, NAL_PPS, NAL_AUD))
+        self.gop.append((sample, self.frame_duration, NAL_IDR in kinds))
+        self.frames += 1
+
+    def flush_gop(self):
+        if not self.gop:
+            return
+        fragment = media_fragment(self.sequence, self.decode_time, self.gop)
+        self.sequence += 1
+        self.decode_time += len(self.gop) * self.frame_duration
+        seconds = len(self.gop) * self.frame_duration / TIMESCALE
+        self.gop = []
+        self.on_fragment(fragment, seconds)
+
+
+class SegmentBuffer:
+    # The fragments of the current stream, shared by every viewer, so remuxing happens once however many watch.
+    # New parameter sets (a restart or a new resolution) start a new generation that viewers re-initialise for.
+    def __init__(self, kept=SEGMENTS_KEPT):
+        self.condition = threading.Condition()
+        self.segments = deque(maxlen=kept)  # (number, fragment, seconds)
+        self.generation = 0
+        self.init = None
+        self.codec = None
+        self.next_number = 0
+
+    def reset(self, init, codec):
+        with self.condition:
+            self.generation += 1
+            self.init = init
+            self.codec = codec
+            self.segments.clear()
+            self.next_number = 0
+            self.condition.notify_all()
+
+    def add(self, fragment, seconds):
+        with self.condition:
+            self.segments.append((self.next_number, fragment, seconds))
+            self.next_number += 1
+            self.condition.notify_all()
+
+    def get(self, generation, number, timeout=SEGMENT_WAIT):
+        # Waits for the next fragment; older ones are answered from memory while still kept
+        with self.condition:
+            if generation != self.generation or number > self.next_number:
+                return None
+            self.condition.wait_for(lambda: self.generation != generation or self.next_number > number, timeout)
+            if generation != self.generation or not self.segments:
+                return None
+            index = number - self.segments[0][0]
+            return self.segments[index][1] if 0 <= index < len(self.segments) else None
+
+    def info(self):
+        with self.condition:
+            seconds = sum(segment[2] for segment in self.segments)
+            size = sum(len(segment[1]) for segment in self.segments)
+            return {
+                'generation': self.generation,
+                'codec': self.codec,
+                'first': self.segments[0][0] if self.segments else None,
+                'last': self.segments[-1][0] if self.segments else None,
+                'segment_seconds': round(seconds / len(self.segments), 2) if self.segments else None,
+                'bitrate_kbps': round(size * 8 / seconds / 1000, 1) if seconds else None,
+            }
+
+
+def replay(path, output, framerate):
+    # Plays a recorded .h264 file into output ('-' for stdout) in a loop, paced like the camera, in place of libcamera-vid
+    with open(path, 'rb') as f:
+        splitter = AccessUnitSplitter()
+        units = splitter.feed(f.read()) + splitter.flush()
+    if not units:
+        raise ValueError(f"No H.264 pictures in {path}")
+    # Start at a keyframe so every loop is decodable on its own
+    first = next((index for index, nals in enumerate(units) if any(nal[0] & 0x1F == NAL_IDR for nal in nals)), 0)
+    frames = [b''.join(b'\x00\x00\x00\x01' + nal for nal in nals) for nals in units[first:]]
+    interval = 1 / framerate
+    next_frame = time.monotonic()
+    with (open(sys.stdout.fileno(), 'wb', closefd=False) if output == '-' else open(output, 'wb')) as out:
+        while True:
+            for frame in frames:
+                out.write(frame)
+                out.flush()
+                next_frame += interval
+                time.sleep(max(0, next_frame - time.monotonic()))
+
+
+if __name__ == '__main__':
+    # python fmp4.py replay <recording.h264> <output or -> <framerate>
+    if len(sys.argv) != 5 or sys.argv[1] != 'replay':
+        print("Usage: fmp4.py replay <recording.h264> <output> <framerate>")
+        sys.exit(2)
+    try:
+        replay(sys.argv[2], sys.argv[3], float(sys.argv[4]))
+    except (BrokenPipeError, KeyboardInterrupt):
+        pass
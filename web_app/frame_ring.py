@@ -0,0 +1,234 @@
+import os
+import sys
+import mmap
+import time
+import struct
+import tempfile
+import logging
+
+# Latest camera frames in a ring of fixed slots in shared memory, for local processes such as detectors and
+# recorders that would otherwise pull /video_feed over HTTP. The file has no dependencies beyond the standard
+# library, so client scripts can import or copy it.
+#
+# Layout: a header, one slot header per slot, then the slots, page aligned. The writer clears a slot's number
+# before it overwrites the slot and sets it afterwards; readers check that number before and after using the data.
+RING_DIR = '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+RING_SLOTS = 4  # Frames a slow reader can fall behind before its frame is overwritten
+RING_SLOT_SIZE = 512 * 1024  # Largest JPEG that fits, bigger frames are counted as dropped
+RING_POLL_INTERVAL = 0.005  # Seconds between checks of a waiting reader, there is no cross-process wakeup
+
+MAGIC = b'CDFR'
+VERSION = 1
+HEADER = struct.Struct('<4sIIIQQI')  # magic, version, slots, slot size, frames published, frames dropped, writer pid
+HEADER_SIZE = 64
+PUBLISHED = struct.Struct('<Q')
+PUBLISHED_OFFSET = 16
+DROPPED_OFFSET = 24
+SLOT_HEADER = struct.Struct('<QdI')  # frame number (0 while being written), capture timestamp, JPEG length
+SLOT_HEADER_SIZE = 32
+
+
+def ring_path(name):
+    return os.path.join(RING_DIR, f'chicken_door_frames_{name}')
+
+
+def data_offset(slots):
+    return (HEADER_SIZE + slots * SLOT_HEADER_SIZE + mmap.PAGESIZE - 1) // mmap.PAGESIZE * mmap.PAGESIZE
+
+
+class FrameRingWriter:
+    # Camera subscriber publishing every JPEG frame; one writer per coop, owned by the web app
+    def __init__(self, name, slots=RING_SLOTS, slot_size=RING_SLOT_SIZE, log=None):
+        self.path = ring_path(name)
+        self.slots = slots
+        self.slot_size = slot_size
+        self.log = log or logging.getLogger(__name__)
+        self.data_offset = data_offset(slots)
+        self.published = 0
+        self.dropped = 0
+
+        # Built under a temporary name and renamed, so a reader never maps a half initialised ring.
+        # A reader of the ring of an earlier run notices the new file and reopens.
+        size = self.data_offset + slots * slot_size
+        temporary = f'{self.path}.{os.getpid()}'
+        fd = os.open(temporary, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o644)
+        try:
+            os.ftruncate(fd, size)
+            self.map = mmap.mmap(fd, size)
+            self.inode = os.fstat(fd).st_ino
+        finally:
+            os.close(fd)
+        HEADER.pack_into(self.map, 0, MAGIC, VERSION, slots, slot_size, 0, 0, os.getpid())
+        os.replace(temporary, self.path)
+        self.log.info(f"Publishing camera frames to {self.path}, {slots} slots of {slot_size // 1024} KiB.")
+
+    def on_frame(self, jpeg, timestamp):
+        if self.map is None:
+            return
+        if len(jpeg) > self.slot_size:
+            self.dropped += 1
+            PUBLISHED.pack_into(self.map, DROPPED_OFFSET, self.dropped)
+            if self.dropped == 1:
+                self.log.warning(f"Frame of {len(jpeg)} bytes does not fit a frame ring slot of {self.slot_size}.")
+            return
+        number = self.published + 1
+        slot = (number - 1) % self.slots
+        slot_header = HEADER_SIZE + slot * SLOT_HEADER_SIZE
+        offset = self.data_offset + slot * self.slot_size
+        SLOT_HEADER.pack_into(self.map, slot_header, 0, 0.0, 0)
+        self.map[offset:offset + len(jpeg)] = jpeg
+        SLOT_HEADER.pack_into(self.map, slot_header, number, timestamp, len(jpeg))
+        PUBLISHED.pack_into(self.map, PUBLISHED_OFFSET, number)
+        self.published = number
+
+    def status(self):
+        return {'path': self.path, 'published': self.published, 'dropped': self.dropped}
+
+    def close(self):
+        if self.map is None:
+            return
+        self.map.close()
+        self.map = None
+        try:
+            # Unless a newer writer has replaced the ring already
+            if os.stat(self.path).st_ino == self.inode:
+                os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+
+class Frame:
+    def __init__(self, ring, slot, number, timestamp, data):
+        self.ring = ring
+        self.slot = slot
+        self.number = number
+        self.timestamp = timestamp
+        self.data = data  # Read-only memoryview straight into shared memory, no copy
+
+    def valid(self):
+        # True while the writer has not started reusing the slot; check it after using data
+        return self.ring.slot_number(self.slot) == self.number
+
+    def copy(self):
+        data = bytes(self.data)
+        return data if self.valid() else None
+
+    def release(self):
+        self.data.release()
+
+
+class FrameRing:
+    # Reader side, e.g.
+    #     with FrameRing('main') as ring:
+    #         frame = ring.wait(timeout=5)
+    #         image = cv2.imdecode(numpy.frombuffer(frame.data, numpy.uint8), cv2.IMREAD_COLOR)
+    #         if frame.valid(): ...
+    #         frame.release()
+    def __init__(self, name):
+        self.path = ring_path(name)
+        self.map = None
+        self.open()
+
+    def open(self):
+        with open(self.path, 'rb') as f:
+            self.inode = os.fstat(f.fileno()).st_ino
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.slots, self.slot_size, _, _, self.writer_pid = HEADER.unpack_from(self.map, 0)
+        if magic != MAGIC or version != VERSION:
+            self.map.close()
+            raise ValueError(f"{self.path} is not a version {VERSION} frame ring")
+        self.data_offset = data_offset(self.slots)
+        self.view = memoryview(self.map)
+
+    def close(self):
+        # Frames handed out must be released first, a mapping with views into it cannot be closed
+        if self.map is not None:
+            self.view.release()
+            self.map.close()
+            self.map = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def published(self):
+        return PUBLISHED.unpack_from(self.map, PUBLISHED_OFFSET)[0]
+
+    def dropped(self):
+        return PUBLISHED.unpack_from(self.map, DROPPED_OFFSET)[0]
+
+    def slot_number(self, slot):
+        return SLOT_HEADER.unpack_from(self.map, HEADER_SIZE + slot * SLOT_HEADER_SIZE)[0]
+
+    def latest(self):
+        # The newest complete frame, or None before the first one
+        number = self.published()
+        if number == 0:
+            return None
+        slot = (number - 1) % self.slots
+        found, timestamp, length = SLOT_HEADER.unpack_from(self.map, HEADER_SIZE + slot * SLOT_HEADER_SIZE)
+        if found != number:
+            return None  # Overwritten since the count was read, only possible with a stalled reader
+        offset = self.data_offset + slot * self.slot_size
+        return Frame(self, slot, number, timestamp, self.view[offset:offset + length])
+
+    def replaced(self):
+        # The web app restarted and created a new ring
+        try:
+            return os.stat(self.path).st_ino != self.inode
+        except FileNotFoundError:
+            return False
+
+    def wait(self, after=0, timeout=None):
+        # The first frame newer than frame number after, or None on timeout
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            if self.published() > after:
+                frame = self.latest()
+                if frame is not None:
+                    return frame
+            elif self.replaced():
+                self.close()
+                self.open()
+                after = 0
+            if deadline is not None and time.monotonic() >= deadline:
+                return None
+            time.sleep(RING_POLL_INTERVAL)
+
+
+def main():
+    # python frame_ring.py <coop> [seconds] [snapshot.jpg]: frame rate and delay seen by a local reader
+    if len(sys.argv) < 2:
+        print("Usage: frame_ring.py <coop> [seconds] [snapshot.jpg]")
+        sys.exit(2)
+    seconds = float(sys.argv[2]) if len(sys.argv) > 2 else 10
+    with FrameRing(sys.argv[1]) as ring:
+        print(f"{ring.path}: {ring.slots} slots of {ring.slot_size // 1024} KiB, writer pid {ring.writer_pid}")
+        frames, delays, lost, last = 0, [], 0, ring.published()
+        end = time.monotonic() + seconds
+        while time.monotonic() < end:
+            frame = ring.wait(last, timeout=1)
+            if frame is None:
+                continue
+            delays.append(time.time() - frame.timestamp)
+            lost += frame.number - last - 1 if last else 0
+            last = frame.number
+            frames += 1
+            if len(sys.argv) > 3 and frames == 1:
+                data = frame.copy()
+                if data is not None:
+                    with open(sys.argv[3], 'wb') as f:
+                        f.write(data)
+            frame.release()
+        if delays:
+            delays.sort()
+            print(f"{frames / seconds:.1f} frames/s, skipped {lost}, dropped by the writer {ring.dropped()}, "
+                  f"delay median {delays[len(delays) // 2] * 1000:.2f} ms, max {delays[-1] * 1000:.2f} ms")
+        else:
+            print("No frames")
+
+
+if __name__ == '__main__':
+    main()
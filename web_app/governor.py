@@ -0,0 +1,146 @@
+import time
+import logging
+import threading
+from collections import deque, Counter
+from datetime import datetime
+
+from profiler import heartbeat
+
+# Door moves come first: while a door moves or the CPU is saturated, streams publish fewer frames and
+# background work pauses, so the step loop gets the CPU and the GIL. Everything is restored afterwards.
+GOVERNOR_INTERVAL = 1  # Seconds between CPU samples
+CPU_HIGH = 0.9  # Busy share of all cores that counts as saturated
+CPU_LOW = 0.7  # Busy share below which a saturated CPU counts as recovered
+CPU_SATURATED_SAMPLES = 3  # Consecutive busy samples before throttling, so a short spike is ignored
+MOTION_FRAMERATE = 2  # Frames per second published by each camera while a door moves
+SATURATED_FRAMERATE = 5  # Frames per second published while the CPU is saturated
+GOVERNOR_HISTORY = 100  # Level changes kept for /admin/governor
+MOVES_KEPT = 20  # Step timing of the latest door moves, to see what throttling buys
+
+NORMAL = 'normal'
+SATURATED = 'cpu_saturated'
+MOTION = 'motion'
+FRAMERATE_LIMITS = {NORMAL: None, SATURATED: SATURATED_FRAMERATE, MOTION: MOTION_FRAMERATE}
+
+
+def read_cpu_times():
+    # Total and idle jiffies of all cores since boot
+    with open('/proc/stat') as f:
+        fields = [int(value) for value in f.readline().split()[1:]]
+    return sum(fields), fields[3] + fields[4]  # idle and iowait
+
+
+class ResourceGovernor:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.cameras = []
+        self.timelapses = []
+        self.moving = set()  # Coops whose door is moving
+        self.cpu_busy = None
+        self.busy_samples = 0
+        self.saturated = False
+        self.level = NORMAL
+        self.level_since = time.monotonic()
+        self.level_seconds = Counter()
+        self.level_changes = Counter()
+        self.history = deque(maxlen=GOVERNOR_HISTORY)
+        self.background_paused = False  # Read by log tailing and other optional work
+        self.moves = deque(maxlen=MOVES_KEPT)
+        self.thread = None
+
+    def register(self, camera, timelapse=None):
+        with self.lock:
+            self.cameras.append(camera)
+            if timelapse is not None:
+                self.timelapses.append(timelapse)
+            self.apply_level(self.level)
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, name='governor', daemon=True)
+        self.thread.start()
+
+    def motion_started(self, name):
+        with self.lock:
+            self.moving.add(name)
+            self.update(f"door of {name} moving")
+
+    def motion_finished(self, name, timing=None):
+        with self.lock:
+            self.moving.discard(name)
+            self.moves.append({'time': datetime.now().isoformat(timespec='seconds'), 'coop': name,
+                               'max_late_ms': (timing or {}).get('max_late_ms'),
+                               'cpu_busy': round(self.cpu_busy, 3) if self.cpu_busy is not None else None})
+            self.update(f"door of {name} stopped")
+
+    def run(self):
+        beat = heartbeat('governor', GOVERNOR_INTERVAL)
+        try:
+            previous = read_cpu_times()
+        except (OSError, ValueError, IndexError) as e:
+            logging.warning(f"Governor cannot read CPU usage, only door moves throttle: {e}")
+            return
+        while True:
+            time.sleep(GOVERNOR_INTERVAL)
+            beat.beat()
+            current = read_cpu_times()
+            total, idle = current[0] - previous[0], current[1] - previous[1]
+            previous = current
+            if total <= 0:
+                continue
+            with self.lock:
+                self.cpu_busy = 1 - idle / total
+                if self.cpu_busy >= CPU_HIGH:
+                    self.busy_samples += 1
+                elif self.cpu_busy < CPU_LOW:
+                    self.busy_samples = 0
+                if not self.saturated and self.busy_samples >= CPU_SATURATED_SAMPLES:
+                    self.saturated = True
+                    self.update(f"CPU {self.cpu_busy:.0%} busy")
+                elif self.saturated and self.busy_samples == 0:
+                    self.saturated = False
+                    self.update(f"CPU down to {self.cpu_busy:.0%}")
+
+    def update(self, reason):
+        # Called with the lock held
+        level = MOTION if self.moving else SATURATED if self.saturated else NORMAL
+        if level == self.level:
+            return
+        now = time.monotonic()
+        self.level_seconds[self.level] += now - self.level_since
+        self.history.append({'time': datetime.now().isoformat(timespec='seconds'), 'from': self.level,
+                             'to': level, 'reason': reason})
+        self.level_changes[level] += 1
+        logging.info(f"Governor: {self.level} -> {level} ({reason})")
+        self.level = level
+        self.level_since = now
+        self.apply_level(level)
+
+    def apply_level(self, level):
+        limit = FRAMERATE_LIMITS[level]
+        for camera in self.cameras:
+            camera.set_publish_limit(limit)
+        for timelapse in self.timelapses:
+            timelapse.paused = level != NORMAL
+        self.background_paused = level != NORMAL
+
+    def status(self):
+        with self.lock:
+            seconds = Counter(self.level_seconds)
+            seconds[self.level] += time.monotonic() - self.level_since
+            return {
+                'level': self.level,
+                'since_seconds': round(time.monotonic() - self.level_since, 1),
+                'cpu_busy': round(self.cpu_busy, 3) if self.cpu_busy is not None else None,
+                'moving': sorted(self.moving),
+                'framerate_limit': FRAMERATE_LIMITS[self.level],
+                'background_paused': self.background_paused,
+                'level_seconds': {name: round(value, 1) for name, value in seconds.items()},
+                'level_changes': dict(self.level_changes),
+                'frames_withheld': {camera.name: camera.frames_withheld for camera in self.cameras},
+                'timelapse_paused': [timelapse.paused for timelapse in self.timelapses],
+                'moves': list(self.moves),
+                'history': list(self.history),
+            }
+
+
+governor = ResourceGovernor()
@@ -0,0 +1,155 @@
+import threading
+from types import SimpleNamespace
+
+# Request types and flags of the libgpiod v1 bindings, reused by the simulated backend
+LINE_REQ_DIR_IN = 2
+LINE_REQ_DIR_OUT = 3
+LINE_REQ_FLAG_BIAS_PULL_UP = 32
+
+
+class SimulatedLine:
+    def __init__(self, chip, offset):
+        self.chip = chip
+        self.offset = offset
+        self.value = 1  # Inputs idle high because of the pull-ups
+        self.direction = None
+
+    def request(self, consumer=None, type=None, flags=0, default_vals=None):
+        self.direction = type
+        if type == LINE_REQ_DIR_OUT:
+            self.value = 0
+
+    def get_value(self):
+        self.chip.ioctls += 1
+        return self.value
+
+    def set_value(self, value):
+        with self.chip.lock:
+            self.chip.ioctls += 1
+            self.update(value)
+
+    def update(self, value):
+        previous = self.value
+        self.value = value
+        if self.chip.door is not None:
+            self.chip.door.on_output(self.offset, previous, value)
+
+    def release(self):
+        self.direction = None
+
+
+class SimulatedLineBulk:
+    # Like a gpiod LineBulk, every get_values or set_values counts as a single ioctl
+    def __init__(self, chip, lines):
+        self.chip = chip
+        self.lines = lines
+
+    def request(self, consumer=None, type=None, flags=0, default_vals=None):
+        for line in self.lines:
+            line.request(consumer, type, flags)
+
+    def get_values(self):
+        self.chip.ioctls += 1
+        return [line.value for line in self.lines]
+
+    def set_values(self, values):
+        with self.chip.lock:
+            self.chip.ioctls += 1
+            # Applied in order, so a direction line listed first is set before the step edge
+            for line, value in zip(self.lines, values):
+                if line.value != value:
+                    line.update(value)
+
+    def release(self):
+        for line in self.lines:
+            line.release()
+
+    def to_list(self):
+        return list(self.lines)
+
+
+class SimulatedChip:
+    def __init__(self, name):
+        self.name = name
+        self.lines = {}
+        self.lock = threading.RLock()
+        self.door = None
+        self.ioctls = 0  # Line value calls that would be a syscall on real hardware
+
+    def get_line(self, offset):
+        if offset not in self.lines:
+            self.lines[offset] = SimulatedLine(self, offset)
+        return self.lines[offset]
+
+    def get_lines(self, offsets):
+        return SimulatedLineBulk(self, [self.get_line(offset) for offset in offsets])
+
+    def close(self):
+        pass
+
+
+class SimulatedDoor:
+    # Moves a virtual door on STEP rising edges and presses the lever switch at either end
+    def __init__(self, chip, pins, travel_steps, position=None):
+        self.chip = chip
+        self.pins = pins
+        self.travel_steps = travel_steps
+        self.position = travel_steps // 2 if position is None else position  # Steps from the CCW end
+        self.jammed = False  # Set to make the door ignore steps, as if blocked
+        self.update_levers()
+
+    def on_output(self, offset, previous, value):
+        if offset != self.pins['STEP_PIN'] or previous != 0 or value != 1:
+            return
+        if self.chip.get_line(self.pins['SLP_PIN']).value != 1 or self.jammed:
+            return
+        if self.chip.get_line(self.pins['DIR_PIN']).value == 1:
+            self.position = min(self.position + 1, self.travel_steps)
+        else:
+            self.position = max(self.position - 1, 0)
+        self.update_levers()
+
+    def update_levers(self):
+        self.chip.get_line(self.pins['LEVER_CW_PIN']).value = 0 if self.position >= self.travel_steps else 1
+        self.chip.get_line(self.pins['LEVER_CCW_PIN']).value = 0 if self.position <= 0 else 1
+
+
+class LineGroup:
+    # Named lines requested as one bulk, so reading or writing all of them is a single ioctl
+    def __init__(self, chip, pins, names):
+        self.names = names
+        self.bulk = chip.get_lines([pins[name] for name in names])
+        self.values = [0] * len(names)
+
+    def index(self, name):
+        return self.names.index(name)
+
+    def request(self, consumer, type, flags=0):
+        # default_vals only matters for outputs, which start low
+        self.bulk.request(consumer=consumer, type=type, flags=flags, default_vals=self.values)
+
+    def get_values(self):
+        return self.bulk.get_values()
+
+    def set_values(self, values):
+        self.values = values
+        self.bulk.set_values(values)
+
+    def release(self):
+        self.bulk.release()
+
+
+simulated_gpiod = SimpleNamespace(
+    Chip=SimulatedChip,
+    LINE_REQ_DIR_IN=LINE_REQ_DIR_IN,
+    LINE_REQ_DIR_OUT=LINE_REQ_DIR_OUT,
+    LINE_REQ_FLAG_BIAS_PULL_UP=LINE_REQ_FLAG_BIAS_PULL_UP,
+)
+
+
+def load_backend(chip_name):
+    # Chips named 'sim...' run against the simulated backend, everything else needs gpiod
+    if chip_name.startswith('sim'):
+        return simulated_gpiod
+    import gpiod
+    return gpiod
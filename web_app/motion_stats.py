@@ -0,0 +1,113 @@
+import math
+
+from clock import system_clock
+
+# Travel model settings
+TRAVEL_EWMA_ALPHA = 0.2  # Weight of the newest cycle in the running mean and variance
+TRAVEL_MIN_SAMPLES = 3  # Full cycles needed before the model is trusted
+TRAVEL_SIGMAS = 4  # Allowed deviation from the mean in standard deviations
+TRAVEL_MIN_MARGIN = 100  # Lower bound for the allowed deviation in steps
+MAX_ANOMALIES = 20  # Recent anomalies kept for the status page
+
+
+class TravelStats:
+    # Exponentially weighted mean and variance of the steps from one limit switch to the other
+    def __init__(self, state=None):
+        state = state or {}
+        self.count = state.get('count', 0)
+        self.mean = state.get('mean')
+        self.variance = state.get('variance', 0.0)
+        self.last = state.get('last')
+
+    def ready(self):
+        return self.count >= TRAVEL_MIN_SAMPLES
+
+    def margin(self):
+        return max(TRAVEL_MIN_MARGIN, TRAVEL_SIGMAS * math.sqrt(self.variance))
+
+    def max_steps(self):
+        return int(self.mean + self.margin())
+
+    def min_steps(self):
+        return int(self.mean - self.margin())
+
+    def add(self, steps):
+        self.count += 1
+        self.last = steps
+        if self.mean is None:
+            self.mean = float(steps)
+            return
+        diff = steps - self.mean
+        increment = TRAVEL_EWMA_ALPHA * diff
+        self.mean += increment
+        self.variance = (1 - TRAVEL_EWMA_ALPHA) * (self.variance + diff * increment)
+
+    def check(self, steps, reached_limit):
+        # Returns a description of the anomaly, or None when the cycle looks normal
+        if not self.ready():
+            return None
+        if not reached_limit and steps >= self.max_steps():
+            return f"limit not reached within {steps} steps, expected {self.mean:.0f}"
+        if reached_limit and steps < self.min_steps():
+            return f"limit reached after {steps} steps, expected {self.mean:.0f}"
+        return None
+
+    def to_dict(self):
+        return {'count': self.count, 'mean': self.mean, 'variance': self.variance, 'last': self.last}
+
+    def summary(self):
+        return {
+            'count': self.count,
+            'mean': round(self.mean, 1) if self.mean is not None else None,
+            'std': round(math.sqrt(self.variance), 1),
+            'last': self.last,
+            'max_steps': self.max_steps() if self.ready() else None,
+        }
+
+
+class MotionModel:
+    # Travel statistics per direction of the door plus the anomalies they flagged
+    def __init__(self, state=None, clock=system_clock):
+        state = state or {}
+        self.clock = clock
+        self.travel = {target: TravelStats(state.get(target)) for target in ('open', 'close')}
+        self.anomalies = []
+        self.anomaly_count = state.get('anomaly_count', 0)
+
+    def step_limit(self, target):
+        stats = self.travel[target]
+        return stats.max_steps() if stats.ready() else None
+
+    def record(self, target, steps, reached_limit):
+        # Only moves that started at the opposite limit switch are full cycles
+        stats = self.travel[target]
+        problem = stats.check(steps, reached_limit)
+        if problem is None:
+            if reached_limit:
+                stats.add(steps)
+            return None
+        # Anomalous cycles are kept out of the model so a jam does not become the new normal
+        return self.flag(target, steps, problem)
+
+    def flag(self, target, steps, problem):
+        self.anomaly_count += 1
+        self.anomalies.append({
+            'time': self.clock.now().isoformat(timespec='seconds'),
+            'timestamp': self.clock.time(),
+            'target': target,
+            'steps': steps,
+            'problem': problem,
+        })
+        del self.anomalies[:-MAX_ANOMALIES]
+        return problem
+
+    def to_dict(self):
+        return {**{target: stats.to_dict() for target, stats in self.travel.items()},
+                'anomaly_count': self.anomaly_count}
+
+    def summary(self):
+        return {
+            'travel': {target: stats.summary() for target, stats in self.travel.items()},
+            'anomaly_count': self.anomaly_count,
+            'last_anomaly': self.anomalies[-1] if self.anomalies else None,
+        }
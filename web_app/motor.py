@@ -0,0 +1,205 @@
+import json
+import socket
+import logging
+import threading
+
+import gpio
+from clock import system_clock
+
+# Lines requested together and read or written in one call
+INPUT_PINS = ('BTN_CW_PIN', 'BTN_CCW_PIN', 'BTN_STOP_PIN', 'BTN_LIGHT_PIN', 'LEVER_CW_PIN', 'LEVER_CCW_PIN')
+MOTOR_PINS = ('DIR_PIN', 'STEP_PIN')
+
+PROGRESS_STEPS = 100  # Steps between progress reports of a running move
+DAEMON_TIMEOUT = 5  # Seconds to wait for the motor daemon to answer a request
+
+# Motor daemon settings, overridden per coop by 'motor_daemon' in the config file
+DEFAULT_DAEMON = {
+    'socket': '/tmp/chicken_door_motor_{name}.sock',
+    'cpu': None,  # Core the daemon is pinned to, ideally one kept free with isolcpus
+    'priority': 50,  # SCHED_FIFO priority of the step thread, needs CAP_SYS_NICE or root
+}
+
+
+def daemon_settings(name, config):
+    settings = {**DEFAULT_DAEMON, **config}
+    settings['socket'] = settings['socket'].format(name=name)
+    return settings
+
+
+def run_steps(motor_lines, inputs, direction, steps, delay, should_stop, on_progress, clock=system_clock):
+    # The step loop, shared by the in-process motor and the motor daemon; returns (steps_done, reason, timing)
+    stop_index = INPUT_PINS.index('BTN_STOP_PIN')
+    limit_index = INPUT_PINS.index('LEVER_CW_PIN' if direction == 1 else 'LEVER_CCW_PIN')
+    step_high, step_low = [direction, 1], [direction, 0]
+    reason = 'complete'
+    steps_done = 0
+    max_late = 0.0
+    sleep = clock.sleep
+
+    # One read of all inputs and two writes per step
+    motor_lines.set_values(step_low)  # Direction settles before the first step edge
+    last = clock.monotonic()
+    for step in range(steps):
+        values = inputs.get_values()
+        if should_stop() or values[stop_index] == 0:
+            reason = 'stop'
+            break
+        if values[limit_index] == 0:
+            reason = 'limit'
+            break
+        motor_lines.set_values(step_high)
+        if delay:
+            sleep(delay)
+        motor_lines.set_values(step_low)
+        if delay:
+            sleep(delay)
+        steps_done = step + 1
+        # How much later than two delays the step ended, i.e. the jitter the motor saw
+        now = clock.monotonic()
+        max_late = max(max_late, now - last - 2 * delay)
+        last = now
+        if steps_done % PROGRESS_STEPS == 0:
+            on_progress(steps_done)
+    else:
+        if inputs.get_values()[limit_index] == 0:
+            reason = 'limit'
+    on_progress(steps_done)
+    return steps_done, reason, {'max_late_ms': round(max_late * 1000, 3)}
+
+
+class LocalMotor:
+    # Steps the motor from a thread of this process
+    def __init__(self, chip, pins, consumer, gpiod, clock=system_clock):
+        # DIR and STEP go out together and all buttons and levers come in together, one ioctl each
+        self.motor_lines = gpio.LineGroup(chip, pins, MOTOR_PINS)
+        self.inputs = gpio.LineGroup(chip, pins, INPUT_PINS)
+        self.slp_line = chip.get_line(pins['SLP_PIN'])
+        self.motor_lines.request(consumer, gpiod.LINE_REQ_DIR_OUT)
+        self.slp_line.request(consumer=consumer, type=gpiod.LINE_REQ_DIR_OUT)
+        self.inputs.request(consumer, gpiod.LINE_REQ_DIR_IN, flags=gpiod.LINE_REQ_FLAG_BIAS_PULL_UP)
+        self.clock = clock
+        self.stop_requested = False
+        self.last_timing = None
+
+    def get_inputs(self):
+        return self.inputs.get_values()
+
+    def run(self, direction, steps, delay, on_progress):
+        self.stop_requested = False
+        steps_done, reason, self.last_timing = run_steps(self.motor_lines, self.inputs, direction, steps, delay,
+                                                         lambda: self.stop_requested, on_progress, self.clock)
+        return steps_done, reason
+
+    def stop(self):
+        self.stop_requested = True
+
+    def status(self):
+        return {'motor_backend': 'local', 'motor_last_timing': self.last_timing}
+
+    def release(self):
+        for lines in (self.motor_lines, self.inputs, self.slp_line):
+            lines.release()
+
+
+class RemoteLine:
+    # Stands in for the SLP line, which the motor daemon owns
+    def __init__(self, motor, name):
+        self.motor = motor
+        self.name = name
+
+    def get_value(self):
+        return self.motor.request({'cmd': 'get', 'line': self.name})['value']
+
+    def set_value(self, value):
+        self.motor.request({'cmd': 'set', 'line': self.name, 'value': value})
+
+    def release(self):
+        pass
+
+
+class RemoteMotor:
+    # Same interface as LocalMotor, backed by motor_daemon.py over a Unix socket with one JSON message per line
+    def __init__(self, socket_path, log=None):
+        self.socket_path = socket_path
+        self.log = log or logging.getLogger(__name__)
+        self.slp_line = RemoteLine(self, 'SLP_PIN')
+        self.connection = None
+        self.reader = None
+        self.lock = threading.Lock()
+        self.last_timing = None
+
+    def connect(self):
+        connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        connection.settimeout(DAEMON_TIMEOUT)
+        connection.connect(self.socket_path)
+        return connection, connection.makefile('rb')
+
+    def request(self, message):
+        with self.lock:
+            for attempt in (1, 2):
+                try:
+                    if self.connection is None:
+                        self.connection, self.reader = self.connect()
+                    self.connection.sendall(json.dumps(message).encode() + b'\n')
+                    reply = self.reader.readline()
+                    if not reply:
+                        raise ConnectionError("Motor daemon closed the connection")
+                    reply = json.loads(reply)
+                    break
+                except OSError:
+                    self.close()
+                    # The daemon may have restarted, retry once on a fresh connection
+                    if attempt == 2:
+                        raise
+        if 'error' in reply:
+            raise RuntimeError(f"Motor daemon: {reply['error']}")
+        return reply
+
+    def get_inputs(self):
+        return self.request({'cmd': 'inputs'})['values']
+
+    def run(self, direction, steps, delay, on_progress):
+        # A move gets its own connection, so stop and input requests are not queued behind it
+        connection, reader = self.connect()
+        try:
+            connection.settimeout(None)
+            message = {'cmd': 'move', 'direction': direction, 'steps': steps, 'delay': delay}
+            connection.sendall(json.dumps(message).encode() + b'\n')
+            for line in reader:
+                reply = json.loads(line)
+                if 'error' in reply:
+                    raise RuntimeError(f"Motor daemon: {reply['error']}")
+                if 'progress' in reply:
+                    on_progress(reply['progress'])
+                else:
+                    self.last_timing = reply['timing']
+                    return reply['steps'], reply['reason']
+            raise ConnectionError("Motor daemon closed the connection during a move")
+        finally:
+            reader.close()
+            connection.close()
+
+    def stop(self):
+        try:
+            self.request({'cmd': 'stop'})
+        except Exception as e:
+            self.log.error(f"Failed to stop the motor daemon: {str(e)}")
+
+    def status(self):
+        try:
+            info = self.request({'cmd': 'info'})
+        except Exception as e:
+            info = {'error': str(e)}
+        return {'motor_backend': 'daemon', 'motor_daemon': info, 'motor_last_timing': self.last_timing}
+
+    def close(self):
+        if self.connection is not None:
+            self.reader.close()
+            self.connection.close()
+            self.connection = None
+            self.reader = None
+
+    def release(self):
+        with self.lock:
+            self.close()
@@ -0,0 +1,168 @@
+import os
+import gc
+import sys
+import json
+import queue
+import signal
+import socket
+import logging
+import threading
+
+import gpio
+from motor import LocalMotor, daemon_settings
+from coop import DEFAULT_COOP, DEFAULT_PIN_ASSIGNMENTS
+
+# Runs the step loop of one coop in its own process, away from the GIL of the web app.
+# Start with: python motor_daemon.py <coop name>, using the same coops.json as the app.
+CONFIG_FILE = os.environ.get('CHICKEN_DOOR_CONFIG', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'coops.json'))
+
+
+class MotorDaemon:
+    def __init__(self, motor, socket_path, cpu=None, priority=None):
+        self.motor = motor
+        self.socket_path = socket_path
+        self.cpu = cpu
+        self.priority = priority
+        self.jobs = queue.Queue()
+        self.busy = threading.Lock()
+        self.realtime = False
+        self.moves = 0
+
+    def set_realtime(self):
+        # Called from the step thread; both calls only affect that thread on Linux
+        if self.cpu is not None and hasattr(os, 'sched_setaffinity'):
+            os.sched_setaffinity(0, {self.cpu})
+        if self.priority and hasattr(os, 'sched_setscheduler'):
+            try:
+                os.sched_setscheduler(0, os.SCHED_FIFO, os.sched_param(self.priority))
+                self.realtime = True
+            except PermissionError:
+                logging.warning("No permission for SCHED_FIFO, stepping with the normal scheduler.")
+
+    def run_motor(self):
+        self.set_realtime()
+        logging.info(f"Step thread running, realtime={self.realtime}, cpu={self.cpu}")
+        while True:
+            move, events = self.jobs.get()
+            # A collection pause in the middle of a step train is exactly the jitter this process avoids
+            gc.disable()
+            try:
+                steps, reason = self.motor.run(move['direction'], move['steps'], move['delay'],
+                                               lambda done: events.put({'progress': done}))
+                events.put({'steps': steps, 'reason': reason, 'timing': self.motor.last_timing})
+            except Exception as e:
+                logging.error(f"Move failed: {str(e)}")
+                events.put({'error': str(e)})
+            finally:
+                gc.enable()
+                self.moves += 1
+
+    def handle(self, connection):
+        reader = connection.makefile('rb')
+        try:
+            for line in reader:
+                message = json.loads(line)
+                if message['cmd'] == 'move':
+                    # Progress is relayed from here, the step thread never touches a socket
+                    replies = self.move(message)
+                    try:
+                        for reply in replies:
+                            connection.sendall(json.dumps(reply).encode() + b'\n')
+                    finally:
+                        replies.close()
+                else:
+                    connection.sendall(json.dumps(self.dispatch(message)).encode() + b'\n')
+        except (OSError, ValueError) as e:
+            logging.info(f"Client connection closed: {str(e)}")
+        finally:
+            reader.close()
+            connection.close()
+
+    def move(self, message):
+        if not self.busy.acquire(blocking=False):
+            yield {'error': 'A move is already running'}
+            return
+        finished = False
+        try:
+            events = queue.Queue()
+            self.jobs.put((message, events))
+            while True:
+                reply = events.get()
+                finished = 'progress' not in reply
+                yield reply
+                if finished:
+                    return
+        finally:
+            if not finished:
+                # The client went away mid-move and nobody tracks the door any more
+                logging.warning("Client disconnected during a move, stopping the motor.")
+                self.motor.stop()
+                while 'progress' in events.get():
+                    pass
+            self.busy.release()
+
+    def dispatch(self, message):
+        cmd = message['cmd']
+        if cmd == 'inputs':
+            return {'values': self.motor.get_inputs()}
+        if cmd == 'stop':
+            self.motor.stop()
+            return {'ok': True}
+        if cmd == 'get' and message['line'] == 'SLP_PIN':
+            return {'value': self.motor.slp_line.get_value()}
+        if cmd == 'set' and message['line'] == 'SLP_PIN':
+            self.motor.slp_line.set_value(message['value'])
+            return {'ok': True}
+        if cmd == 'info':
+            return {'pid': os.getpid(), 'realtime': self.realtime, 'cpu': self.cpu, 'moves': self.moves}
+        return {'error': f'Unknown command {cmd}'}
+
+    def serve(self):
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        server.bind(self.socket_path)
+        os.chmod(self.socket_path, 0o660)
+        server.listen()
+
+        motor_thread = threading.Thread(target=self.run_motor, daemon=True)
+        motor_thread.start()
+        logging.info(f"Motor daemon listening on {self.socket_path}")
+        while True:
+            connection, _ = server.accept()
+            thread = threading.Thread(target=self.handle, args=(connection,), daemon=True)
+            thread.start()
+
+
+def load_coop_config(name):
+    configs = [{}]
+    if os.path.exists(CONFIG_FILE):
+        with open(CONFIG_FILE) as f:
+            configs = json.load(f)['coops']
+    for config in configs:
+        config = {**DEFAULT_COOP, **config}
+        if config['name'] == name:
+            return config
+    raise ValueError(f"No coop named {name} in {CONFIG_FILE}")
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    config = load_coop_config(sys.argv[1] if len(sys.argv) > 1 else DEFAULT_COOP['name'])
+    settings = daemon_settings(config['name'], config.get('motor_daemon') or {})
+    pins = {**DEFAULT_PIN_ASSIGNMENTS, **config.get('pins', {})}
+
+    gpiod = gpio.load_backend(config['gpio_chip'])
+    chip = gpiod.Chip(config['gpio_chip'])
+    motor = LocalMotor(chip, pins, f"chicken_door_motor_{config['name']}", gpiod)
+    motor.slp_line.set_value(0)
+    if isinstance(chip, gpio.SimulatedChip):
+        chip.door = gpio.SimulatedDoor(chip, pins, config['sim_travel_steps'])
+
+    daemon = MotorDaemon(motor, settings['socket'], settings['cpu'], settings['priority'])
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    try:
+        daemon.serve()
+    finally:
+        motor.slp_line.set_value(0)
+        motor.release()
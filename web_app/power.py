@@ -0,0 +1,117 @@
+import logging
+import threading
+
+from clock import system_clock
+
+# Driver power states
+SLEEPING = 'sleeping'
+MOVING = 'moving'
+HOLDING = 'holding'
+
+
+class DriverPower:
+    # Drives the stepper driver's SLP pin: awake while stepping, holding for hold_time afterwards, asleep otherwise.
+    # hold_time None keeps the torque on indefinitely, which was the behaviour before this existed.
+    def __init__(self, slp_line, hold_time=30, wake_delay=0.002, move_watts=6.0, hold_watts=3.0, sleep_watts=0.05, log=None,
+                 clock=system_clock):
+        self.slp_line = slp_line
+        self.clock = clock
+        self.hold_time = hold_time
+        self.wake_delay = wake_delay  # Charge pump settle time after SLP goes high, 1.7 ms for a DRV8825
+        self.watts = {MOVING: move_watts, HOLDING: hold_watts, SLEEPING: sleep_watts}
+        self.log = log or logging.getLogger(__name__)
+
+        self.lock = threading.Lock()
+        self.state = SLEEPING
+        self.hold_until = None
+        self.manual_hold = False
+        self.since = clock.monotonic()
+        self.started = self.since
+        self.seconds = dict.fromkeys(self.watts, 0.0)
+        self.wakeups = 0
+
+    def set_state(self, state):
+        # Caller holds the lock
+        now = self.clock.monotonic()
+        self.seconds[self.state] += now - self.since
+        self.since = now
+        if state == self.state:
+            return
+        if state == SLEEPING:
+            self.slp_line.set_value(0)
+        elif self.state == SLEEPING:
+            self.slp_line.set_value(1)
+            self.wakeups += 1
+        self.log.info(f"Motor driver {self.state} -> {state}.")
+        self.state = state
+
+    def start(self):
+        with self.lock:
+            # Whatever the pin was left at, start from a known state
+            self.slp_line.set_value(0)
+            self.state = SLEEPING
+            if self.hold_time is None:
+                self.set_state(HOLDING)
+
+    def wake(self):
+        # Called by the motor thread before a step train
+        with self.lock:
+            was_sleeping = self.state == SLEEPING
+            self.set_state(MOVING)
+        if was_sleeping:
+            self.clock.sleep(self.wake_delay)
+
+    def release(self):
+        # Called after a step train; the torque is held for a while so the door settles
+        with self.lock:
+            self.set_state(HOLDING)
+            self.hold_until = None if self.hold_time is None else self.clock.monotonic() + self.hold_time
+
+    def hold(self, enable):
+        # Manual override from the dashboard: hold indefinitely, or sleep right away
+        with self.lock:
+            self.manual_hold = enable
+            if self.state == MOVING:
+                return
+            if enable:
+                self.set_state(HOLDING)
+                self.hold_until = None
+            else:
+                self.set_state(SLEEPING)
+
+    def tick(self):
+        # Called periodically by the input thread; returns whether the driver went to sleep
+        with self.lock:
+            if self.state == HOLDING and not self.manual_hold and self.hold_until is not None \
+                    and self.clock.monotonic() >= self.hold_until:
+                self.set_state(SLEEPING)
+                return True
+            self.set_state(self.state)
+            return False
+
+    def awake(self):
+        return self.state != SLEEPING
+
+    def status(self):
+        with self.lock:
+            return {
+                'driver_state': self.state,
+                'driver_hold_time': self.hold_time,
+                'driver_manual_hold': self.manual_hold,
+                'driver_wakeups': self.wakeups,
+            }
+
+    def telemetry(self):
+        # Counters that grow every second, kept out of the cached status
+        with self.lock:
+            self.set_state(self.state)
+            total = max(self.clock.monotonic() - self.started, 1e-9)
+            energy = sum(self.seconds[state] * watts for state, watts in self.watts.items()) / 3600
+            always_on = total * self.watts[HOLDING] / 3600
+            return {
+                'driver_duty_cycle': round((self.seconds[MOVING] + self.seconds[HOLDING]) / total, 4),
+                'driver_seconds': {state: round(seconds, 1) for state, seconds in self.seconds.items()},
+                'driver_energy_wh': round(energy, 3),
+                # Estimate against leaving the driver holding all the time
+                'driver_energy_saved_wh': round(max(always_on - energy, 0), 3),
+            }
@@ -0,0 +1,179 @@
+import os
+import sys
+import time
+import logging
+import threading
+from collections import Counter
+
+# Sampling profiler: stacks of every thread are read from sys._current_frames() at a fixed rate,
+# so nothing is instrumented and the cost is paid only while it runs
+DEFAULT_SAMPLE_RATE = 50  # Samples per second
+MAX_SAMPLE_RATE = 1000
+MAX_PROFILE_SECONDS = 600  # A forgotten profiler stops by itself
+MAX_STACK_DEPTH = 64
+MIN_CPU_WINDOW = 1  # Seconds of profiling before CPU shares are reported
+STALL_INTERVALS = 5  # A loop is reported stalled after this many missed intervals
+
+
+class Heartbeat:
+    # Beaten once per loop iteration; lag is how much later than its interval the loop came round
+    def __init__(self, name, interval):
+        self.name = name
+        self.interval = interval
+        self.beats = 0
+        self.last = None
+        self.lag = 0.0
+        self.max_lag = 0.0
+        self.active = True
+
+    def beat(self):
+        now = time.monotonic()
+        if self.last is not None:
+            self.lag = max(0.0, now - self.last - self.interval)
+            self.max_lag = max(self.max_lag, self.lag)
+        self.last = now
+        self.beats += 1
+        self.active = True
+
+    def done(self):
+        # The loop ended on purpose, e.g. a camera that was switched off
+        self.active = False
+
+    def status(self):
+        age = None if self.last is None else time.monotonic() - self.last
+        stalled = self.active and age is not None and age > self.interval * STALL_INTERVALS + 1
+        return {'interval_s': self.interval, 'beats': self.beats, 'active': self.active, 'stalled': stalled,
+                'last_beat_age_s': None if age is None else round(age, 3),
+                'lag_ms': round(self.lag * 1000, 1), 'max_lag_ms': round(self.max_lag * 1000, 1)}
+
+
+heartbeats = {}
+heartbeats_lock = threading.Lock()
+
+
+def heartbeat(name, interval):
+    # One heartbeat per loop name; a restarted loop keeps its counters
+    with heartbeats_lock:
+        if name not in heartbeats:
+            heartbeats[name] = Heartbeat(name, interval)
+        beat = heartbeats[name]
+        beat.interval = interval
+        return beat
+
+
+def thread_cpu():
+    # CPU seconds per live thread, which is what tells a busy thread from one that is waiting
+    cpu = {}
+    for thread in threading.enumerate():
+        try:
+            cpu[thread.name] = time.clock_gettime(time.pthread_getcpuclockid(thread.ident))
+        except (AttributeError, OSError, TypeError):
+            pass
+    return cpu
+
+
+class SamplingProfiler:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.thread = None
+        self.running = False
+        self.rate = DEFAULT_SAMPLE_RATE
+        self.stacks = Counter()  # (thread name, folded stack) -> samples
+        self.labels = {}  # Code object -> frame label, formatted once per function
+        self.samples = 0
+        self.sampling_time = 0.0
+        self.started_at = None
+        self.stopped_at = None
+        self.deadline = None
+        self.cpu_start = {}
+        self.cpu_end = None
+
+    def start(self, rate=DEFAULT_SAMPLE_RATE, duration=MAX_PROFILE_SECONDS):
+        with self.lock:
+            if self.running:
+                return False
+            self.rate = max(1, min(rate, MAX_SAMPLE_RATE))
+            self.stacks = Counter()
+            self.samples = 0
+            self.sampling_time = 0.0
+            self.started_at = time.monotonic()
+            self.stopped_at = None
+            self.deadline = self.started_at + min(duration, MAX_PROFILE_SECONDS)
+            self.cpu_start = thread_cpu()
+            self.cpu_end = None
+            self.running = True
+            self.thread = threading.Thread(target=self.run, name='profiler', daemon=True)
+            self.thread.start()
+        logging.info(f"Profiler started at {self.rate} Hz")
+        return True
+
+    def stop(self):
+        with self.lock:
+            if not self.running:
+                return False
+            self.running = False
+        self.thread.join(timeout=2)
+        return True
+
+    def run(self):
+        interval = 1.0 / self.rate
+        own_id = threading.get_ident()
+        next_sample = time.monotonic()
+        while self.running and time.monotonic() < self.deadline:
+            started = time.perf_counter()
+            self.sample(own_id)
+            self.sampling_time += time.perf_counter() - started
+            next_sample += interval
+            delay = next_sample - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                next_sample = time.monotonic()  # Falling behind; skip samples rather than burst
+        self.cpu_end = thread_cpu()
+        self.running = False
+        self.stopped_at = time.monotonic()
+        logging.info(f"Profiler stopped after {self.samples} samples, overhead {self.overhead_percent()}%")
+
+    def sample(self, own_id):
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident == own_id:
+                continue
+            labels = []
+            while frame is not None and len(labels) < MAX_STACK_DEPTH:
+                code = frame.f_code
+                label = self.labels.get(code)
+                if label is None:
+                    label = self.labels[code] = f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+                labels.append(label)
+                frame = frame.f_back
+            labels.reverse()
+            self.stacks[(names.get(ident, f'thread-{ident}'), ';'.join(labels))] += 1
+        self.samples += 1
+
+    def overhead_percent(self):
+        if self.started_at is None:
+            return 0.0
+        elapsed = (self.stopped_at or time.monotonic()) - self.started_at
+        return round(100 * self.sampling_time / elapsed, 2) if elapsed else 0.0
+
+    def folded(self, thread=None):
+        # Brendan Gregg's folded format, one "thread;outer;...;inner count" line per stack,
+        # ready for flamegraph.pl or speedscope
+        lines = [f"{name};{stack} {count}" for (name, stack), count in sorted(self.stacks.items())
+                 if thread is None or name == thread]
+        return '\n'.join(lines) + '\n'
+
+    def summary(self):
+        # Stacks are wall-clock samples, so a sleeping loop shows up as often as a busy one;
+        # the CPU share per thread says which of them actually burns the CPU
+        elapsed = ((self.stopped_at or time.monotonic()) - self.started_at) if self.started_at else 0
+        cpu_end = self.cpu_end or thread_cpu()
+        cpu = {name: round(100 * (seconds - self.cpu_start[name]) / elapsed, 1)
+               for name, seconds in cpu_end.items() if name in self.cpu_start} if elapsed >= MIN_CPU_WINDOW else {}
+        return {'running': self.running, 'rate_hz': self.rate, 'samples': self.samples, 'seconds': round(elapsed, 1),
+                'overhead_percent': self.overhead_percent(), 'unique_stacks': len(self.stacks),
+                'cpu_percent': dict(sorted(cpu.items(), key=lambda item: -item[1]))}
+
+
+profiler = SamplingProfiler()
@@ -0,0 +1,68 @@
+from datetime import datetime, time, timedelta, timezone
+
+from clock import system_clock
+
+
+class DailyJob:
+    def __init__(self, at, job_func):
+        self.at = at  # Wall clock time in the scheduler's timezone
+        self.job_func = job_func
+        self.next_run = None  # Aware datetime in the scheduler's timezone
+        self.last_run = None
+
+    def __repr__(self):
+        return f"DailyJob({self.job_func.__name__} at {self.at.strftime('%H:%M')}, next {self.next_run})"
+
+
+class DailyScheduler:
+    # Runs jobs once a day at a wall clock time of the coop's timezone. Unlike the schedule library, which reads
+    # the system clock in the system timezone, the time comes from an injectable clock.
+    def __init__(self, tz, clock=system_clock, on_run=None):
+        self.tz = tz
+        self.clock = clock
+        self.on_run = on_run  # Called with (job, due, started) after every run, e.g. by the simulator
+        self.jobs = []
+
+    def every_day_at(self, at, job_func):
+        # at is "HH:MM"
+        hour, minute = map(int, at.split(':'))
+        job = DailyJob(time(hour, minute), job_func)
+        job.next_run = self.next_occurrence(job.at, self.clock.now(self.tz))
+        self.jobs.append(job)
+        return job
+
+    def next_occurrence(self, at, after):
+        day = after.date()
+        while True:
+            # The round trip through UTC moves a wall clock time skipped by a DST change forward;
+            # a time that occurs twice runs at its first occurrence only
+            candidate = datetime.combine(day, at, tzinfo=self.tz).astimezone(timezone.utc).astimezone(self.tz)
+            # Aware datetimes of the same zone compare by wall clock, timestamps compare the actual instants
+            if candidate.timestamp() > after.timestamp():
+                return candidate
+            day += timedelta(days=1)
+
+    def run_pending(self):
+        now = self.clock.time()
+        due_jobs = sorted((job for job in self.jobs if job.next_run.timestamp() <= now),
+                          key=lambda job: job.next_run.timestamp())
+        for job in due_jobs:
+            if job not in self.jobs:
+                continue  # Cleared by a job that ran before it, e.g. the daily reschedule
+            due = job.next_run
+            started = self.clock.now(self.tz)
+            job.job_func()
+            # A job that missed several days because the clock jumped runs once, then on its next day
+            job.last_run = started
+            job.next_run = self.next_occurrence(job.at, started)
+            if self.on_run is not None:
+                self.on_run(job, due, started)
+
+    def next_run_time(self):
+        return min((job.next_run for job in self.jobs), key=lambda next_run: next_run.timestamp(), default=None)
+
+    def get_jobs(self):
+        return list(self.jobs)
+
+    def clear(self):
+        self.jobs = []
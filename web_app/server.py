@@ -0,0 +1,21 @@
+import os
+import logging
+from waitress import serve
+
+from app import create_app, start_services
+from stream_slots import WORKER_THREADS
+
+# Server settings
+HOST = '0.0.0.0'
+PORT = int(os.environ.get('CHICKEN_DOOR_PORT', 5000))
+MAX_CONNECTIONS = 64  # Further connections wait in the listen backlog
+CHANNEL_TIMEOUT = 60  # Seconds before an idle keep-alive connection is closed
+OUTBUF_HIGH_WATERMARK = 1024 * 1024  # Slow viewers block their stream instead of buffering frames
+
+if __name__ == '__main__':
+    app = create_app()
+    start_services()
+    logging.info(f"Starting production server on {HOST}:{PORT} with {WORKER_THREADS} workers.")
+    serve(app, host=HOST, port=PORT, threads=WORKER_THREADS, connection_limit=MAX_CONNECTIONS,
+          channel_timeout=CHANNEL_TIMEOUT, outbuf_high_watermark=OUTBUF_HIGH_WATERMARK,
+          ident='chicken_door')
@@ -0,0 +1,59 @@
+import os
+import sys
+import json
+import time
+import signal
+import argparse
+import tempfile
+import subprocess
+
+# Runs several app.py instances on simulated GPIO plus the aggregator, for testing the fleet locally
+BASE_PORT = 5001
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a simulated fleet of coop nodes and the aggregator.")
+    parser.add_argument('--nodes', type=int, default=5)
+    parser.add_argument('--coops-per-node', type=int, default=2)
+    parser.add_argument('--base-port', type=int, default=BASE_PORT)
+    args = parser.parse_args()
+
+    here = os.path.dirname(os.path.abspath(__file__))
+    workdir = tempfile.mkdtemp(prefix='chicken_fleet_')
+    processes = []
+    nodes = []
+    for i in range(args.nodes):
+        config_path = os.path.join(workdir, f'node{i}.json')
+        with open(config_path, 'w') as f:
+            json.dump({'coops': [{'name': f'coop{j}', 'gpio_chip': f'sim{j}', 'delay': 0.0005,
+                                  'camera': {'enabled': False}, 'timelapse': {'enabled': False}}
+                                 for j in range(args.coops_per_node)]}, f)
+        port = args.base_port + i
+        # Every node uses the same coop names, so each gets its own home for state, journal, logs and
+        # timelapses, and its own command bus socket
+        home = os.path.join(workdir, f'node{i}')
+        os.makedirs(home)
+        env = dict(os.environ, CHICKEN_DOOR_CONFIG=config_path, CHICKEN_DOOR_PORT=str(port), HOME=home,
+                   CHICKEN_DOOR_BUS=os.path.join(home, 'command_bus.sock'))
+        processes.append(subprocess.Popen([sys.executable, os.path.join(here, 'server.py')], env=env))
+        nodes.append({'name': f'node{i}', 'url': f'http://127.0.0.1:{port}'})
+
+    fleet_path = os.path.join(workdir, 'fleet.json')
+    with open(fleet_path, 'w') as f:
+        json.dump({'nodes': nodes}, f)
+    env = dict(os.environ, CHICKEN_DOOR_FLEET=fleet_path)
+    processes.append(subprocess.Popen([sys.executable, os.path.join(here, 'aggregator.py')], env=env))
+    print(f"Started {args.nodes} simulated nodes, aggregator on http://127.0.0.1:5100 (configs in {workdir})")
+
+    try:
+        while all(p.poll() is None for p in processes):
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for p in processes:
+            p.send_signal(signal.SIGINT)
+        for p in processes:
+            p.wait()
+
+if __name__ == '__main__':
+    main()
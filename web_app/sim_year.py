@@ -0,0 +1,335 @@
+import sys
+import json
+import time
+import logging
+import argparse
+import tempfile
+from datetime import date, datetime, timedelta
+from zoneinfo import ZoneInfo
+from collections import Counter, defaultdict
+
+from astral.sun import sun
+
+import coop as coop_module
+from coop import Coop, DEFAULT_COOP, CATCH_UP_GROUPS
+from clock import VirtualClock
+from power import HOLDING
+
+# Runs one coop on simulated GPIO and a virtual clock through a whole year of scheduled events in seconds.
+# Usage: python sim_year.py [--config coops.json] [--coop main] [--year 2026] [--outage 2026-06-10T21:00+8]
+#                           [--unjournaled door]
+SCHEDULER_TICK = 60  # Same cadence as run_scheduler in app.py, which bounds how late an event can run
+MOVE_JOBS = {'open_door': 'open', 'close_door': 'closed'}
+SUN_JOBS = ('open_door', 'close_door', 'light_on_event', 'light_off_event')
+
+# The schedule's offsets from the sun, written out here so Coop.event_times is checked, not reused
+OPEN_BEFORE_SUNRISE = timedelta(minutes=20)
+CLOSE_AFTER_SUNSET = timedelta(minutes=30)
+LIGHT_AROUND_CLOSE = timedelta(minutes=15)  # Light on before the door closes, off after it
+SUN_CHECK_DATES = ((3, 20), (6, 21), (9, 22), (12, 21))  # Month and day in the simulated year
+
+# Schedule of the default coop (Hamburg, Europe/Berlin) on both sides of the 2026 DST changes, as local date,
+# event and local minute with UTC offset; the sun times behind them agree with NOAA's to a few minutes
+DST_CASES = (
+    ('2026-03-28', 'open_door', '05:43+01:00'),
+    ('2026-03-28', 'close_door', '19:17+01:00'),
+    ('2026-03-29', 'open_door', '06:41+02:00'),
+    ('2026-03-29', 'light_on_event', '20:04+02:00'),
+    ('2026-03-29', 'close_door', '20:19+02:00'),
+    ('2026-03-29', 'light_off_event', '20:34+02:00'),
+    ('2026-10-24', 'open_door', '07:44+02:00'),
+    ('2026-10-24', 'close_door', '18:33+02:00'),
+    ('2026-10-25', 'open_door', '06:45+01:00'),
+    ('2026-10-25', 'light_on_event', '17:16+01:00'),
+    ('2026-10-25', 'close_door', '17:31+01:00'),
+    ('2026-10-25', 'light_off_event', '17:46+01:00'),
+)
+
+
+def load_config(path, name):
+    configs = [{}]
+    if path:
+        with open(path) as f:
+            configs = json.load(f)['coops']
+    for config in configs:
+        if {**DEFAULT_COOP, **config}['name'] == name:
+            return config
+    raise ValueError(f"No coop named {name} in {path}")
+
+
+def independent_times(coop, day):
+    # The schedule straight from astral and the offsets above; the scheduler has minute resolution
+    s = sun(coop.location.observer, date=day, tzinfo=coop.location.timezone)
+    close = s['sunset'] + CLOSE_AFTER_SUNSET
+    times = {
+        'open_door': s['sunrise'] - OPEN_BEFORE_SUNRISE,
+        'light_on_event': close - LIGHT_AROUND_CLOSE,
+        'close_door': close,
+        'light_off_event': close + LIGHT_AROUND_CLOSE,
+    }
+    return {name: moment.replace(second=0, microsecond=0) for name, moment in times.items()}
+
+
+def check_event_times(coop, year):
+    # Coop.event_times against astral at fixed dates and, for the default location, the DST cases above.
+    # A moment must match in absolute time and in UTC offset, since the scheduler takes the local minute.
+    cases = []
+    for month, day in SUN_CHECK_DATES:
+        day = date(year, month, day)
+        cases += [(day, name, moment) for name, moment in independent_times(coop, day).items()]
+    location = coop.location
+    if (location.latitude, location.longitude, location.timezone.key) == \
+            (DEFAULT_COOP['latitude'], DEFAULT_COOP['longitude'], DEFAULT_COOP['timezone']):
+        cases += [(date.fromisoformat(day), name, datetime.fromisoformat(f'{day}T{moment}'))
+                  for day, name, moment in DST_CASES]
+    wrong = []
+    for day, name, expected in cases:
+        moment = coop.event_times(day)[name]
+        if moment.timestamp() != expected.timestamp() or moment.utcoffset() != expected.utcoffset():
+            wrong.append((day, name, moment, expected))
+    return len(cases), wrong
+
+
+class YearSimulation:
+    def __init__(self, config, start, days, tick, outages=(), unjournaled=()):
+        self.clock = VirtualClock(start)
+        self.config = config
+        self.start = start
+        self.coop = self.new_coop(config)
+        self.tz = self.coop.location.timezone
+        self.end = start.timestamp() + days * 86400
+        self.tick = tick
+        self.runs = []
+        self.ran_this_tick = []
+        self.outages = sorted(outages)  # (start, end) as aware datetimes
+        self.power_cuts = []
+        self.unjournaled = set(unjournaled)  # Groups taken out of the journal at every power cut
+
+    def new_coop(self, config):
+        coop = Coop(config, self.clock)
+        coop.scheduler.on_run = self.on_run
+        return coop
+
+    def on_run(self, job, due, started):
+        run = {'job': job.job_func.__name__, 'due': due, 'started': started}
+        self.runs.append(run)
+        self.ran_this_tick.append(run)
+
+    def wait_for_motor(self):
+        # Moves run on the coop's motor thread, which advances the virtual clock with every step delay
+        while self.coop.pending_moves:
+            time.sleep(0.0005)
+
+    def sleep(self, seconds):
+        # The input thread puts the driver to sleep when its hold time is over, between scheduler ticks
+        target = self.clock.monotonic() + seconds
+        power = self.coop.power
+        if power.state == HOLDING and power.hold_until is not None and power.hold_until < target:
+            self.clock.sleep(power.hold_until - self.clock.monotonic())
+            power.tick()
+        self.clock.sleep(target - self.clock.monotonic())
+
+    def power_cut(self, start, end):
+        # Everything stops, the door stays where it is, and a new coop starts from the state journal
+        cut = self.clock.now(self.tz)
+        door = self.coop.chip.door.position
+        door_state, light_on = self.coop.door_state(), self.coop.light_on
+        self.coop.cleanup()
+        if self.unjournaled:
+            # As if these groups never ran since the journal was created, e.g. by a light event; the
+            # restart must then leave them alone instead of treating them as last run at the epoch
+            handled = self.coop.state_store.get('handled_events', {})
+            self.coop.state_store.flush(handled_events={group: moment for group, moment in handled.items()
+                                                        if group not in self.unjournaled})
+        self.clock.advance_to(end.timestamp())
+        self.coop = self.new_coop({**self.config, 'sim_door_position': door})
+        self.coop.start()
+        self.wait_for_motor()
+        # What the schedule says the door and light should be after the latest events before the restart
+        restart = self.clock.now(self.tz)
+        due = [(moment, name) for day in (restart.date() - timedelta(days=1), restart.date())
+               for name, moment in self.coop.event_times(day).items() if moment <= restart]
+        latest = {name: max((event for event in due if event[1] in names), key=lambda event: event[0].timestamp())[1]
+                  for name, names in (('door', MOVE_JOBS), ('light', ('light_on_event', 'light_off_event')))}
+        self.power_cuts.append({
+            'start': cut, 'end': restart, 'recovery': self.coop.recovery, 'unjournaled': sorted(self.unjournaled),
+            'door_state': self.coop.door_state(),
+            'expected_door': door_state if 'door' in self.unjournaled else MOVE_JOBS[latest['door']],
+            'light_on': self.coop.light_on,
+            'expected_light': light_on if 'light' in self.unjournaled else latest['light'] == 'light_on_event',
+        })
+
+    def run(self):
+        self.coop.start()
+        while self.clock.time() < self.end:
+            if self.outages and self.clock.time() >= self.outages[0][0].timestamp():
+                self.power_cut(*self.outages.pop(0))
+                continue
+            self.ran_this_tick = []
+            self.coop.scheduler.run_pending()
+            self.wait_for_motor()
+            for run in self.ran_this_tick:
+                if run['job'] in MOVE_JOBS:
+                    run['finished'] = self.clock.now(self.tz)
+                    run['door_state'] = self.coop.door_state()
+                elif run['job'] in ('light_on_event', 'light_off_event'):
+                    run['light_on'] = self.coop.light_on
+            self.sleep(self.tick)
+        self.coop.cleanup()
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))] if values else None
+
+
+def report(simulation, days, elapsed):
+    coop = simulation.coop
+    runs = simulation.runs
+    tz = simulation.tz
+    print(f"Simulated {days} days of coop '{coop.name}' ({tz.key}, {coop.location.latitude}, {coop.location.longitude}) "
+          f"in {elapsed:.1f} s, {days * 86400 / elapsed:,.0f}x real time")
+
+    # One run of every job per local day, except on days with a power cut, which the catch-up covers
+    per_day = defaultdict(Counter)
+    for run in runs:
+        per_day[run['due'].date()][run['job']] += 1
+    for cut in simulation.power_cuts:
+        day = cut['start'].date()
+        while day <= cut['end'].date():
+            per_day.pop(day, None)
+            day += timedelta(days=1)
+    counts = Counter(run['job'] for run in runs)
+    jobs = SUN_JOBS + ('schedule_door_events',)
+    print("\nEvent counts:")
+    for name in jobs:
+        wrong_days = [day for day in sorted(per_day) if per_day[day][name] != 1]
+        print(f"  {name:22} {counts[name]:5}  days without exactly one run: {len(wrong_days)}"
+              + (f" ({', '.join(str(day) for day in wrong_days[:5])})" if wrong_days else ""))
+
+    print("\nLateness after the scheduled minute (s):")
+    for name in jobs:
+        late = [(run['started'] - run['due']).total_seconds() for run in runs if run['job'] == name]
+        if late:
+            print(f"  {name:22} mean {sum(late) / len(late):6.1f}  p95 {percentile(late, 0.95):6.1f}  max {max(late):6.1f}")
+    for name in MOVE_JOBS:
+        done = [(run['finished'] - run['due']).total_seconds() for run in runs if run['job'] == name]
+        if done:
+            print(f"  {name + ' (door at limit)':22} mean {sum(done) / len(done):6.1f}  p95 {percentile(done, 0.95):6.1f}  max {max(done):6.1f}")
+
+    # Coop.event_times itself, checked against values computed without it
+    checked, wrong_times = check_event_times(coop, simulation.start.year)
+    print(f"\nEvent times not matching independent sun times: {len(wrong_times)} of {checked}")
+    for day, name, moment, expected in wrong_times:
+        print(f"  {day} {name:22} {moment.isoformat()} expected {expected.isoformat()}")
+
+    # Scheduled minute against the event times of that day, which catches scheduler timezone and DST mistakes
+    misaligned = []
+    expected_by_day = {}
+    for run in runs:
+        if run['job'] not in SUN_JOBS:
+            continue
+        day = run['due'].date()
+        if day not in expected_by_day:
+            expected_by_day[day] = coop.event_times(day)
+        expected = expected_by_day[day][run['job']]
+        if run['due'].timestamp() != expected.timestamp():
+            misaligned.append((run, expected))
+    print(f"\nSun events not at their expected minute: {len(misaligned)}")
+    for run, expected in misaligned[:10]:
+        print(f"  {run['job']:22} ran {run['due'].isoformat()} expected {expected.isoformat()}")
+
+    outcomes = Counter((run['job'], run['door_state']) for run in runs if run['job'] in MOVE_JOBS)
+    failed = sum(count for (name, state), count in outcomes.items() if state != MOVE_JOBS[name])
+    lights = Counter((run['job'], run['light_on']) for run in runs if 'light_on' in run)
+    print("\nDoor and light:")
+    print(f"  moves ending at the wrong limit: {failed} of {sum(outcomes.values())}")
+    print(f"  light events leaving the wrong state: "
+          f"{lights[('light_on_event', False)] + lights[('light_off_event', True)]} of {sum(lights.values())}")
+    print(f"  learned travel {coop.travel_steps} steps, anomalies {coop.motion_model.anomaly_count}, "
+          f"state writes {coop.state_store.writes}")
+    power = {**coop.power.status(), **coop.power.telemetry()}
+    print(f"  driver wakeups {power['driver_wakeups']}, duty cycle {power['driver_duty_cycle']:.4%}, "
+          f"energy {power['driver_energy_wh']} Wh (saved {power['driver_energy_saved_wh']} Wh)")
+
+    recovered = True
+    if simulation.power_cuts:
+        print("\nPower cuts:")
+    for cut in simulation.power_cuts:
+        recovery = cut['recovery']
+        skipped = [name for group, names in CATCH_UP_GROUPS if group in cut['unjournaled'] for name in names]
+        ok = cut['door_state'] == cut['expected_door'] and cut['light_on'] == cut['expected_light'] and \
+            not any(event['event'] in skipped for event in recovery['caught_up'])
+        recovered = recovered and ok
+        caught_up = ', '.join(event['event'] for event in recovery['caught_up']) or 'nothing'
+        print(f"  {cut['start'].strftime('%m-%d %H:%M')} to {cut['end'].strftime('%m-%d %H:%M')}: "
+              f"state restored in {recovery['restored_ms']} ms, caught up {caught_up}; "
+              f"door {cut['door_state']} (expected {cut['expected_door']}), "
+              f"light {'on' if cut['light_on'] else 'off'} (expected {'on' if cut['expected_light'] else 'off'})"
+              + (f", not journaled: {', '.join(cut['unjournaled'])}" if cut['unjournaled'] else "")
+              + ("" if ok else "  WRONG"))
+
+    # Days whose UTC offset differs from the day before, with everything that ran around them
+    print("\nDST transitions:")
+    days_seen = sorted(per_day)
+    transitions = [day for previous, day in zip(days_seen, days_seen[1:])
+                   if offset_at_noon(day, tz) != offset_at_noon(previous, tz)]
+    if not transitions:
+        print("  none in this period")
+    for day in transitions:
+        print(f"  {day}: UTC{offset_at_noon(day - timedelta(days=1), tz)} -> UTC{offset_at_noon(day, tz)}")
+        for run in runs:
+            if day - timedelta(days=1) <= run['due'].date() <= day:
+                print(f"    {run['job']:22} due {run['due'].strftime('%m-%d %H:%M %z')}  "
+                      f"ran {run['started'].strftime('%H:%M:%S %z')}")
+    return not wrong_times and not misaligned and not failed and recovered and \
+        all(per_day[day][name] == 1 for day in per_day for name in jobs)
+
+
+def offset_at_noon(day, tz):
+    return datetime(day.year, day.month, day.day, 12, tzinfo=tz).strftime('%z')
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulate a year of scheduled door and light events on a virtual clock.")
+    parser.add_argument('--config', help="coops.json to take the coop from, defaults to the built-in defaults")
+    parser.add_argument('--coop', default=DEFAULT_COOP['name'])
+    parser.add_argument('--year', type=int, default=datetime.now().year)
+    parser.add_argument('--days', type=int, default=None, help="Defaults to the whole year")
+    parser.add_argument('--tick', type=float, default=SCHEDULER_TICK, help="Seconds between scheduler checks")
+    parser.add_argument('--travel-steps', type=int, default=None, help="Door travel of the simulated door")
+    parser.add_argument('--outage', action='append', default=[], metavar='START+HOURS',
+                        help="Power cut at a local time, e.g. 2026-06-10T21:00+8; may be repeated")
+    parser.add_argument('--unjournaled', action='append', default=[], choices=[group for group, _ in CATCH_UP_GROUPS],
+                        help="Take a group out of the journal at every power cut, as if it never ran; may be repeated")
+    parser.add_argument('--verbose', action='store_true')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.ERROR,
+                        format='%(asctime)s - %(levelname)s - %(message)s')
+
+    config = {**load_config(args.config, args.coop), 'gpio_chip': 'sim0', 'motor_daemon': None,
+              'camera': {'enabled': False}, 'timelapse': {'enabled': False}}
+    if args.travel_steps:
+        config['sim_travel_steps'] = args.travel_steps
+    # Position and travel model go to a scratch directory, not the real state file
+    workdir = tempfile.mkdtemp(prefix='chicken_year_')
+    coop_module.STATE_DIR = workdir
+    coop_module.TIMELAPSE_DIR = workdir
+
+    tz = ZoneInfo({**DEFAULT_COOP, **config}['timezone'])
+    start = datetime(args.year, 1, 1, tzinfo=tz)
+    days = args.days or (datetime(args.year + 1, 1, 1) - datetime(args.year, 1, 1)).days
+    outages = []
+    for outage in args.outage:
+        begin, hours = outage.rsplit('+', 1)
+        begin = datetime.fromisoformat(begin).replace(tzinfo=tz)
+        outages.append((begin, begin + timedelta(hours=float(hours))))
+    simulation = YearSimulation(config, start, days, args.tick, outages, args.unjournaled)
+    started = time.perf_counter()
+    simulation.run()
+    ok = report(simulation, days, time.perf_counter() - started)
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
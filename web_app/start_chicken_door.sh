@@ -1,3 +1,3 @@
 #!/bin/bash
 cd /home/cheuer/chicken_door/web_app
-/usr/bin/python3 app.py >> /home/cheuer/logs/chicken_door_startup.log 2>&1
\ No newline at end of file
+/usr/bin/python3 server.py >> /home/cheuer/logs/chicken_door_startup.log 2>&1
\ No newline at end of file
@@ -0,0 +1,83 @@
+import os
+import json
+import logging
+import threading
+
+from clock import system_clock
+
+
+class StateStore:
+    # Small JSON state file, replaced atomically. update() only changes memory, write_due() persists it at
+    # most once per min_interval from a thread that can afford an fsync; flush() writes at once.
+    def __init__(self, path, min_interval=1.0, clock=system_clock):
+        self.path = path
+        self.clock = clock
+        self.min_interval = min_interval
+        self.data = {}
+        self.dirty = False
+        self.last_write = 0
+        self.writes = 0
+        self.lock = threading.Lock()  # Held only to change or serialise data, never during file I/O
+        self.write_lock = threading.Lock()
+
+    def load(self):
+        try:
+            with open(self.path) as f:
+                self.data = json.load(f)
+        except FileNotFoundError:
+            self.data = {}
+        except ValueError as e:
+            logging.warning(f"Ignoring unreadable state file {self.path}: {str(e)}")
+            self.data = {}
+        return self.data
+
+    def get(self, key, default=None):
+        return self.data.get(key, default)
+
+    def update(self, **fields):
+        # Cheap enough for the motor's step loop
+        with self.lock:
+            self.data.update(fields)
+            self.dirty = True
+
+    def write_due(self):
+        if self.dirty and self.clock.monotonic() - self.last_write >= self.min_interval:
+            self.flush()
+
+    def flush(self, **fields):
+        # Serialised under the write lock, so a slower writer can never replace a newer file with older data
+        with self.write_lock:
+            with self.lock:
+                if fields:
+                    self.data.update(fields)
+                    self.dirty = True
+                if not self.dirty:
+                    return
+                text = json.dumps(self.data)
+                self.dirty = False
+            if not self.write(text):
+                with self.lock:
+                    self.dirty = True
+
+    def write(self, text):
+        directory = os.path.dirname(self.path)
+        os.makedirs(directory, exist_ok=True)
+        tmp_path = self.path + '.tmp'
+        try:
+            with open(tmp_path, 'w') as f:
+                f.write(text)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+            # Persist the rename itself
+            dir_fd = os.open(directory, os.O_RDONLY)
+            try:
+                os.fsync(dir_fd)
+            finally:
+                os.close(dir_fd)
+        except OSError as e:
+            logging.error(f"Failed to write state file {self.path}: {str(e)}")
+            return False
+        self.last_write = self.clock.monotonic()
+        self.writes += 1
+        return True
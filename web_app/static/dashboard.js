@@ -0,0 +1,299 @@
+var apiBase = document.body.dataset.apiBase;
+var inputsBeingEdited = {};
+
+function byId(id) {
+    return document.getElementById(id);
+}
+
+function getJSON(path) {
+    return fetch(apiBase + path).then(function (response) {
+        return response.json();
+    });
+}
+
+function postJSON(path, data) {
+    return fetch(apiBase + path, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify(data)
+    }).then(function (response) {
+        return response.json();
+    });
+}
+
+function setText(id, text) {
+    byId(id).textContent = text;
+}
+
+function setValue(id, value) {
+    var input = byId(id);
+    if (input && !inputsBeingEdited[id]) input.value = value;
+}
+
+function setActive(id, active) {
+    byId(id).querySelector('.button-state').classList.toggle('active', active);
+}
+
+function logMessage(message) {
+    var log = byId('log');
+    log.appendChild(document.createTextNode(message));
+    log.appendChild(document.createElement('br'));
+    log.scrollTop = log.scrollHeight;
+}
+
+function fetchLogs() {
+    fetch(apiBase + '/logs').then(function (response) {
+        // While a door moves the server pauses the log and the last one stays on screen
+        return response.ok ? response.text() : null;
+    }).then(function (text) {
+        if (text === null) return;
+        var pre = document.createElement('pre');
+        pre.textContent = text;
+        byId('log').replaceChildren(pre);
+    });
+}
+
+function control(action) {
+    fetch(apiBase + '/control/' + action).then(function () {
+        logMessage(action + ' command sent');
+        document.querySelectorAll('.button-state').forEach(function (state) {
+            state.classList.remove('active');
+        });
+        setActive(action, true);
+        if (action === 'stop') {
+            setTimeout(function () {
+                setActive('stop', false);
+            }, 1000);
+        }
+    });
+}
+
+function updateVariables() {
+    var spr = byId('spr').value;
+    var delay = byId('delay').value;
+    postJSON('/update_variables', { spr: spr, delay: delay }).then(function () {
+        logMessage('Variables updated - SPR: ' + spr + ', Delay: ' + delay);
+    });
+}
+
+function updatePins() {
+    var pinAssignments = {};
+    document.querySelectorAll('#pin-assignments input').forEach(function (input) {
+        pinAssignments[input.id] = parseInt(input.value);
+    });
+    postJSON('/update_pins', pinAssignments).then(function () {
+        logMessage('Pin assignments updated');
+    });
+}
+
+function updateScheduledEvents() {
+    getJSON('/scheduled_events').then(function (data) {
+        setText('next-open', data.next_open);
+        setText('next-close', data.next_close);
+        setText('next-light-on', data.next_light_on);
+        setText('next-light-off', data.next_light_off);
+    });
+}
+
+var cameraCodec = 'mjpeg';
+var player = null;  // The Media Source session playing the H.264 stream
+
+function fetchBuffer(path) {
+    return fetch(apiBase + path).then(function (response) {
+        if (!response.ok) throw new Error(path + ' answered ' + response.status);
+        return response.arrayBuffer();
+    });
+}
+
+function whenUpdated(buffer, update) {
+    return new Promise(function (resolve, reject) {
+        buffer.addEventListener('updateend', resolve, { once: true });
+        buffer.addEventListener('error', reject, { once: true });
+        update();
+    });
+}
+
+function startPlayer() {
+    var video = byId('video-player');
+    var session = { active: true };
+    var mediaSource = new MediaSource();
+    player = session;
+    video.src = URL.createObjectURL(mediaSource);
+
+    function restart() {
+        if (!session.active) return;
+        stopPlayer();
+        setTimeout(function () {
+            if (!player && cameraCodec === 'h264' && byId('video-player').style.display !== 'none') startPlayer();
+        }, 1000);
+    }
+
+    mediaSource.addEventListener('sourceopen', function () {
+        getJSON('/h264/segments').then(function (info) {
+            if (!session.active) return;
+            if (info.last === null) throw new Error('no segments yet');
+            var buffer = mediaSource.addSourceBuffer('video/mp4; codecs="' + info.codec + '"');
+            // Fragments are appended one after the other whatever their timestamps, so a skipped one leaves no gap
+            buffer.mode = 'sequence';
+
+            function follow(number) {
+                if (!session.active) return;
+                fetchBuffer('/h264/' + info.generation + '/' + number + '.m4s').then(function (data) {
+                    return whenUpdated(buffer, function () { buffer.appendBuffer(data); });
+                }).then(function () {
+                    var buffered = video.buffered;
+                    if (!buffered.length) return;
+                    var end = buffered.end(buffered.length - 1);
+                    // Stay near the live edge and keep the buffer short, a coop camera runs for days
+                    if (video.currentTime < buffered.start(0) || end - video.currentTime > 10) {
+                        video.currentTime = Math.max(buffered.start(0), end - 2);
+                    }
+                    if (video.currentTime - buffered.start(0) > 30) {
+                        return whenUpdated(buffer, function () { buffer.remove(0, video.currentTime - 10); });
+                    }
+                }).then(function () {
+                    follow(number + 1);
+                }).catch(restart);  // A new stream generation or a fragment that is gone already
+            }
+
+            // The newest complete fragment starts with a keyframe, so playback begins within one GOP
+            fetchBuffer('/h264/init.mp4').then(function (init) {
+                return whenUpdated(buffer, function () { buffer.appendBuffer(init); });
+            }).then(function () {
+                follow(info.last);
+            }).catch(restart);
+        }).catch(restart);
+    }, { once: true });
+}
+
+function stopPlayer() {
+    if (!player) return;
+    player.active = false;
+    player = null;
+    var video = byId('video-player');
+    video.removeAttribute('src');
+    video.load();
+}
+
+function showVideo(cameraOn, codec) {
+    var feed = byId('video-feed');
+    var video = byId('video-player');
+    if (codec) cameraCodec = codec;
+    var mjpeg = cameraOn && cameraCodec === 'mjpeg';
+    var h264 = cameraOn && cameraCodec === 'h264' && 'MediaSource' in window;
+    setActive('toggle_camera', cameraOn);
+    if (mjpeg) {
+        // Only reconnect when the stream was hidden, every reconnect opens a new stream on the server
+        if (feed.style.display === 'none') {
+            feed.src = apiBase + '/video_feed?' + new Date().getTime();
+        }
+        feed.style.display = '';
+    } else {
+        feed.style.display = 'none';
+        feed.removeAttribute('src');
+    }
+    if (h264) {
+        video.style.display = '';
+        if (!player) startPlayer();
+    } else {
+        video.style.display = 'none';
+        stopPlayer();
+    }
+}
+
+function updateButtonsAndLevers(data) {
+    var openDirection = data.door_open_direction;
+
+    setText('cw-label', openDirection === 'CW' ? 'OPEN (CW)' : 'CLOSE (CW)');
+    setText('ccw-label', openDirection === 'CCW' ? 'OPEN (CCW)' : 'CLOSE (CCW)');
+
+    setText('lever-cw-label', openDirection === 'CW' ? 'OPEN (CW)' : 'CLOSE (CW)');
+    setText('lever-ccw-label', openDirection === 'CCW' ? 'OPEN (CCW)' : 'CLOSE (CCW)');
+
+    var cwPressed = data.lever_cw_pressed;
+    var ccwPressed = data.lever_ccw_pressed;
+
+    byId('lever-cw').classList.toggle('open', openDirection === 'CW' && cwPressed);
+    byId('lever-cw').classList.toggle('closed', openDirection === 'CCW' && cwPressed);
+    byId('lever-ccw').classList.toggle('open', openDirection === 'CCW' && ccwPressed);
+    byId('lever-ccw').classList.toggle('closed', openDirection === 'CW' && ccwPressed);
+
+    // app_pycam.py serves this page too, without position tracking
+    var position = data.door_open_percent == null ? 'position unknown' : data.door_open_percent + '% open';
+    if (data.door_motion) {
+        position += ' (' + data.door_motion.steps_done + ' of ' + data.door_motion.steps_planned + ' steps)';
+    }
+    var anomaly = data.door_travel_model && data.door_travel_model.last_anomaly;
+    if (anomaly) {
+        position += ' - last anomaly ' + anomaly.time + ': ' + anomaly.problem;
+    }
+    setText('door-state', data.door_state || 'unknown');
+    setText('door-position', position);
+}
+
+function updateStatus() {
+    // The status ETag lets the browser cache turn unchanged polls into 304s
+    getJSON('/get_status').then(function (data) {
+        setValue('spr', data.spr);
+        setValue('delay', data.delay);
+        setActive('toggle_light', data.light_on);
+        showVideo(data.camera_on, data.camera_codec);
+        setValue('camera-width', data.camera_width);
+        setValue('camera-height', data.camera_height);
+        setValue('camera-framerate', data.camera_framerate);
+        setValue('camera-quality', data.camera_quality);
+        ['video-feed', 'video-player'].forEach(function (id) {
+            byId(id).width = data.camera_width;
+            byId(id).height = data.camera_height;
+        });
+        for (var key in data.pin_assignments) {
+            setValue(key, data.pin_assignments[key]);
+        }
+        updateButtonsAndLevers(data);
+    });
+    fetchLogs();
+    updateScheduledEvents();
+}
+
+['cw', 'ccw', 'stop', 'toggle_light'].forEach(function (action) {
+    byId(action).addEventListener('click', function () {
+        control(action);
+    });
+});
+
+byId('toggle_camera').addEventListener('click', function () {
+    fetch(apiBase + '/toggle_camera').then(function () {
+        logMessage('Camera toggle command sent');
+    });
+});
+
+byId('save_variables').addEventListener('click', updateVariables);
+
+document.querySelectorAll('#pin-assignments input').forEach(function (input) {
+    input.addEventListener('change', updatePins);
+});
+
+document.querySelectorAll('input[type="text"], input[type="number"]').forEach(function (input) {
+    input.addEventListener('focus', function () {
+        inputsBeingEdited[input.id] = true;
+    });
+    input.addEventListener('blur', function () {
+        inputsBeingEdited[input.id] = false;
+    });
+});
+
+byId('camera-settings-form').addEventListener('submit', function (e) {
+    e.preventDefault();
+    var data = {};
+    new FormData(this).forEach(function (value, name) {
+        data[name] = parseInt(value);
+    });
+    postJSON('/update_camera_settings', data).then(function (response) {
+        logMessage('Camera settings updated');
+        showVideo(response.camera_on);
+    });
+});
+
+// The page shell is cached on the server, so every value comes from the first status poll
+updateStatus();
+setInterval(updateStatus, 1000);
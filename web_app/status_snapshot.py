@@ -0,0 +1,31 @@
+import json
+import time
+import threading
+
+
+class StatusSnapshot:
+    # Latest status of a coop, serialised once per change so status requests only copy bytes
+    def __init__(self):
+        self.boot_id = format(int(time.time()), 'x')  # Keeps ETags unique across restarts
+        self.lock = threading.Lock()
+        self.state = {}
+        self.version = 0
+        self.published_at = None
+        self.current = (b'{}', f'{self.boot_id}-0')
+
+    def update(self, state):
+        # Returns whether anything changed; an unchanged state keeps its version and ETag. Compared as
+        # serialised bytes, so an object changed in place since the last update still counts as a change.
+        body = json.dumps(state).encode()
+        with self.lock:
+            if body == self.current[0]:
+                return False
+            self.version += 1
+            self.state = state
+            self.published_at = time.monotonic()
+            self.current = (body, f'{self.boot_id}-{self.version}')
+            return True
+
+    def get(self):
+        # Body and ETag of the same version
+        return self.current
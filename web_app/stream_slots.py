@@ -0,0 +1,34 @@
+import threading
+
+# Every open video feed, H.264 segment wait and timelapse playback holds one waitress worker thread until it
+# ends. The limit is for the whole process, across all coops and cameras, so streams can never take the
+# threads that serve the door controls and the status.
+WORKER_THREADS = 12  # Bounded pool running the Flask views, see server.py
+CONTROL_THREADS = 4  # Always left for the control API, status polls and the dashboard
+MAX_STREAM_CLIENTS = WORKER_THREADS - CONTROL_THREADS
+
+
+class StreamSlots:
+    def __init__(self, limit=MAX_STREAM_CLIENTS):
+        self.limit = limit
+        self.lock = threading.Lock()
+        self.active = 0
+        self.refused = 0
+
+    def acquire(self):
+        with self.lock:
+            if self.active >= self.limit:
+                self.refused += 1
+                return False
+            self.active += 1
+            return True
+
+    def release(self):
+        with self.lock:
+            self.active -= 1
+
+    def status(self):
+        return {'limit': self.limit, 'active': self.active, 'refused': self.refused}
+
+
+stream_slots = StreamSlots()
@@ -0,0 +1,168 @@
+import os
+import re
+import struct
+import bisect
+import logging
+import threading
+import queue
+from time import sleep
+from datetime import datetime, timedelta
+
+# Each archived frame is stored as a fixed header followed by the untouched JPEG bytes
+RECORD_MAGIC = b'TLF1'
+RECORD_HEADER = struct.Struct('<4sdI')  # magic, capture timestamp, JPEG length
+ARCHIVE_SUFFIX = '.tlapse'
+DAY_PATTERN = re.compile(r'^\d{4}-\d{2}-\d{2}$')
+
+
+class TimelapseArchive:
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.timestamps = []
+        self.offsets = []
+        self.lengths = []
+        self.end = 0
+        self.load_index()
+
+    def load_index(self):
+        if not os.path.exists(self.path):
+            return
+        size = os.path.getsize(self.path)
+        offset = 0
+        with open(self.path, 'rb') as f:
+            # Only the headers are read; frames are skipped with seeks
+            while offset + RECORD_HEADER.size <= size:
+                f.seek(offset)
+                magic, timestamp, length = RECORD_HEADER.unpack(f.read(RECORD_HEADER.size))
+                frame_offset = offset + RECORD_HEADER.size
+                if magic != RECORD_MAGIC or frame_offset + length > size:
+                    break
+                self.timestamps.append(timestamp)
+                self.offsets.append(frame_offset)
+                self.lengths.append(length)
+                offset = frame_offset + length
+        if offset != size:
+            logging.warning(f"Time-lapse archive {self.path} has a damaged tail at byte {offset}, it will be overwritten.")
+        self.end = offset
+
+    def append(self, jpeg, timestamp):
+        with self.lock:
+            mode = 'r+b' if os.path.exists(self.path) else 'wb'
+            with open(self.path, mode) as f:
+                f.seek(self.end)
+                f.write(RECORD_HEADER.pack(RECORD_MAGIC, timestamp, len(jpeg)))
+                f.write(jpeg)
+                f.truncate()
+            self.offsets.append(self.end + RECORD_HEADER.size)
+            self.lengths.append(len(jpeg))
+            self.timestamps.append(timestamp)
+            self.end += RECORD_HEADER.size + len(jpeg)
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    def read_frame(self, f, index):
+        f.seek(self.offsets[index])
+        return f.read(self.lengths[index])
+
+
+class Timelapse:
+    def __init__(self, directory, interval, retention_days):
+        self.directory = directory
+        self.interval = interval
+        self.retention_days = retention_days
+        self.enabled = True
+        self.paused = False  # Set by the governor while a door moves or the CPU is saturated
+        self.last_sample = 0
+        self.dropped = 0
+        self.archives = {}
+        self.archives_lock = threading.Lock()
+        self.write_queue = queue.Queue(maxsize=4)
+        self.writer_thread = None
+
+    def start(self):
+        os.makedirs(self.directory, exist_ok=True)
+        self.writer_thread = threading.Thread(target=self.write_frames, daemon=True)
+        self.writer_thread.start()
+        logging.info(f"Time-lapse started: one frame every {self.interval}s into {self.directory}")
+
+    def on_frame(self, jpeg, timestamp):
+        # Called from the frame reader, so this must never block or decode
+        if not self.enabled or self.paused or self.writer_thread is None:
+            return
+        if timestamp - self.last_sample < self.interval:
+            return
+        self.last_sample = timestamp
+        try:
+            self.write_queue.put_nowait((jpeg, timestamp))
+        except queue.Full:
+            self.dropped += 1
+
+    def write_frames(self):
+        current_day = None
+        while True:
+            jpeg, timestamp = self.write_queue.get()
+            day = datetime.fromtimestamp(timestamp).strftime('%Y-%m-%d')
+            try:
+                self.get_archive(day).append(jpeg, timestamp)
+            except OSError as e:
+                logging.error(f"Failed to append time-lapse frame: {str(e)}")
+                continue
+            if day != current_day:
+                current_day = day
+                self.prune()
+
+    def archive_path(self, day):
+        return os.path.join(self.directory, day + ARCHIVE_SUFFIX)
+
+    def get_archive(self, day):
+        if not DAY_PATTERN.match(day):
+            return None
+        with self.archives_lock:
+            archive = self.archives.get(day)
+            if archive is None:
+                archive = TimelapseArchive(self.archive_path(day))
+                self.archives[day] = archive
+            return archive
+
+    def list_days(self):
+        if not os.path.isdir(self.directory):
+            return []
+        days = []
+        for name in sorted(os.listdir(self.directory)):
+            day = name[:-len(ARCHIVE_SUFFIX)]
+            if name.endswith(ARCHIVE_SUFFIX) and DAY_PATTERN.match(day):
+                archive = self.get_archive(day)
+                days.append({'day': day, 'frames': len(archive), 'bytes': archive.end})
+        return days
+
+    def prune(self):
+        cutoff = (datetime.now() - timedelta(days=self.retention_days)).strftime('%Y-%m-%d')
+        for entry in self.list_days():
+            if entry['day'] < cutoff:
+                with self.archives_lock:
+                    self.archives.pop(entry['day'], None)
+                os.remove(self.archive_path(entry['day']))
+                logging.info(f"Removed time-lapse archive for {entry['day']}")
+
+    def playback(self, day, speed, fps):
+        # speed is archive seconds per playback second; each tick seeks straight to the matching frame
+        archive = self.get_archive(day)
+        if archive is None or len(archive) == 0:
+            return
+        tick = 1 / fps
+        position = archive.timestamps[0]
+        shown = -1
+        with open(archive.path, 'rb') as f:
+            while True:
+                index = bisect.bisect_right(archive.timestamps, position) - 1
+                if index != shown:
+                    shown = index
+                    frame = archive.read_frame(f, index)
+                    yield (b'--frame\r\n'
+                           b'Content-Type: image/jpeg\r\n\r\n' + frame + b'\r\n')
+                if shown == len(archive) - 1 and position >= archive.timestamps[-1]:
+                    return
+                position += speed * tick
+                sleep(tick)